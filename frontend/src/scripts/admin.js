@@ -7,6 +7,9 @@ import { API_URL } from "./shared.js"
 let allMatchups = [];
 let currentMode = 'create';
 
+// Matchup picked for editing, edits are sent as a merge patch against it
+let selectedMatchup = null;
+
 // Load matchups when page loads
 $(function() {
   initNavbar(navbarConfig);
@@ -105,10 +108,12 @@ function handleMatchupSelection(e) {
   if (selectedIndex === '') {
     // Clear form
     document.getElementById('matchup-form').reset();
+    selectedMatchup = null;
     return;
   }
   
   const matchup = allMatchups[selectedIndex];
+  selectedMatchup = matchup;
   
   // Populate form with matchup data
   document.getElementById('sport-select').value = matchup.sport;
@@ -126,6 +131,25 @@ function handleMatchupSelection(e) {
   document.getElementById('overall_discussion').value = matchup.overall_discussion;
 }
 
+// Optional fields that are removed from the matchup when cleared in the form
+const OPTIONAL_FIELDS = ['winner_rank', 'loser_rank'];
+
+// Function to build a JSON Merge Patch from the original matchup to the form values
+function buildMergePatch(original, edited) {
+  const patch = { id: original.id };
+  for (const [key, value] of Object.entries(edited)) {
+    if (value !== original[key]) {
+      patch[key] = value;
+    }
+  }
+  OPTIONAL_FIELDS.forEach(key => {
+    if (!(key in edited) && original[key]) {
+      patch[key] = null;
+    }
+  });
+  return patch;
+}
+
 // Function to handle matchup form submission
 async function handleMatchupSubmission(e) {
   e.preventDefault();
@@ -161,8 +185,9 @@ async function handleMatchupSubmission(e) {
     // Add sport field from dropdown
     matchupData['sport'] = document.getElementById('sport-select').value;
     
-    // Determine HTTP method based on mode
+    // Determine HTTP method based on mode, edits only send the id and what changed
     const method = currentMode === 'edit' ? 'PATCH' : 'POST';
+    const body = currentMode === 'edit' && selectedMatchup ? buildMergePatch(selectedMatchup, matchupData) : matchupData;
     
     // Get valid access token
     const accessToken = await getValidAccessToken();
@@ -171,10 +196,10 @@ async function handleMatchupSubmission(e) {
     const response = await fetch(API_URL.matchups, {
       method: method,
       headers: {
-        'Content-Type': 'application/json',
+        'Content-Type': method === 'PATCH' ? 'application/merge-patch+json' : 'application/json',
         'authorization': accessToken
       },
-      body: JSON.stringify(matchupData)
+      body: JSON.stringify(body)
     });
     
     if (response.ok) {
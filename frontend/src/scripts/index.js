@@ -7,17 +7,28 @@ import { API_URL } from "./shared.js"
 $(function() {
   initNavbar(navbarConfig);
 
-  // Load initial data (football by default)
-  loadMatchups('football');
-  updateSportText('football');
+  // Load initial data (football by default, or the sport of a linked matchup)
+  showLinkedMatchup().then(sport => {
+    updateSportText(sport);
+    loadMatchups(sport);
+  });
   
   // Add event listeners for sport toggle
   $('#basketball, #football').on('change', function() {
     const selectedSport = getCurrentSport();
-    displayMatchupsBySport(selectedSport);
     updateSportText(selectedSport);
+    if (matchupsBySport[selectedSport]) {
+      displayMatchupsBySport(selectedSport);
+    } else {
+      loadMatchups(selectedSport);
+    }
   });
   
+  // Add event listener for loading a sealed season
+  $(document).on('click', '#earlier-seasons button[data-season]', function() {
+    loadSeason(getCurrentSport(), this.getAttribute('data-season'));
+  });
+
   // Add event listener for card clicks (using event delegation)
   $(document).on('click', '.card[data-matchup]', function() {
     const matchupDataString = this.getAttribute('data-matchup');
@@ -35,7 +46,7 @@ function createMatchupCard(matchup) {
   const loserRank = matchup.loser_rank ? `#${matchup.loser_rank}` : '';
   const year = matchup.date.split('-')[0];
   const matchupDisplay = `${winnerRank} ${matchup.winner} over ${loserRank} ${matchup.loser}`;
-  const commentCount = matchup.comments ? matchup.comments.length : 0;
+  const commentCount = getCommentCount(matchup);
   
   // Only show comment text if there are comments
   const commentText = commentCount > 0 ? `
@@ -136,39 +147,210 @@ function updateSportText(sport) {
   }
 }
 
-// Global variable to store all matchups
-let allMatchups = [];
+// Matchups loaded so far, keyed by sport
+const matchupsBySport = {};
+
+// Change log version each sport's matchups were loaded at, for delta syncs
+const versionBySport = {};
+
+// Sealed seasons listed with each sport's matchups ({sport, season, total_matchups}), and
+// the ones loaded so far
+const archivedBySport = {};
+const loadedSeasonsBySport = {};
+
+// Number of matchups requested per page
+const PAGE_SIZE = 24;
+
+// Pointer to the static snapshot of each sport's matchups, published by the writers and
+// served by CloudFront
+const SNAPSHOT_POINTER_URL = '/data/matchups/current.json';
+
+// Pointer fetched once per page load, {} if there is none
+let snapshotPointer = null;
+
+function getSnapshotPointer() {
+  if (!snapshotPointer) {
+    snapshotPointer = fetch(SNAPSHOT_POINTER_URL)
+      .then(response => response.ok ? response.json() : {})
+      .catch(() => ({}));
+  }
+  return snapshotPointer;
+}
 
-// Function to fetch all matchups from API
-async function fetchAllMatchups() {
+// Function to load all matchups for a sport from its static snapshot, false if there is none
+async function fetchSnapshotBySport(sport) {
   try {
-    const response = await fetch(API_URL.matchups);
+    const pointer = await getSnapshotPointer();
+    const entry = (pointer.views || {})[sport];
+    if (!entry) {
+      return false;
+    }
+    const response = await fetch('/' + encodeURI(entry.key));
     if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
+      return false;
     }
     const data = await response.json();
-    allMatchups = data.matchups || [];
+    matchupsBySport[sport] = data.matchups || [];
+    versionBySport[sport] = data.version;
+    archivedBySport[sport] = data.archived_seasons || [];
+    if (getCurrentSport() === sport) {
+      displayMatchupsBySport(sport);
+    }
+    return true;
+  } catch (error) {
+    console.error('Error fetching matchup snapshot:', error);
+    return false;
+  }
+}
+
+// Function to fetch one page of matchups for a sport from API
+async function fetchMatchupsPage(sport, cursor = null) {
+  const params = new URLSearchParams({ sport: sport, limit: PAGE_SIZE });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  const response = await fetch(`${API_URL.matchups}?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+}
+
+// Function to fetch all matchups for a sport, showing each page as soon as it arrives
+async function fetchMatchupsBySport(sport) {
+  try {
+    const matchups = [];
+    let cursor = null;
+    do {
+      const data = await fetchMatchupsPage(sport, cursor);
+      const firstPage = matchups.length === 0;
+      matchups.push(...(data.matchups || []));
+      matchupsBySport[sport] = matchups;
+      if (firstPage) {
+        // Later pages may be newer, so the first page's version is the safe one to sync from
+        versionBySport[sport] = data.version;
+        archivedBySport[sport] = data.archived_seasons || [];
+      }
+
+      if (getCurrentSport() === sport) {
+        if (firstPage) {
+          displayMatchupsBySport(sport);
+        } else {
+          appendMatchupCards(data.matchups || []);
+        }
+      }
+      cursor = data.next_cursor;
+    } while (cursor);
   } catch (error) {
     console.error('Error fetching matchups:', error);
     throw error;
   }
 }
 
-// Function to filter and display matchups by sport
+// Function to bring a loaded sport up to date with only the matchups changed since it was loaded
+async function syncMatchupsBySport(sport) {
+  if (versionBySport[sport] === undefined) {
+    return fetchMatchupsBySport(sport);
+  }
+
+  const params = new URLSearchParams({ sport: sport, since: versionBySport[sport] });
+  const response = await fetch(`${API_URL.matchups}?${params}`);
+  if (response.status === 410) {
+    // Too far behind the change log, reload everything
+    return fetchMatchupsBySport(sport);
+  }
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const data = await response.json();
+
+  const replaced = new Set([...(data.deleted || []), ...data.matchups.map(matchup => matchup.id)]);
+  const matchups = (matchupsBySport[sport] || []).filter(matchup => !replaced.has(matchup.id));
+  matchups.push(...data.matchups);
+  sortMatchups(matchups);
+
+  matchupsBySport[sport] = matchups;
+  versionBySport[sport] = data.version;
+  if (getCurrentSport() === sport && replaced.size > 0) {
+    displayMatchupsBySport(sport);
+  }
+}
+
+// Same order as the API: most recent first, ties by id
+function sortMatchups(matchups) {
+  matchups.sort((a, b) => (b.date || '').localeCompare(a.date || '') || (b.id || '').localeCompare(a.id || ''));
+}
+
+// Function to add a sealed season of a sport to its loaded matchups
+async function loadSeason(sport, season) {
+  try {
+    const params = new URLSearchParams({ sport: sport, season: season });
+    const response = await fetch(`${API_URL.matchups}?${params}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const data = await response.json();
+
+    const loaded = new Set((data.matchups || []).map(matchup => matchup.id));
+    const matchups = (matchupsBySport[sport] || []).filter(matchup => !loaded.has(matchup.id));
+    matchups.push(...(data.matchups || []));
+    sortMatchups(matchups);
+    matchupsBySport[sport] = matchups;
+
+    loadedSeasonsBySport[sport] = loadedSeasonsBySport[sport] || new Set();
+    loadedSeasonsBySport[sport].add(season);
+    if (getCurrentSport() === sport) {
+      displayMatchupsBySport(sport);
+    }
+  } catch (error) {
+    console.error('Error loading season:', error);
+  }
+}
+
+// Function to show a button for each sealed season of a sport not loaded yet
+function displayEarlierSeasons(sport) {
+  const container = document.getElementById('earlier-seasons');
+  const loaded = loadedSeasonsBySport[sport] || new Set();
+  const seasons = (archivedBySport[sport] || []).filter(entry => !loaded.has(entry.season));
+  container.innerHTML = seasons.map(entry => `
+    <button type="button" class="btn btn-outline-secondary btn-sm m-1" data-season="${escapeHtml(entry.season)}">
+      ${escapeHtml(entry.season)}-${String(Number(entry.season) + 1).slice(-2)} season (${entry.total_matchups})
+    </button>
+  `).join('');
+}
+
+// Function to fetch a single matchup by ID from API
+async function fetchMatchupById(matchupId) {
+  const params = new URLSearchParams({ id: matchupId });
+  const response = await fetch(`${API_URL.matchups}?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const data = await response.json();
+  return data.matchups && data.matchups.length > 0 ? data.matchups[0] : null;
+}
+
+// Function to add cards to the end of the container
+function appendMatchupCards(matchups) {
+  const container = document.getElementById('matchup-cards');
+  matchups.forEach(matchup => {
+    container.insertAdjacentHTML('beforeend', createMatchupCard(matchup));
+  });
+}
+
+// Function to display the loaded matchups for a sport
 function displayMatchupsBySport(sport = 'football') {
   const container = document.getElementById('matchup-cards');
   
-  // Filter matchups by sport
-  const filteredMatchups = allMatchups.filter(matchup => matchup.sport === sport);
+  // Matchups are already filtered and sorted by the API
+  const filteredMatchups = matchupsBySport[sport] || [];
   
-  if (filteredMatchups && filteredMatchups.length > 0) {
+  if (filteredMatchups.length > 0) {
     // Clear container
     container.innerHTML = '';
     
     // Create cards for each matchup
-    filteredMatchups.forEach(matchup => {
-      container.insertAdjacentHTML('beforeend', createMatchupCard(matchup));
-    });
+    appendMatchupCards(filteredMatchups);
   } else {
     // Show no data message
     container.innerHTML = `
@@ -180,6 +362,7 @@ function displayMatchupsBySport(sport = 'football') {
       </div>
     `;
   }
+  displayEarlierSeasons(sport);
 }
 
 // Function to get query parameter from URL
@@ -188,33 +371,42 @@ function getQueryParameter(name) {
   return urlParams.get(name);
 }
 
-// Function to load matchup data (now just filters and displays)
-async function loadMatchups(sport = 'football') {
+// Function to open the matchup named in the query parameters, returns the sport to show
+async function showLinkedMatchup() {
+  const matchupId = getQueryParameter('matchup');
+  if (!matchupId) {
+    return 'football';
+  }
+  
   try {
-    // If we don't have matchups yet, fetch them first
-    if (allMatchups.length === 0) {
-      await fetchAllMatchups();
+    const matchup = await fetchMatchupById(matchupId);
+    if (!matchup) {
+      return 'football';
     }
     
-    // Display filtered matchups
-    displayMatchupsBySport(sport);
-    
-    // Check if there's a matchup ID in the query parameters
-    const matchupId = getQueryParameter('matchup');
-    if (matchupId) {
-      // Find the matchup with the specified ID
-      const matchup = allMatchups.find(m => m.id === matchupId);
-      if (matchup) {
-        // Set the sport toggle to match the matchup's sport
-        const sportRadio = document.getElementById(matchup.sport);
-        if (sportRadio) {
-          sportRadio.checked = true;
-          displayMatchupsBySport(matchup.sport);
-          updateSportText(matchup.sport);
-        }
-        // Open the modal for this matchup
-        showMatchupModal(matchup);
-      }
+    // Set the sport toggle to match the matchup's sport
+    const sportRadio = document.getElementById(matchup.sport);
+    if (sportRadio) {
+      sportRadio.checked = true;
+    }
+    // Open the modal for this matchup
+    showMatchupModal(matchup);
+    return sportRadio ? matchup.sport : 'football';
+  } catch (error) {
+    console.error('Error loading linked matchup:', error);
+    return 'football';
+  }
+}
+
+// Function to load matchup data for a sport and display it
+async function loadMatchups(sport = 'football') {
+  try {
+    // The API pages through the sport if the snapshot is missing or unreachable
+    if (!(await fetchSnapshotBySport(sport))) {
+      await fetchMatchupsBySport(sport);
+    } else {
+      // Comments do not republish the snapshot, their counts come with the changes since it
+      await syncMatchupsBySport(sport);
     }
     
   } catch (error) {
@@ -274,10 +466,9 @@ function showMatchupModal(matchup) {
   document.getElementById('accordion-impact-score').textContent = formatScore(matchup.impact_score);
   document.getElementById('accordion-excitement-score').textContent = formatScore(matchup.excitement_score);
   
-  // Populate comments section
-  const commentCount = matchup.comments ? matchup.comments.length : 0;
-  document.getElementById('accordion-comments-count').textContent = commentCount;
-  populateComments(matchup.comments || []);
+  // Populate comments section, the comments themselves are fetched separately
+  document.getElementById('accordion-comments-count').textContent = getCommentCount(matchup);
+  loadComments(matchup.id);
   
   // Show/hide add comment button and sign-in message based on login status
   const addCommentSection = document.getElementById('add-comment-section');
@@ -298,8 +489,59 @@ function showMatchupModal(matchup) {
   modal.show();
 }
 
+// Comment count for a card or the modal (records from before comment streams nest them)
+function getCommentCount(matchup) {
+  if (matchup.comment_count !== undefined) {
+    return matchup.comment_count;
+  }
+  return matchup.comments ? matchup.comments.length : 0;
+}
+
+// Number of comments requested per page
+const COMMENT_PAGE_SIZE = 20;
+
+// Comments loaded so far for the open matchup, and the cursor for the next page
+let loadedComments = [];
+let commentsCursor = null;
+
+// Function to fetch one page of comments for a matchup from API, newest first
+async function fetchCommentsPage(matchupId, cursor = null) {
+  const params = new URLSearchParams({ matchup_id: matchupId, limit: COMMENT_PAGE_SIZE });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  const response = await fetch(`${API_URL.comment}?${params}`);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+}
+
+// Function to load the first page of comments (or the next one when more is true)
+async function loadComments(matchupId, more = false) {
+  if (!more) {
+    loadedComments = [];
+    commentsCursor = null;
+    document.getElementById('comments-list').innerHTML = '<p class="text-muted text-center">Loading comments...</p>';
+  }
+  
+  try {
+    const data = await fetchCommentsPage(matchupId, commentsCursor);
+    // Ignore the response if another matchup was opened meanwhile
+    if (!currentMatchup || currentMatchup.id !== matchupId) {
+      return;
+    }
+    loadedComments.push(...(data.comments || []));
+    commentsCursor = data.next_cursor;
+    populateComments(loadedComments, commentsCursor !== null);
+  } catch (error) {
+    console.error('Error loading comments:', error);
+    document.getElementById('comments-list').innerHTML = '<p class="text-muted text-center">Unable to load comments.</p>';
+  }
+}
+
 // Function to populate comments
-function populateComments(comments) {
+function populateComments(comments, hasMore = false) {
   const commentsList = document.getElementById('comments-list');
   
   if (comments.length === 0) {
@@ -312,6 +554,12 @@ function populateComments(comments) {
     return new Date(b.created_at) - new Date(a.created_at);
   });
   
+  const loadMoreButton = hasMore ? `
+    <div class="text-center">
+      <button type="button" class="btn btn-link btn-sm" id="load-more-comments-btn">Load more comments</button>
+    </div>
+  ` : '';
+  
   commentsList.innerHTML = sortedComments.map(comment => {
     const date = new Date(comment.created_at);
     const formattedDate = date.toLocaleDateString('en-US', { 
@@ -333,7 +581,7 @@ function populateComments(comments) {
         </div>
       </div>
     `;
-  }).join('');
+  }).join('') + loadMoreButton;
 }
 
 // Helper function to escape HTML
@@ -362,6 +610,12 @@ $(document).on('click', '#sign-in-link', function(e) {
   document.getElementById('signin-button').click();
 });
 
+// Event listener for Load more comments button
+$(document).on('click', '#load-more-comments-btn', function() {
+  this.disabled = true;
+  loadComments(currentMatchup.id, true);
+});
+
 // Event listener for Add Comment button
 $(document).on('click', '#add-comment-btn', function() {
   if (!isAuthenticated()) {
@@ -469,26 +723,27 @@ $(document).on('click', '#submit-comment-btn', async function() {
       })
     });
     
-    if (response.ok) {
+    if (response.status === 202) {
+      // Queued behind a burst of other writes, it shows up once applied
+      resetCommentForm();
+      alert('Your comment was received and will appear shortly');
+      
+    } else if (response.ok) {
       const result = await response.json();
       
-      // Add comment to current matchup
-      if (!currentMatchup.comments) {
-        currentMatchup.comments = [];
-      }
-      currentMatchup.comments.push(result.comment);
+      // Add comment to the loaded page and the current matchup's count
+      loadedComments.unshift(result.comment);
+      currentMatchup.comment_count = result.comment_count;
       
       // Update UI
-      populateComments(currentMatchup.comments);
-      const commentCount = currentMatchup.comments.length;
-      document.getElementById('accordion-comments-count').textContent = commentCount;
+      populateComments(loadedComments, commentsCursor !== null);
+      document.getElementById('accordion-comments-count').textContent = result.comment_count;
       
       // Reset form
       resetCommentForm();
       
-      // Reload matchups to get updated data
-      await fetchAllMatchups();
-      displayMatchupsBySport(getCurrentSport());
+      // Fetch only the matchups that changed, rather than reloading the sport
+      await syncMatchupsBySport(getCurrentSport());
       
     } else if (response.status === 403) {
       throw new Error('You must be logged in to comment');
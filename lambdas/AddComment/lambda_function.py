@@ -2,14 +2,20 @@
 ### Add comment to a matchup
 ###
 
-import json 
-import boto3
 import uuid
 from datetime import datetime
 from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon import runtime, metrics, writes, idempotency
 
 bucket_name = SUB_PrivateBucketName
 
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+METHODS = 'POST, OPTIONS'
+
+@metrics.instrument('AddComment')
 def lambda_handler(event, context):
     """
     POST request to add a comment to a matchup
@@ -18,10 +24,7 @@ def lambda_handler(event, context):
     """
     try:
         # Parse request body
-        if isinstance(event.get('body'), str):
-            comment_data = json.loads(event['body'])
-        else:
-            comment_data = event.get('body', {})
+        comment_data = runtime.parse_body(event)
         
         # Get user info from request context (set by authorizer)
         # user_id = event.get('requestContext', {}).get('authorizer', {}).get('userId', 'anonymous')
@@ -34,37 +37,14 @@ def lambda_handler(event, context):
         
         # Validate required fields
         if 'matchup_id' not in comment_data or 'comment_text' not in comment_data:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                },
-                'body': json.dumps({
-                    'error': 'Missing required fields',
-                    'message': 'matchup_id and comment_text are required'
-                })
-            }
+            return runtime.error_response(400, 'Missing required fields',
+                                          'matchup_id and comment_text are required', METHODS)
         
         matchup_id = comment_data['matchup_id']
         comment_text = comment_data['comment_text'].strip()
         
         if not comment_text:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                },
-                'body': json.dumps({
-                    'error': 'Invalid comment',
-                    'message': 'Comment text cannot be empty'
-                })
-            }
+            return runtime.error_response(400, 'Invalid comment', 'Comment text cannot be empty', METHODS)
         
         # Create comment object
         comment = {
@@ -75,85 +55,19 @@ def lambda_handler(event, context):
             'matchup_id': matchup_id
         }
         
-        # Get existing matchups from S3
-        s3_client = boto3.client('s3')
-        response = s3_client.get_object(Bucket=bucket_name, Key='matchups.json')
-        matchups_data = json.loads(response['Body'].read().decode('utf-8'))
-        
-        # Find the matchup and add comment
-        matchup_found = False
-        for matchup in matchups_data['matchups']:
-            if matchup['id'] == matchup_id:
-                if 'comments' not in matchup:
-                    matchup['comments'] = []
-                matchup['comments'].append(comment)
-                matchup_found = True
-                break
+        # Queue it for the single writer, which appends it to the matchup's comment stream,
+        # updates comment_count and indexes it for GET /search (see writes.py)
+        # A retry carrying the same Idempotency-Key gets the first response back
+        status_code, body, extra_headers = idempotency.submit(store, event, writes.ADD_COMMENT, comment)
         
-        if not matchup_found:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                },
-                'body': json.dumps({
-                    'error': 'Matchup not found',
-                    'message': f'No matchup found with id {matchup_id}'
-                })
-            }
+        return runtime.response(status_code, body, METHODS, extra_headers)
         
-        # Update last_updated timestamp
-        matchups_data['last_updated'] = datetime.utcnow().isoformat()
-        
-        # Write back to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key='matchups.json',
-            Body=json.dumps(matchups_data, indent=2),
-            ContentType='application/json'
-        )
-        
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': json.dumps({
-                'message': 'Comment added successfully',
-                'comment': comment
-            })
-        }
+    except idempotency.InvalidKey as e:
+        return runtime.error_response(400, 'Invalid idempotency key', str(e), METHODS)
         
     except ClientError as e:
         print(f"S3 ClientError: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'S3 Error',
-                'message': str(e)
-            })
-        }
+        return runtime.error_response(500, 'S3 Error', str(e))
     except Exception as e:
         print(f"Unexpected Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
-
+        return runtime.error_response(500, 'Internal server error', str(e))
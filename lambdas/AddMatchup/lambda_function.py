@@ -1,16 +1,21 @@
 ##############
 ### Add new matchup to S3
 
-import json 
-import boto3
-import uuid
 import traceback
-from datetime import datetime
 from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon import runtime, metrics, writes, idempotency
+from stormcommon import matchups as matchup_rules
 
 bucket_name = SUB_PrivateBucketName
 
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
 
+METHODS = 'POST, OPTIONS'
+
+
+@metrics.instrument('AddMatchup')
 def lambda_handler(event, context):
     """
     POST request to add a new matchup to S3
@@ -18,135 +23,46 @@ def lambda_handler(event, context):
     Expects JSON payload with matchup data
     Returns success/error response
     """
-    print(event)
     try:
         # Parse the request body
-        if isinstance(event.get('body'), str):
-            matchup_data = json.loads(event['body'])
-        else:
-            matchup_data = event.get('body', {})
+        matchup_data = runtime.parse_body(event)
         
         # Validate required fields
-        required_fields = ['winner', 'loser', 'date', 'upset_score', 'impact_score', 'excitement_score', 
-                          'upset_rationale', 'impact_rationale', 'excitement_rationale', 'overall_discussion']
-        print("a")
-        for field in required_fields:
-            if field not in matchup_data or matchup_data[field] == '':
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                    },
-                    'body': json.dumps({
-                        'error': 'Missing required field',
-                        'message': f'Field "{field}" is required'
-                    })
-                }
-        print("b")
-        # Add metadata
-        matchup_data['id'] = str(uuid.uuid4())
-        matchup_data['created_at'] = datetime.utcnow().isoformat()
+        field = matchup_rules.missing_field(matchup_data)
+        if field:
+            return runtime.error_response(400, 'Missing required field',
+                                          f'Field "{field}" is required', METHODS)
+        field = matchup_rules.invalid_score(matchup_data)
+        if field:
+            return runtime.error_response(400, 'Invalid field', f'Field "{field}" must be a number', METHODS)
         
-        # Ensure optional fields have default values
-        matchup_data['winner_rank'] = matchup_data.get('winner_rank', '')
-        matchup_data['loser_rank'] = matchup_data.get('loser_rank', '')
+        # Add id, created_at and default ranks
+        matchup_rules.new_matchup(matchup_data)
         
-        # Get existing matchups
-        s3_client = boto3.client('s3')
-        print("c")
-        try:
-            # Try to get existing matchups file
-            response = s3_client.get_object(Bucket=bucket_name, Key='matchups.json')
-            matchups = json.loads(response['Body'].read().decode('utf-8'))["matchups"]
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                # File doesn't exist, start with empty list
-                matchups = []
-            else:
-                raise e
-
-        print("d")
-        # Add new matchup to the list
-        matchups.append(matchup_data)
-        print("e")
-        # Prepare the updated data structure
-        updated_data = {
-            'matchups': matchups,
-            'last_updated': datetime.utcnow().isoformat(),
-            'total_matchups': len(matchups)
-        }
-        print(updated_data)
+        # Queue it for the single writer, which stores it with the read model, stats
+        # and search index (see writes.py)
+        # A retry carrying the same Idempotency-Key gets the first response back
+        status_code, body, extra_headers = idempotency.submit(store, event, writes.ADD_MATCHUP, matchup_data)
         
-        # Write back to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key='matchups.json',
-            Body=json.dumps(updated_data, indent=2),
-            ContentType='application/json'
-        )
+        return runtime.response(status_code, body, METHODS, extra_headers)
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': json.dumps({
-                'message': 'Matchup added successfully',
-                'matchup_id': matchup_data['id'],
-                'total_matchups': len(matchups)
-            })
-        }
+    except idempotency.InvalidKey as e:
+        return runtime.error_response(400, 'Invalid idempotency key', str(e), METHODS)
         
-    except json.JSONDecodeError as e:
+    except runtime.JSONDecodeError as e:
         error_details = traceback.format_exc()
-        print(f"JSON Decode Error: {str(e)}")
+        print(f"JSON Decode Error: {str(e)} in body {metrics.truncate(event.get('body'))}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Invalid JSON',
-                'message': 'Request body must be valid JSON',
-            })
-        }
+        return runtime.error_response(400, 'Invalid JSON', 'Request body must be valid JSON')
         
     except ClientError as e:
         error_details = traceback.format_exc()
         print(f"S3 ClientError: {str(e)}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'S3 Error',
-                'message': f'Failed to save matchup: {str(e)}',
-            })
-        }
+        return runtime.error_response(500, 'S3 Error', f'Failed to save matchup: {str(e)}')
         
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"Unexpected Error: {str(e)}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e),
-            })
-        }
\ No newline at end of file
+        return runtime.error_response(500, 'Internal server error', str(e))
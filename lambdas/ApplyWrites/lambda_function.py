@@ -0,0 +1,33 @@
+##############
+### Apply queued writes in batches (the single consumer of the write queue)
+
+from stormcommon.storage import MatchupStore
+from stormcommon import runtime, metrics, writes
+
+bucket_name = SUB_PrivateBucketName
+
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+
+@metrics.instrument('ApplyWrites')
+def lambda_handler(event, context):
+    """
+    SQS FIFO event with a batch of writes from AddMatchup, EditMatchup and AddComment
+
+    Applies them in order with one manifest read and write (see writes.py) and stores
+    each write's outcome for the lambda waiting on it as soon as the matchups are
+    committed, then updates the stats and search index. Any error is raised, so the
+    whole batch is redelivered; writes are idempotent by their ids.
+    """
+    batch = [runtime.loads(record['body']) for record in event.get('Records', [])]
+
+    outcomes = writes.apply_writes(store, batch, on_commit=lambda done: writes.put_outcomes(store, done, batch),
+                                   recoverable=True)
+
+    statuses = {}
+    for status_code, _ in outcomes.values():
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+    print(f"Applied {len(batch)} writes: {statuses}")
+
+    return {'statusCode': 200, 'applied': len(batch)}
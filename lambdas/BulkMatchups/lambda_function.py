@@ -0,0 +1,73 @@
+##############
+### Bulk add/edit matchups from a JSONL or CSV batch
+
+import base64
+import traceback
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore, ConditionFailed
+from stormcommon.http import get_header
+from stormcommon import bulk, runtime, metrics
+
+bucket_name = SUB_PrivateBucketName
+
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+METHODS = 'POST, OPTIONS'
+
+
+@metrics.instrument('BulkMatchups')
+def lambda_handler(event, context):
+    """
+    POST request with a batch of new or edited matchups, one per JSONL line or CSV row
+
+    Optional query parameters:
+      format   jsonl or csv, defaults from Content-Type (text/csv), otherwise jsonl
+      partial  true to apply the valid rows even if others fail
+      dry_run  true to validate without writing
+
+    Returns 200 with per-row results when the batch was applied (or validated, for a dry
+    run), 400 with the same results when it was rejected
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+        content_type = (get_header(event, 'content-type') or '').lower()
+        fmt = params.get('format') or ('csv' if 'text/csv' in content_type else 'jsonl')
+        partial = params.get('partial', '').lower() == 'true'
+        dry_run = params.get('dry_run', '').lower() == 'true'
+
+        body = event.get('body') or ''
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+
+        rows = bulk.parse_batch(body, fmt)
+        if not rows:
+            return runtime.error_response(400, 'Empty batch', 'The batch has no rows', METHODS)
+
+        summary = bulk.apply_batch(store, rows, partial=partial, dry_run=dry_run)
+        print(f"Bulk batch: {summary['rows']} rows, {summary['added']} added, "
+              f"{summary['updated']} updated, {summary['errors']} errors, applied {summary['applied']}")
+
+        ok = summary['applied'] or (dry_run and summary['errors'] == 0)
+        return runtime.response(200 if ok else 400, summary, METHODS)
+
+    except bulk.BatchError as e:
+        return runtime.error_response(400, 'Invalid batch', str(e), METHODS)
+
+    except ConditionFailed:
+        return runtime.error_response(503, 'Busy', 'Too many concurrent writes, try again', METHODS)
+
+    except UnicodeDecodeError:
+        return runtime.error_response(400, 'Invalid batch', 'Batch must be UTF-8 text', METHODS)
+
+    except ClientError as e:
+        error_details = traceback.format_exc()
+        print(f"S3 ClientError: {str(e)}")
+        print(f"Full traceback: {error_details}")
+        return runtime.error_response(500, 'S3 Error', f'Failed to apply batch: {str(e)}')
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        print(f"Unexpected Error: {str(e)}")
+        print(f"Full traceback: {error_details}")
+        return runtime.error_response(500, 'Internal server error', str(e))
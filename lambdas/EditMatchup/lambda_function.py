@@ -1,188 +1,67 @@
 ##############
 ### Edit existing matchup in S3
 
-import json 
-import boto3
 import traceback
-from datetime import datetime
 from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon import runtime, metrics, writes
+from stormcommon import matchups as matchup_rules
 
 bucket_name = SUB_PrivateBucketName
 
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
 
+METHODS = 'PATCH, OPTIONS'
+
+
+@metrics.instrument('EditMatchup')
 def lambda_handler(event, context):
     """
     PATCH request to edit an existing matchup in S3
     
-    Expects JSON payload with matchup data including id or identifying fields
+    Expects a JSON Merge Patch (RFC 7386) body: "id" (or ?id=) names the matchup and the
+    other members are the changes, with null removing a field. Without an id, the
+    winner/loser/date in the body identify the matchup as before.
     Returns success/error response
     """
-    print(event)
     try:
         # Parse the request body
-        if isinstance(event.get('body'), str):
-            matchup_data = json.loads(event['body'])
-        else:
-            matchup_data = event.get('body', {})
-        
-        # Validate we have enough identifying information
-        # We'll match based on winner, loser, and date since these uniquely identify a matchup
-        required_fields = ['winner', 'loser', 'date']
-        for field in required_fields:
-            if field not in matchup_data:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': 'PATCH, OPTIONS',
-                        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                    },
-                    'body': json.dumps({
-                        'error': 'Missing required field',
-                        'message': f'Field "{field}" is required to identify the matchup'
-                    })
-                }
-        
-        # Get existing matchups
-        s3_client = boto3.client('s3')
-        
-        try:
-            # Get existing matchups file
-            response = s3_client.get_object(Bucket=bucket_name, Key='matchups.json')
-            data = json.loads(response['Body'].read().decode('utf-8'))
-            matchups = data["matchups"]
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'Not found',
-                        'message': 'No matchups file exists'
-                    })
-                }
-            else:
-                raise e
-        
-        # Find the matchup to update
-        matchup_index = None
-        for i, matchup in enumerate(matchups):
-            if (matchup['winner'] == matchup_data['winner'] and 
-                matchup['loser'] == matchup_data['loser'] and 
-                matchup['date'] == matchup_data['date']):
-                matchup_index = i
-                break
+        matchup_data = runtime.parse_body(event)
+        if not isinstance(matchup_data, dict):
+            return runtime.error_response(400, 'Invalid patch', 'Request body must be a JSON object', METHODS)
         
-        if matchup_index is None:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Not found',
-                    'message': 'Matchup not found with the given winner, loser, and date'
-                })
-            }
+        params = event.get('queryStringParameters') or {}
+        if not matchup_data.get('id') and params.get('id'):
+            matchup_data['id'] = params['id']
         
-        # Preserve the original id and created_at if they exist
-        original_id = matchups[matchup_index].get('id')
-        original_created_at = matchups[matchup_index].get('created_at')
+        if not matchup_data.get('id'):
+            # No id: we'll match based on winner, loser, and date since these uniquely identify a matchup
+            field = matchup_rules.missing_key_field(matchup_data)
+            if field:
+                return runtime.error_response(400, 'Missing required field',
+                                              f'Field "id" or "{field}" is required to identify the matchup', METHODS)
         
-        # Update the matchup with new data
-        updated_matchup = {**matchups[matchup_index], **matchup_data}
+        # Queue the patch for the single writer, which finds the matchup, checks the result
+        # (404, 400, 409 on a winner/loser/date collision) and stores it (see writes.py)
+        status_code, body = writes.submit(store, writes.EDIT_MATCHUP, matchup_data)
         
-        # Preserve original metadata
-        if original_id:
-            updated_matchup['id'] = original_id
-        if original_created_at:
-            updated_matchup['created_at'] = original_created_at
+        return runtime.response(status_code, body, METHODS)
         
-        # Add updated_at timestamp
-        updated_matchup['updated_at'] = datetime.utcnow().isoformat()
-        
-        # Replace the matchup in the list
-        matchups[matchup_index] = updated_matchup
-        
-        # Prepare the updated data structure
-        updated_data = {
-            'matchups': matchups,
-            'last_updated': datetime.utcnow().isoformat(),
-            'total_matchups': len(matchups)
-        }
-        
-        # Write back to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key='matchups.json',
-            Body=json.dumps(updated_data, indent=2),
-            ContentType='application/json'
-        )
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'PATCH, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': json.dumps({
-                'message': 'Matchup updated successfully',
-                'matchup': updated_matchup
-            })
-        }
-        
-    except json.JSONDecodeError as e:
+    except runtime.JSONDecodeError as e:
         error_details = traceback.format_exc()
-        print(f"JSON Decode Error: {str(e)}")
+        print(f"JSON Decode Error: {str(e)} in body {metrics.truncate(event.get('body'))}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Invalid JSON',
-                'message': 'Request body must be valid JSON',
-            })
-        }
+        return runtime.error_response(400, 'Invalid JSON', 'Request body must be valid JSON')
         
     except ClientError as e:
         error_details = traceback.format_exc()
         print(f"S3 ClientError: {str(e)}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'S3 Error',
-                'message': f'Failed to update matchup: {str(e)}',
-            })
-        }
+        return runtime.error_response(500, 'S3 Error', f'Failed to update matchup: {str(e)}')
         
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"Unexpected Error: {str(e)}")
         print(f"Full traceback: {error_details}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e),
-            })
-        }
-
+        return runtime.error_response(500, 'Internal server error', str(e))
@@ -0,0 +1,58 @@
+##############
+### Return comments for one matchup, newest first
+
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon import comments, runtime, metrics
+
+bucket_name = SUB_PrivateBucketName
+
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+METHODS = 'GET, OPTIONS'
+
+
+@metrics.instrument('GetComments')
+def lambda_handler(event, context):
+    """
+    GET request for a page of comments on a matchup
+
+    Query parameters:
+      matchup_id  required
+      limit       page size (default 20, max 100)
+      cursor      next_cursor from the previous page
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+        matchup_id = params.get('matchup_id')
+        cursor = params.get('cursor') or None
+
+        if not matchup_id or '/' in matchup_id:
+            return runtime.error_response(400, 'Invalid query', 'matchup_id is required', METHODS)
+
+        limit = comments.DEFAULT_LIMIT
+        if params.get('limit'):
+            try:
+                limit = int(params['limit'])
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= comments.MAX_LIMIT:
+                return runtime.error_response(400, 'Invalid query',
+                                              f'limit must be an integer from 1 to {comments.MAX_LIMIT}', METHODS)
+
+        page, next_cursor = comments.list_comments(store, matchup_id, limit, cursor)
+
+        return runtime.response(200, {
+            'matchup_id': matchup_id,
+            'comments': page,
+            'next_cursor': next_cursor
+        }, METHODS, {'Cache-Control': 'no-cache'})
+
+    except ValueError as e:
+        # Bad cursor
+        return runtime.error_response(400, 'Invalid query', str(e), METHODS)
+    except ClientError as e:
+        return runtime.error_response(500, 'Failed to retrieve comments', str(e))
+    except Exception as e:
+        return runtime.error_response(500, 'Internal server error', str(e))
@@ -1,81 +1,397 @@
 ##############
-### Return matchups from S3 public bucket
+### Return matchups from S3 private bucket
 
-import json 
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon.cache import WarmCache
+from stormcommon.indexes import query_page, get_lookup, ALL_SPORTS, DEFAULT_SORT
+from stormcommon import archive, readmodel, runtime, metrics, changelog
+from stormcommon.http import Representation, conditional_response, content_etag, http_date
 
 
 bucket_name = SUB_PrivateBucketName
 
+# Module scope so the client and caches survive across warm invocations
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+# Serve the cached manifest without touching S3 for CACHE_TTL_SECONDS, then revalidate
+# with a conditional GET on its ETag
+CACHE_TTL_SECONDS = 5
+manifest_cache = WarmCache(max_entries=1, ttl_seconds=CACHE_TTL_SECONDS)
+
+# Pre-rendered read model views keyed by view name, revalidated like the manifest. Holds
+# every view of a partitioned listing (see readmodel.py) as well as the sport views.
+view_cache = WarmCache(max_entries=32, ttl_seconds=CACHE_TTL_SECONDS)
+
+# Views of a partitioned listing fetched at once (shares the client's connection pool)
+VIEW_WORKERS = 8
+
+# Serialized responses keyed by query, valid while the manifest ETag is unchanged
+page_cache = WarmCache(max_entries=32)
+
+# Change log version each cached view was rendered at, keyed by view name and view ETag
+version_cache = WarmCache(max_entries=32)
+
+# Matchup objects keyed by id, valid while the manifest lists the same object ETag
+matchup_cache = WarmCache(max_entries=512)
+
+# Sealed season archives keyed by object key: immutable, so never revalidated
+archive_cache = WarmCache(max_entries=8)
+
+MAX_LIMIT = 100
+
+@metrics.instrument('GetMatchups')
 def lambda_handler(event, context):
     """
-    GET request to retrieve matchups.json from S3 public bucket
-    
-    Returns the contents of matchups.json file from the public S3 bucket
+    GET request to retrieve matchups from S3 private bucket
+
+    Optional query parameters:
+      sport   only matchups for this sport
+      sort    date (default) or total_score, highest first
+      limit   page size (max 100), all matchups if omitted
+      cursor  next_cursor from the previous page
+      id      a single matchup by id
+      since   version from an earlier response: only the matchups added or changed
+              after it, plus the ids of matchups deleted (or moved out of sport)
+      season  with sport, only that season (its starting year, see readmodel.season)
+
+    Listings hold the open seasons; a sealed season (see archive.py) is listed under
+    archived_seasons and loaded with ?sport=&season=, which returns its archive as-is.
+
+    Unpaginated requests sorted by date are served as-is from the pre-rendered read model
+    the writers publish, or merged from its views when the full listing is partitioned
+    (STORM_READ_PARTITION, see readmodel.py), with the comment_count of any matchup
+    commented on since a view was rendered taken from the manifest. Pages are sliced from the presorted indexes in the manifest, and
+    only the matchup objects on the page are fetched. A since older than the compacted
+    change log gets a 410, and the client reloads everything.
+
+    Responses carry a strong ETag and Last-Modified; If-None-Match gets a 304, and the
+    body is gzip-compressed (base64-encoded) when the client sends Accept-Encoding: gzip
     """
     try:
-        s3_client = boto3.client('s3')
-        response = s3_client.get_object(Bucket=bucket_name, Key='matchups.json')
-        content = response['Body'].read().decode('utf-8')
-        
-        # Parse the JSON content
-        matchups_data = json.loads(content)
-        
-        # Sort matchups by date (most recent first)
-        if 'matchups' in matchups_data and matchups_data['matchups']:
-            matchups_data['matchups'].sort(key=lambda x: x.get('date', ''), reverse=True)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': json.dumps(matchups_data)
-        }
-        
+        params = event.get('queryStringParameters') or {}
+        sport = params.get('sport') or None
+        sort = params.get('sort') or DEFAULT_SORT
+        cursor = params.get('cursor') or None
+        matchup_id = params.get('id') or None
+
+        since = None
+        if params.get('since'):
+            try:
+                since = int(params['since'])
+            except ValueError:
+                return runtime.error_response(400, 'Invalid query', 'since must be a version number')
+            if params.get('limit') or cursor or matchup_id:
+                return runtime.error_response(400, 'Invalid query',
+                                              'since cannot be combined with limit, cursor or id')
+
+        season = params.get('season') or None
+        if season and (not sport or params.get('limit') or cursor or matchup_id or since is not None):
+            return runtime.error_response(400, 'Invalid query',
+                                          'season needs sport and cannot be combined with limit, cursor, id or since')
+
+        limit = None
+        if params.get('limit'):
+            try:
+                limit = int(params['limit'])
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= MAX_LIMIT:
+                return runtime.error_response(400, 'Invalid query',
+                                              f'limit must be an integer from 1 to {MAX_LIMIT}')
+
+        representation = None
+        if season is not None:
+            representation, cache_status = get_archived(sport, season)
+        elif limit is None and cursor is None and matchup_id is None and since is None and sort == DEFAULT_SORT:
+            representation, cache_status = get_listing(sport)
+
+        if representation is None:
+            manifest, manifest_etag, cache_status = get_manifest()
+
+            query_key = (sport, sort, limit, cursor, matchup_id, since, season)
+            representation = page_cache.get_if_current(query_key, manifest_etag)
+            if representation is None:
+                if since is None:
+                    body = build_body(manifest, sport, sort, limit, cursor, matchup_id, season)
+                else:
+                    body = build_delta(manifest, sport, since)
+                representation = Representation(content_etag(body.encode('utf-8')),
+                                                http_date(manifest['last_updated']), body=body)
+                page_cache.put(query_key, manifest_etag, representation)
+            else:
+                cache_status = 'HIT'
+
+        metrics.count(metrics.CACHE_MISSES if cache_status == 'MISS' else metrics.CACHE_HITS)
+        return conditional_response(event, representation,
+                                    runtime.headers('GET, OPTIONS', {'X-Cache': cache_status}))
+
+    except changelog.StaleVersion as e:
+        return runtime.error_response(410, 'Version no longer available', str(e))
+    except ValueError as e:
+        # Bad sort or cursor
+        return runtime.error_response(400, 'Invalid query', str(e))
     except ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == 'NoSuchKey':
-            # File doesn't exist, return empty matchups structure
-            empty_matchups = {"matchups": []}
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-                },
-                'body': json.dumps(empty_matchups)
-            }
-        else:
-            # Other S3 errors
-            return {
-                'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Failed to retrieve matchups',
-                    'message': str(e)
-                })
-            }
+        # Other S3 errors
+        return runtime.error_response(500, 'Failed to retrieve matchups', str(e))
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
-  
+        return runtime.error_response(500, 'Internal server error', str(e))
+
+
+def get_manifest():
+    """
+    Returns (manifest, etag, cache_status), going to S3 only once the cached copy is
+    older than the TTL and then only for a conditional GET
+    """
+    entry = manifest_cache.get('manifest')
+
+    if entry is not None and manifest_cache.is_fresh(entry):
+        manifest_cache.record_hit()
+        return entry.value, entry.etag, 'HIT'
+
+    manifest, etag = store.get_manifest_if_changed(entry.etag if entry else None)
+
+    if manifest is None:
+        manifest_cache.revalidated('manifest')
+        manifest_cache.record_hit()
+        return entry.value, entry.etag, 'REVALIDATED'
+
+    manifest_cache.record_miss()
+    manifest_cache.put('manifest', etag, manifest)
+    return manifest, etag, 'MISS'
+
+
+def get_listing(sport):
+    """
+    Returns (representation, cache_status) for the unpaginated listing of one sport or of
+    every matchup, or (None, None) if any view it needs has not been published. A
+    partitioned listing fetches its views in parallel and is merged once per set of view
+    ETags.
+    """
+    views = [sport] if sport else [ALL_SPORTS]
+    if not sport and readmodel.PARTITION != 'none':
+        views = readmodel.listing_views(get_manifest()[0])
+    if not views:
+        return None, None
+
+    fetched = get_views(views)
+    if any(representation is None for representation, _ in fetched):
+        return None, None
+    if len(views) == 1:
+        representation, cache_status = fetched[0]
+        return with_comment_counts(views[0], representation), cache_status
+
+    counts = [comment_counts(view, representation)
+              for view, (representation, _) in zip(views, fetched)]
+    etags = tuple(representation.etag for representation, _ in fetched)
+    validator = (etags, tuple(tuple(sorted(view_counts.items())) for view_counts in counts))
+    listing = page_cache.get_if_current('listing', validator)
+    if listing is not None:
+        statuses = {cache_status for _, cache_status in fetched}
+        return listing, 'REVALIDATED' if 'REVALIDATED' in statuses else 'HIT'
+
+    with metrics.phase(metrics.PARSE):
+        documents = [runtime.loads(representation.body()) for representation, _ in fetched]
+    documents = [readmodel.with_comment_counts(document, view_counts)
+                 for document, view_counts in zip(documents, counts)]
+    document = readmodel.merge_views(documents)
+    with metrics.phase(metrics.SERIALIZE):
+        body = runtime.dumps(document)
+
+    listing = Representation(content_etag(body.encode('utf-8')),
+                             http_date(document['last_updated']), body=body)
+    page_cache.put('listing', validator, listing)
+    return listing, 'MISS'
+
+
+def comment_counts(view, representation):
+    """
+    {id: comment_count} for the matchups in a fetched view changed since it was rendered
+    (a comment does not republish the views, see readmodel.py)
+    """
+    version = version_cache.get_if_current(view, representation.etag)
+    if version is None:
+        version = readmodel.stamped_version(representation.gzip_body())
+        version_cache.put(view, representation.etag, version)
+    return readmodel.comment_counts(get_manifest()[0], view, version)
+
+
+def with_comment_counts(view, representation):
+    """
+    representation of a view with current comment counts: as-is unless a matchup in it
+    was changed since it was rendered, else re-serialized once per view ETag and counts
+    """
+    counts = comment_counts(view, representation)
+    if not counts:
+        return representation
+
+    validator = (representation.etag, tuple(sorted(counts.items())))
+    current = page_cache.get_if_current(('view', view), validator)
+    if current is None:
+        with metrics.phase(metrics.PARSE):
+            document = runtime.loads(representation.body())
+        readmodel.with_comment_counts(document, counts)
+        with metrics.phase(metrics.SERIALIZE):
+            body = runtime.dumps(document)
+        current = Representation(content_etag(body.encode('utf-8')),
+                                 representation.last_modified, body=body)
+        page_cache.put(('view', view), validator, current)
+    return current
+
+
+def get_archived(sport, season):
+    """
+    Returns (representation, cache_status) for a sealed season's archive, or (None, None)
+    if the season is still open
+    """
+    summary = archive.get_archive(get_manifest()[0]).get(archive.season_key(sport, season))
+    if summary is None:
+        return None, None
+
+    representation = archive_cache.get_if_current(summary['key'], summary['key'])
+    if representation is not None:
+        return representation, 'HIT'
+
+    gzip_body, etag = store.get_bytes_and_etag(summary['key'])
+    if gzip_body is None:
+        return None, None
+    representation = Representation(etag, http_date(summary['sealed_at']), gzip_body=gzip_body)
+    archive_cache.put(summary['key'], summary['key'], representation)
+    return representation, 'MISS'
+
+
+def get_views(views):
+    """
+    Returns (representation, cache_status) for each published read model view, or
+    (None, None) for one that has not been published, revalidating or fetching the stale
+    ones in parallel. The gzip copy is fetched, and only decompressed for clients that
+    do not accept gzip.
+    """
+    results = {}
+    stale = {}
+    for view in views:
+        entry = view_cache.get(view)
+        if entry is not None and view_cache.is_fresh(entry):
+            view_cache.record_hit()
+            results[view] = (entry.value, 'HIT')
+        else:
+            stale[view] = entry
+
+    def fetch(view):
+        entry = stale[view]
+        return store.get_bytes_if_changed(readmodel.view_key(view, compressed=True),
+                                          entry.etag if entry else None)
+
+    if len(stale) > 1:
+        with ThreadPoolExecutor(max_workers=min(VIEW_WORKERS, len(stale))) as pool:
+            responses = dict(zip(stale, pool.map(fetch, stale)))
+    else:
+        responses = {view: fetch(view) for view in stale}
+
+    # The cache is only touched from this thread
+    for view, entry in stale.items():
+        gzip_body, etag, last_modified = responses[view]
+
+        if gzip_body is None and etag is not None:
+            view_cache.revalidated(view)
+            view_cache.record_hit()
+            results[view] = (entry.value, 'REVALIDATED')
+            continue
+
+        view_cache.record_miss()
+        if gzip_body is None:
+            results[view] = (None, None)
+            continue
+
+        representation = Representation(etag, http_date(last_modified), gzip_body=gzip_body)
+        view_cache.put(view, etag, representation)
+        results[view] = (representation, 'MISS')
+
+    return [results[view] for view in views]
+
+
+def get_matchups(manifest, ids):
+    """
+    Matchup objects for ids, in order, fetching only those not already cached
+    """
+    positions = get_lookup(manifest)['id']
+    etags = {matchup_id: manifest['matchups'][positions[matchup_id]].get('etag')
+             for matchup_id in ids if matchup_id in positions}
+
+    found = {}
+    missing = []
+    for matchup_id in ids:
+        matchup = None
+        if etags.get(matchup_id):
+            matchup = matchup_cache.get_if_current(matchup_id, etags[matchup_id])
+        if matchup is None:
+            missing.append(matchup_id)
+        else:
+            found[matchup_id] = matchup
+
+    for matchup in store.get_matchups(missing):
+        found[matchup['id']] = matchup
+        if etags.get(matchup['id']):
+            matchup_cache.put(matchup['id'], etags[matchup['id']], matchup)
+
+    return [found[matchup_id] for matchup_id in ids if matchup_id in found]
+
+
+def build_body(manifest, sport, sort, limit, cursor, matchup_id, season=None):
+    """
+    Serialized response for one query against the manifest indexes. season narrows an
+    unpaginated query to one open season.
+    """
+    positions = get_lookup(manifest)['id']
+    with metrics.phase(metrics.SEARCH):
+        if matchup_id:
+            ids = [matchup_id] if matchup_id in positions else []
+            next_cursor = None
+            total = len(ids)
+        else:
+            ids, next_cursor, total = query_page(manifest, sport, sort, limit, cursor)
+            if season is not None:
+                ids = [m_id for m_id in ids
+                       if readmodel.season(manifest['matchups'][positions[m_id]].get('date')) == season]
+                total = len(ids)
+
+    matchups = get_matchups(manifest, ids)
+    if matchup_id and not ids:
+        # Sealed seasons are no longer in the manifest, their matchup objects still are
+        sealed = archive.get_sealed_matchup(store, manifest, matchup_id)
+        matchups = [sealed] if sealed is not None else []
+        total = len(matchups)
+
+    body = {
+        'matchups': matchups,
+        'next_cursor': next_cursor,
+        'last_updated': manifest['last_updated'],
+        'total_matchups': total,
+        'version': changelog.version(manifest)
+    }
+    sealed_seasons = readmodel.archived_seasons(manifest, sport)
+    if sealed_seasons and not matchup_id:
+        body['archived_seasons'] = sealed_seasons
+    with metrics.phase(metrics.SERIALIZE):
+        return runtime.dumps(body)
+
+
+def build_delta(manifest, sport, since):
+    """
+    Serialized response for ?since=: the matchups changed after since and the ids of
+    those deleted, read from the change log in the manifest
+    """
+    with metrics.phase(metrics.SEARCH):
+        changed, deleted = changelog.changed_since(manifest, since, sport)
+
+    matchups = get_matchups(manifest, changed)
 
+    with metrics.phase(metrics.SERIALIZE):
+        return runtime.dumps({
+            'matchups': matchups,
+            'deleted': deleted,
+            'since': since,
+            'version': changelog.version(manifest),
+            'last_updated': manifest['last_updated']
+        })
@@ -0,0 +1,100 @@
+##############
+### Return aggregate stats and top matchups, maintained by the writers
+
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon.cache import WarmCache
+from stormcommon.http import Representation, conditional_response, content_etag, http_date
+from stormcommon import codecs, runtime, metrics, stats
+
+bucket_name = SUB_PrivateBucketName
+
+# Module scope so the client and caches survive across warm invocations
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+# The stats object, revalidated with a conditional GET once older than the TTL
+CACHE_TTL_SECONDS = 5
+stats_cache = WarmCache(max_entries=1, ttl_seconds=CACHE_TTL_SECONDS)
+
+# Serialized responses keyed by (sport, top), valid while the stats ETag is unchanged
+body_cache = WarmCache(max_entries=16)
+
+METHODS = 'GET, OPTIONS'
+
+
+@metrics.instrument('GetStats')
+def lambda_handler(event, context):
+    """
+    GET request for the aggregates over all matchups or one sport
+
+    Optional query parameters:
+      sport   one sport instead of all of them
+      top     length of each top list (default and max 10)
+
+    Returns match and team counts, mean/stddev/histogram of each score, verdict counts
+    and the top matchups by each score, all read from the incrementally maintained
+    stats object rather than computed from the matchups
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+        sport = params.get('sport') or None
+
+        top = stats.TOP_N
+        if params.get('top'):
+            try:
+                top = int(params['top'])
+            except ValueError:
+                top = 0
+            if not 1 <= top <= stats.TOP_N:
+                return runtime.error_response(400, 'Invalid query',
+                                              f'top must be an integer from 1 to {stats.TOP_N}', METHODS)
+
+        current, etag, cache_status = get_current_stats()
+        if current is None:
+            return runtime.error_response(404, 'Not found', 'Stats have not been built yet', METHODS)
+
+        representation = body_cache.get_if_current((sport, top), etag)
+        if representation is None:
+            summary = stats.summarize(current, sport, top)
+            if summary is None:
+                return runtime.error_response(404, 'Not found', f'No matchups for sport {sport}', METHODS)
+            with metrics.phase(metrics.SERIALIZE):
+                body = runtime.dumps(summary)
+            representation = Representation(content_etag(body.encode('utf-8')),
+                                            http_date(current['last_updated']), body=body)
+            body_cache.put((sport, top), etag, representation)
+
+        return conditional_response(event, representation,
+                                    runtime.headers(METHODS, {'X-Cache': cache_status}))
+
+    except ClientError as e:
+        return runtime.error_response(500, 'Failed to retrieve stats', str(e))
+    except Exception as e:
+        return runtime.error_response(500, 'Internal server error', str(e))
+
+
+def get_current_stats():
+    """
+    Returns (stats, etag, cache_status), with stats None if they have not been built
+    """
+    entry = stats_cache.get('stats')
+
+    if entry is not None and stats_cache.is_fresh(entry):
+        stats_cache.record_hit()
+        return entry.value, entry.etag, 'HIT'
+
+    body, etag, _ = store.get_bytes_if_changed(stats.STATS_KEY, entry.etag if entry else None)
+
+    if body is None and etag is not None:
+        stats_cache.revalidated('stats')
+        stats_cache.record_hit()
+        return entry.value, entry.etag, 'REVALIDATED'
+
+    stats_cache.record_miss()
+    if body is None:
+        return None, None, 'MISS'
+
+    with metrics.phase(metrics.PARSE):
+        current = codecs.decode(body)
+    stats_cache.put('stats', etag, current)
+    return current, etag, 'MISS'
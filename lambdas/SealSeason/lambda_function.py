@@ -0,0 +1,61 @@
+##############
+### Seal a closed season into an immutable archive (admin)
+
+import traceback
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore, ConditionFailed
+from stormcommon import archive, runtime, metrics
+
+bucket_name = SUB_PrivateBucketName
+
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+METHODS = 'POST, OPTIONS'
+
+
+@metrics.instrument('SealSeason')
+def lambda_handler(event, context):
+    """
+    POST request to seal one sport's season (see archive.py)
+
+    Expects JSON payload {"sport": "football", "season": "2023"}, the season named by the
+    year it starts in. Returns the sealed season's summary; 400 if the season is not over,
+    404 if it has no matchups, 409 if it is already sealed.
+    """
+    try:
+        data = runtime.parse_body(event)
+        sport = data.get('sport')
+        season = str(data.get('season') or '')
+        if not sport or not season.isdigit():
+            return runtime.error_response(400, 'Missing required fields',
+                                          'sport and season (a year) are required', METHODS)
+
+        summary = archive.seal_season(store, sport, season)
+        print(f"Sealed {sport} {season}: {summary['total_matchups']} matchups in {summary['key']}")
+
+        return runtime.response(200, {
+            'message': f'The {season} {sport} season is sealed',
+            'season': summary
+        }, METHODS)
+
+    except archive.SealError as e:
+        return runtime.error_response(e.status, 'Cannot seal season', str(e), METHODS)
+
+    except ConditionFailed:
+        return runtime.error_response(503, 'Busy', 'Too many concurrent writes, try again', METHODS)
+
+    except runtime.JSONDecodeError:
+        return runtime.error_response(400, 'Invalid JSON', 'Request body must be valid JSON', METHODS)
+
+    except ClientError as e:
+        error_details = traceback.format_exc()
+        print(f"S3 ClientError: {str(e)}")
+        print(f"Full traceback: {error_details}")
+        return runtime.error_response(500, 'S3 Error', f'Failed to seal season: {str(e)}')
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        print(f"Unexpected Error: {str(e)}")
+        print(f"Full traceback: {error_details}")
+        return runtime.error_response(500, 'Internal server error', str(e))
@@ -0,0 +1,63 @@
+##############
+### Full-text search over matchup rationales, discussion and comments
+
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore
+from stormcommon import runtime, metrics, search
+
+bucket_name = SUB_PrivateBucketName
+
+# Built during init so warm invocations reuse the client and its connections
+store = MatchupStore(runtime.s3_client(), bucket_name)
+
+METHODS = 'GET, OPTIONS'
+
+MAX_QUERY_LENGTH = 200
+
+
+@metrics.instrument('Search')
+def lambda_handler(event, context):
+    """
+    GET request for matchups matching a text query, best first
+
+    Query parameters:
+      q       required; bare words must all appear, "quoted phrases" must appear as-is
+      limit   number of results (default 10, max 20)
+
+    Each result carries the matchup id, sport, teams and date, its score, the field
+    that matched best (a rationale, overall_discussion or comment) and a snippet of it
+    with highlights as [start, end] character ranges into the snippet
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+        query = (params.get('q') or '').strip()
+
+        if not query or len(query) > MAX_QUERY_LENGTH:
+            return runtime.error_response(400, 'Invalid query',
+                                          f'q is required, at most {MAX_QUERY_LENGTH} characters', METHODS)
+
+        limit = search.DEFAULT_LIMIT
+        if params.get('limit'):
+            try:
+                limit = int(params['limit'])
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= search.MAX_LIMIT:
+                return runtime.error_response(400, 'Invalid query',
+                                              f'limit must be an integer from 1 to {search.MAX_LIMIT}', METHODS)
+
+        found = search.search(store, query, limit)
+        if found is None:
+            return runtime.error_response(404, 'Not found', 'The search index has not been built', METHODS)
+
+        total, ranked = found
+        return runtime.response(200, {
+            'query': query,
+            'total': total,
+            'results': search.describe(store, ranked)
+        }, METHODS, {'Cache-Control': 'no-cache'})
+
+    except ClientError as e:
+        return runtime.error_response(500, 'Failed to search matchups', str(e))
+    except Exception as e:
+        return runtime.error_response(500, 'Internal server error', str(e))
@@ -1,14 +1,34 @@
 import json
-import os
-import random
-import boto3
-from botocore.exceptions import ClientError
+import time
+import base64
+import hashlib
+from stormcommon.cache import TTLCache
+from stormcommon import tokens, runtime, metrics
 
 blr_authorizer = SUB_BLRLambdaUserAuthArn
+user_pool_id = SUB_UserPoolId
 
-lambda_client = boto3.client('lambda')
+# Built during init so warm invocations reuse the client and its connections
+lambda_client = runtime.lambda_client()
 
+# Local verification of Cognito access tokens, falling back to the BLR authorizer for
+# anything it cannot decide. Disabled when the UserPoolId stack parameter is "none".
+ADMIN_GROUP = 'admin'
+if user_pool_id and user_pool_id != 'none':
+    token_issuer = tokens.cognito_issuer(user_pool_id)
+    jwks_cache = tokens.JWKSCache(jwks_url=f'{token_issuer}/.well-known/jwks.json', refresh_seconds=3600)
+else:
+    token_issuer = None
+    jwks_cache = None
 
+# Authorization decisions cached across warm invocations, keyed by
+# (token hash, auth type, user id). Entries never outlive the token's exp.
+ALLOW_TTL_SECONDS = 300
+DENY_TTL_SECONDS = 30
+decision_cache = TTLCache(max_entries=256)
+
+
+@metrics.instrument('UserAuth')
 def lambda_handler(event, context):
     access_token = event.get('headers', {}).get('authorization', '')
 
@@ -24,17 +44,120 @@ def lambda_handler(event, context):
         auth_type = "adminUser"
     elif path == "/matchups" and method == "PATCH":
         auth_type = "adminUser"
+    elif path == "/matchups/bulk" and method == "POST":
+        auth_type = "adminUser"
+    elif path == "/matchups/seal" and method == "POST":
+        auth_type = "adminUser"
     elif path == "/comment" and method == "POST":
         auth_type = "anyUser"
     else:
         return {"isAuthorized": False}
 
-    lambda_event = {"authType": auth_type, "accessToken": access_token, "userID": user_id}
-    lambda_response = lambda_client.invoke(FunctionName=blr_authorizer,
-                                            InvocationType='RequestResponse',
-                                            Payload=json.dumps(lambda_event))
-    
-    if json.loads(lambda_response['Payload'].read())["isAuthorized"]:
+    cache_key = (hashlib.sha256(access_token.encode('utf-8')).hexdigest(), auth_type, user_id)
+    is_authorized = decision_cache.get(cache_key)
+    metrics.count(metrics.CACHE_MISSES if is_authorized is None else metrics.CACHE_HITS)
+
+    if is_authorized is None:
+        is_authorized = local_decision(access_token, auth_type, user_id)
+        if is_authorized is not None:
+            decision_cache.put(cache_key, is_authorized, decision_expiry(access_token, is_authorized))
+
+    if is_authorized is None:
+        lambda_event = {"authType": auth_type, "accessToken": access_token, "userID": user_id}
+        with metrics.phase(metrics.AUTH_INVOKE):
+            lambda_response = lambda_client.invoke(FunctionName=blr_authorizer,
+                                                    InvocationType='RequestResponse',
+                                                    Payload=runtime.dumps(lambda_event))
+            payload = lambda_response['Payload'].read()
+
+        is_authorized = bool(runtime.loads(payload)["isAuthorized"])
+        decision_cache.put(cache_key, is_authorized, decision_expiry(access_token, is_authorized))
+
+    if is_authorized:
+        # Handlers read the principal from requestContext.authorizer.lambda (idempotency
+        # keys are scoped by it)
+        principal = token_principal(access_token)
+        if principal:
+            return {"isAuthorized": True, "context": {"principal": principal}}
         return {"isAuthorized": True}
     else:
-        return {"isAuthorized": False}
\ No newline at end of file
+        return {"isAuthorized": False}
+
+
+def local_decision(access_token, auth_type, user_id):
+    """
+    True/False when the token settles the question on its own, None to ask the BLR authorizer.
+    A bad signature, expired token or foreign issuer is a definite deny; a valid token
+    allows anyUser, and adminUser only with the admin group claim.
+    """
+    if jwks_cache is None:
+        return None
+
+    try:
+        claims = tokens.verify_access_token(access_token, jwks_cache, token_issuer)
+    except tokens.TokenInvalid as e:
+        print(f"Token rejected locally: {e}")
+        return False
+    except tokens.TokenUndecidable as e:
+        print(f"Token undecided locally: {e}")
+        return None
+
+    # The BLR authorizer owns any per-user checks
+    if user_id:
+        return None
+
+    if auth_type == "anyUser":
+        return True
+    if auth_type == "adminUser" and ADMIN_GROUP in claims.get('cognito:groups', []):
+        return True
+    return None
+
+
+def decision_expiry(access_token, is_authorized):
+    """
+    Unix time a decision stops being reused: the TTL for its outcome, capped at the
+    token's exp claim. The claim is only read here, never trusted for the decision itself.
+    """
+    ttl = ALLOW_TTL_SECONDS if is_authorized else DENY_TTL_SECONDS
+    expires_at = time.time() + ttl
+
+    token_exp = token_expiry(access_token)
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    elif is_authorized:
+        # No readable exp, do not keep an allow around
+        return 0
+    return expires_at
+
+
+def token_claims(access_token):
+    """
+    Claims of a JWT, unverified, or None if the token is not a readable JWT
+    """
+    try:
+        payload = access_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+def token_expiry(access_token):
+    """
+    exp claim of a JWT, or None if the token is not a readable JWT
+    """
+    try:
+        return float(token_claims(access_token)['exp'])
+    except Exception:
+        return None
+
+
+def token_principal(access_token):
+    """
+    sub (or username) claim of a token that has just been authorized, so its signature
+    has been checked, locally or by the BLR authorizer. None if it has neither.
+    """
+    claims = token_claims(access_token) or {}
+    principal = claims.get('sub') or claims.get('username')
+    return str(principal) if principal else None
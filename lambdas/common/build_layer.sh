@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Package stormcommon as a Lambda layer (python/stormcommon inside the zip) and
+# optionally publish it. deploy_lambdas.sh still bundles the package into each zip,
+# so the layer is only needed if functions are switched over to it.
+#
+# Usage (from lambdas/common): ./build_layer.sh [--publish]
+
+LAYER_NAME="stormalytics-stormcommon"
+zip_file="stormcommon-layer.zip"
+
+rm -rf "layer" "$zip_file"
+mkdir -p "layer/python"
+cp -r stormcommon "layer/python/"
+find "layer" -name "__pycache__" -type d -prune -exec rm -rf {} +
+
+(cd layer && zip -r "../$zip_file" python)
+rm -rf "layer"
+
+if [ "$1" == "--publish" ]; then
+    echo "Publishing $zip_file as layer $LAYER_NAME..."
+    aws lambda publish-layer-version --layer-name "$LAYER_NAME" --zip-file fileb://"$zip_file" \
+        --compatible-runtimes python3.12 --query 'LayerVersionArn' --output text --no-cli-pager
+fi
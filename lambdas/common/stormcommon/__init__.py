@@ -0,0 +1,5 @@
+##############
+### Shared code bundled into every stormalytics lambda
+###
+### deploy_lambdas.sh copies this package next to lambda_function.py in each zip,
+### so handlers import it as a top-level package: `from stormcommon import storage`
@@ -0,0 +1,173 @@
+##############
+### Sealed seasons: closed seasons moved out of the manifest into immutable archives
+###
+### archive/<sport>/<season>-<hash>.json.gz   every matchup of one sport's season, most
+###                                           recent first, as a read model body (gzip,
+###                                           named by a hash of the bytes, never rewritten)
+### manifest['archive'] = {
+###     '<sport>/<season>': {'sport', 'season', 'key', 'total_matchups', 'first_date',
+###                          'last_date', 'sealed_at'}
+### }
+###
+### Sealing a season (SealSeason, or dev/seal_season.py) writes its archive and drops its
+### matchups from the manifest in one conditional manifest write, then republishes the
+### read model views that held them. The season is read-only from then on: writers reject
+### adds, edits and comments that would touch it. The manifest, read model and snapshots
+### hold only the open seasons, so what a write rewrites and what the default listing
+### returns stay the same size as seasons accumulate. GET /matchups?sport=&season= returns
+### a sealed season's archive bytes as-is. Matchup objects stay where they are, for ?id=
+### lookups and search results. Stats and search still cover every season: sealing moves
+### the season's search postings aside (see search.py), and rebuilds read the archives
+### (store.load_matchups(manifest, archived=True)).
+###
+### Seasons run July to June and are named by the year they start in (readmodel.season).
+
+import gzip
+import hashlib
+from datetime import datetime
+from stormcommon.indexes import DERIVED_KEYS
+from stormcommon.storage import ConditionFailed, if_unchanged, utc_now
+from stormcommon import readmodel, runtime, changelog, concurrency, metrics, search
+
+ARCHIVE_PREFIX = 'archive/'
+
+
+class SealError(Exception):
+    """
+    A season that cannot be sealed; status is the HTTP status to answer with
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def season_key(sport, season):
+    return f'{sport}/{season}'
+
+
+def get_archive(manifest):
+    """
+    Summaries of the sealed seasons, empty for manifests written before sealing existed
+    """
+    return manifest.get('archive', {})
+
+
+def current_season():
+    return readmodel.season(datetime.utcnow().date().isoformat())
+
+
+def sealed_season(manifest, matchup):
+    """
+    Summary of the sealed season matchup (or a manifest entry) falls in, None if it is open
+    """
+    return get_archive(manifest).get(season_key(readmodel.sport_view(matchup),
+                                                readmodel.season(matchup.get('date'))))
+
+
+def sealed_message(summary):
+    return f'The {summary["season"]} {summary["sport"]} season is sealed and can no longer change'
+
+
+def get_sealed_matchup(store, manifest, matchup_id):
+    """
+    Matchup by id if it is in a sealed season (no longer in the manifest), else None
+    """
+    if not get_archive(manifest):
+        return None
+    matchup = store.get_matchup(matchup_id)
+    if matchup is None or sealed_season(manifest, matchup) is None:
+        return None
+    return matchup
+
+
+def render_archive(sport, season, matchups, manifest):
+    """
+    Gzip-compressed archive body: the read model body of the season's matchups
+    """
+    readmodel.sort_matchups(matchups)
+    with metrics.phase(metrics.SERIALIZE):
+        body = runtime.dumps({
+            'sport': sport,
+            'season': season,
+            'matchups': matchups,
+            'last_updated': manifest['last_updated'],
+            'total_matchups': len(matchups),
+            'version': changelog.version(manifest)
+        }).encode('utf-8')
+        # Written once and read many times: worth the slowest compression
+        return gzip.compress(body, compresslevel=9)
+
+
+def seal_season(store, sport, season):
+    """
+    Archive one sport's closed season and drop its matchups from the manifest, re-reading
+    and retrying if a writer changes the manifest or one of the matchups meanwhile.
+    Returns the season's summary; raises SealError if it cannot be sealed.
+    """
+    if season >= current_season():
+        raise SealError(400, f'The {season} season is not over yet')
+
+    written = []
+
+    def attempt():
+        manifest, manifest_etag = store.get_manifest_and_etag()
+        key = season_key(sport, season)
+        if key in get_archive(manifest):
+            raise SealError(409, f'The {season} {sport} season is already sealed')
+
+        entries = [entry for entry in manifest['matchups']
+                   if readmodel.sport_view(entry) == sport and readmodel.season(entry.get('date')) == season]
+        if not entries:
+            raise SealError(404, f'No {sport} matchups in the {season} season')
+
+        loaded = store.get_matchups_and_etags([entry['id'] for entry in entries])
+        if [etag for _, etag in loaded] != [entry.get('etag') for entry in entries]:
+            # A write in flight (object written, manifest not yet) or a missing object:
+            # wait for it rather than archive a state that may never commit
+            raise ConditionFailed(key)
+        matchups = [matchup for matchup, _ in loaded]
+
+        gzip_body = render_archive(sport, season, matchups, manifest)
+        archive_key = f'{ARCHIVE_PREFIX}{key}-{hashlib.sha256(gzip_body).hexdigest()[:16]}.json.gz'
+        store.put_bytes(archive_key, gzip_body, content_encoding='gzip')
+        written.append(archive_key)
+
+        dates = sorted(matchup.get('date') or '' for matchup in matchups)
+        summary = {
+            'sport': sport,
+            'season': season,
+            'key': archive_key,
+            'total_matchups': len(matchups),
+            'first_date': dates[0],
+            'last_date': dates[-1],
+            'sealed_at': utc_now()
+        }
+
+        ids = {entry['id'] for entry in entries}
+        manifest['matchups'] = [entry for entry in manifest['matchups'] if entry['id'] not in ids]
+        for derived in DERIVED_KEYS:
+            manifest.pop(derived, None)
+        manifest.setdefault('archive', {})[key] = summary
+        # Logged as removed, so delta syncs drop them from the open-season listing
+        store.put_manifest(manifest, sorted(ids), if_unchanged(manifest_etag))
+        return summary, entries, matchups
+
+    try:
+        summary, entries, matchups = concurrency.with_retries(attempt)
+    except (ConditionFailed, SealError):
+        for key in written:
+            store.delete(key)
+        raise
+
+    # Archives of attempts that lost a race are not named by the manifest
+    for key in written:
+        if key != summary['key']:
+            store.delete(key)
+
+    views = set()
+    for entry in entries:
+        views |= readmodel.views_of(entry)
+    readmodel.republish(store, views, sports={sport})
+    search.seal(store, matchups)
+    return summary
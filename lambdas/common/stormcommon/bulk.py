@@ -0,0 +1,227 @@
+##############
+### Bulk import/edit of matchups from a JSONL or CSV batch
+###
+### Each row is a new matchup or an edit. A row with an id edits that matchup, a row whose
+### winner/loser/date match an existing matchup edits it (as a JSON Merge Patch, like
+### PATCH /matchups), anything else is added and must pass the same checks as AddMatchup.
+### The whole batch is validated against one manifest read, then applied as one batch of
+### writes (see writes.py): one conditional put per matchup, one manifest write, one pass
+### over the read model, one stats update and one write per changed search term, so
+### loading a season costs a single read-modify-write instead of one per game. A writer
+### racing the batch makes it re-apply every row against fresh state, edits as merge
+### patches, so neither side's changes are lost. Rows that would add to or edit a sealed
+### season (see archive.py) are errors.
+###
+### Used by the BulkMatchups lambda and dev/bulk_import.py.
+
+import io
+import csv
+import uuid
+from stormcommon import matchups as matchup_rules
+from stormcommon.indexes import get_lookup, natural_key
+from stormcommon import archive, runtime, writes
+
+FORMATS = ['jsonl', 'csv']
+
+# CSV cells are strings, these columns are converted to numbers
+NUMERIC_FIELDS = ['upset_score', 'impact_score', 'excitement_score']
+
+MAX_ROWS = 2000
+
+
+class BatchError(Exception):
+    """
+    The batch as a whole cannot be read (unknown format, too many rows...)
+    """
+
+
+def parse_batch(text, fmt):
+    """
+    Returns a list of (row number, matchup dict or None, parse error or None).
+    Rows are numbered from 1 and blank lines are skipped.
+    """
+    if fmt not in FORMATS:
+        raise BatchError(f'format must be one of {", ".join(FORMATS)}')
+
+    rows = []
+    if fmt == 'jsonl':
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                data = runtime.loads(line)
+            except runtime.JSONDecodeError as e:
+                rows.append((number, None, f'Invalid JSON: {e.msg}'))
+                continue
+            if not isinstance(data, dict):
+                rows.append((number, None, 'Each line must be a JSON object'))
+            else:
+                rows.append((number, data, None))
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        # Row numbers count the header line, so they match the line in the file
+        for number, record in enumerate(reader, start=2):
+            data = {key.strip(): value for key, value in record.items() if key and value is not None}
+            if not any(data.values()):
+                continue
+            if not data.get('id'):
+                data.pop('id', None)
+            try:
+                for field in NUMERIC_FIELDS:
+                    if data.get(field, '') != '':
+                        data[field] = float(data[field])
+            except ValueError:
+                rows.append((number, None, f'Field "{field}" must be a number'))
+                continue
+            rows.append((number, data, None))
+
+    if len(rows) > MAX_ROWS:
+        raise BatchError(f'A batch can hold at most {MAX_ROWS} rows')
+    return rows
+
+
+def plan_batch(store, manifest, rows):
+    """
+    Validate every row against the manifest. Returns (results, matchups, patches)
+    where results has one entry per row, matchups are the records as they would be
+    written and patches maps the id of each edited matchup to its row, the merge patch
+    to apply.
+    """
+    lookup = get_lookup(manifest)
+
+    results = []
+    planned = []
+    seen = {}
+    for number, data, error in rows:
+        result = {'row': number}
+        results.append(result)
+
+        if error is None:
+            if data.get('id'):
+                matchup_id = data['id']
+                if matchup_id not in lookup['id']:
+                    sealed = archive.get_sealed_matchup(store, manifest, matchup_id)
+                    if sealed is not None:
+                        error = archive.sealed_message(archive.sealed_season(manifest, sealed))
+                    else:
+                        error = f'No matchup found with id {matchup_id}'
+            else:
+                field = matchup_rules.missing_key_field(data)
+                matchup_id = None
+                if not field:
+                    matchup_id = lookup['key'].get(natural_key(data['winner'], data['loser'], data['date']))
+                if matchup_id is None:
+                    field = matchup_rules.missing_field(data)
+                    if field:
+                        error = f'Field "{field}" is required'
+            if error is None:
+                field = matchup_rules.invalid_score(data)
+                if field:
+                    error = f'Field "{field}" must be a number'
+
+        if error is None:
+            target = matchup_id or tuple(data[f] for f in matchup_rules.KEY_FIELDS)
+            if target in seen:
+                error = f'Same matchup as row {seen[target]}'
+            else:
+                seen[target] = number
+
+        if error is not None:
+            result.update({'status': 'error', 'error': error})
+            continue
+
+        result['status'] = 'updated' if matchup_id else 'added'
+        planned.append((result, matchup_id, data))
+
+    # Edits need the stored records, fetched together rather than one by one
+    existing = {m['id']: m for m in store.get_matchups([m_id for _, m_id, _ in planned if m_id])}
+
+    matchups = []
+    patches = {}
+    for result, matchup_id, data in planned:
+        if matchup_id is None:
+            matchup = matchup_rules.new_matchup(dict(data))
+        elif matchup_id in existing:
+            matchup = matchup_rules.merge_edit(existing[matchup_id], data)
+            field = matchup_rules.missing_field(matchup)
+            if field:
+                result.update({'status': 'error', 'error': f'Field "{field}" is required'})
+                continue
+            field = matchup_rules.invalid_score(matchup)
+            if field:
+                result.update({'status': 'error', 'error': f'Field "{field}" must be a number'})
+                continue
+            if matchup_rules.key_changed(existing[matchup_id], matchup):
+                other_id = lookup['key'].get(natural_key(matchup['winner'], matchup['loser'], matchup['date']))
+                if other_id and other_id != matchup_id:
+                    result.update({'status': 'error',
+                                   'error': 'Another matchup has the same winner, loser, and date'})
+                    continue
+            patches[matchup_id] = dict(data, id=matchup_id)
+        else:
+            result.update({'status': 'error', 'error': f'Matchup {matchup_id} could not be read'})
+            continue
+        sealed = archive.sealed_season(manifest, matchup)
+        if sealed is not None:
+            result.update({'status': 'error', 'error': archive.sealed_message(sealed)})
+            continue
+        result['id'] = matchup['id']
+        matchups.append(matchup)
+
+    return results, matchups, patches
+
+
+def apply_batch(store, rows, partial=False, dry_run=False):
+    """
+    Validate and apply a parsed batch. Unless partial is set, a batch with any invalid row
+    writes nothing. Returns a summary with per-row results.
+    """
+    manifest = store.get_manifest()
+    results, matchups, patches = plan_batch(store, manifest, rows)
+
+    errors = sum(1 for result in results if result['status'] == 'error')
+    applied = not dry_run and bool(matchups) and (partial or errors == 0)
+    total_matchups = len(manifest['matchups'])
+
+    if applied:
+        batch = []
+        for matchup in matchups:
+            if matchup['id'] in patches:
+                batch.append({'request_id': str(uuid.uuid4()), 'op': writes.EDIT_MATCHUP,
+                              'payload': patches[matchup['id']]})
+            else:
+                batch.append({'request_id': str(uuid.uuid4()), 'op': writes.ADD_MATCHUP, 'payload': matchup})
+        outcomes = writes.apply_writes(store, batch)
+
+        # A row can still fail when applied: another writer changed its matchup since
+        # the batch was validated
+        by_id = {matchup['id']: write['request_id'] for matchup, write in zip(matchups, batch)}
+        for result in results:
+            if result['status'] == 'error':
+                continue
+            status_code, body = outcomes[by_id[result['id']]]
+            if status_code >= 400:
+                if result['status'] == 'added':
+                    # The id was never stored
+                    del result['id']
+                result.update({'status': 'error', 'error': body['message']})
+            elif result['status'] == 'added':
+                total_matchups += 1
+        errors = sum(1 for result in results if result['status'] == 'error')
+    else:
+        for result in results:
+            if result['status'] == 'added':
+                # The id was never stored
+                del result['id']
+            if result['status'] != 'error':
+                result['status'] = 'valid' if dry_run else 'skipped'
+
+    return {
+        'applied': applied,
+        'rows': len(results),
+        'added': sum(1 for result in results if result['status'] == 'added'),
+        'updated': sum(1 for result in results if result['status'] == 'updated'),
+        'errors': errors,
+        'total_matchups': total_matchups,
+        'results': results
+    }
@@ -0,0 +1,136 @@
+##############
+### Warm-container cache
+###
+### Instances are meant to live at module scope in a lambda_function.py so they survive
+### across warm invocations of the same container. Each entry remembers the S3 ETag it
+### was built from; within the TTL an entry is served without touching S3, after that
+### the caller revalidates with a conditional GET and either refreshes or replaces it.
+###
+### TTLCache is the simpler variant for values with no S3 validator (e.g. authorization
+### decisions), where each entry just expires at its own time.
+
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    def __init__(self, etag, value):
+        self.etag = etag
+        self.value = value
+        self.checked_at = time.monotonic()
+
+
+class WarmCache:
+    """
+    Bounded LRU of ETag-tagged values with hit/miss counters
+    """
+
+    def __init__(self, max_entries=16, ttl_seconds=5):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, key):
+        """
+        Returns the entry for key (fresh or stale), or None
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def get_if_current(self, key, etag):
+        """
+        Value for key if it was built from etag (counted as a hit), else None (a miss)
+        """
+        entry = self.get(key)
+        if entry is not None and entry.etag == etag:
+            self.hits += 1
+            return entry.value
+        self.misses += 1
+        return None
+
+    def is_fresh(self, entry):
+        return time.monotonic() - entry.checked_at < self.ttl_seconds
+
+    def put(self, key, etag, value):
+        self.entries[key] = CacheEntry(etag, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def revalidated(self, key):
+        """
+        Record that S3 confirmed the entry for key is still current
+        """
+        self.entries[key].checked_at = time.monotonic()
+        self.revalidations += 1
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self):
+        self.misses += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'size': len(self.entries)
+        }
+
+
+class TTLCache:
+    """
+    Bounded LRU where every entry carries its own expiry time
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Value for key if present and unexpired (counted as a hit), else None (a miss)
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if time.time() < expires_at:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value, expires_at):
+        """
+        expires_at is a unix timestamp; entries already expired are not stored
+        """
+        if expires_at <= time.time():
+            return
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'size': len(self.entries)
+        }
@@ -0,0 +1,92 @@
+##############
+### Change log for delta sync (GET /matchups?since=<version>)
+###
+### manifest['changes'] = {
+###     'version': n,                  bumped by every manifest write that changes matchups
+###     'floor':   f,                  oldest version a client can still sync from
+###     'log':     [[version, id], ...] ascending, at most one entry per matchup
+### }
+###
+### The log rides in the manifest, so it is written by the same PUT as the change itself
+### and costs the writers no extra request. Recording a matchup drops its earlier entry
+### (only the latest version of a matchup matters to a client), and once the log holds
+### more than MAX_CHANGES entries the oldest are dropped and the floor raised past them.
+### A logged id that is no longer in the manifest is a tombstone: the matchup was deleted.
+
+from stormcommon.indexes import get_lookup
+
+MAX_CHANGES = 500
+
+
+class StaleVersion(Exception):
+    """
+    since is older than the compacted log (or newer than the current version), the
+    client has to reload everything
+    """
+
+
+def get_changes(manifest):
+    """
+    The change log, starting empty at version 0 for manifests written before it existed
+    """
+    return manifest.setdefault('changes', {'version': 0, 'floor': 0, 'log': []})
+
+
+def version(manifest):
+    return get_changes(manifest)['version']
+
+
+def record(manifest, ids):
+    """
+    Log a write of the given matchup ids as one new version. Returns the version.
+    """
+    changes = get_changes(manifest)
+    ids = set(ids)
+    if not ids:
+        return changes['version']
+
+    changes['version'] += 1
+    log = [entry for entry in changes['log'] if entry[1] not in ids]
+    log.extend([changes['version'], matchup_id] for matchup_id in sorted(ids))
+
+    if len(log) > MAX_CHANGES:
+        # Everything up to the last dropped entry's version can no longer be synced from
+        changes['floor'] = log[-MAX_CHANGES - 1][0]
+        log = log[-MAX_CHANGES:]
+
+    changes['log'] = log
+    return changes['version']
+
+
+def reset(manifest):
+    """
+    Start over after the whole archive was rewritten: no client can sync across it
+    """
+    changes = get_changes(manifest)
+    changes['version'] += 1
+    changes['floor'] = changes['version']
+    changes['log'] = []
+
+
+def changed_since(manifest, since, sport=None):
+    """
+    (changed ids, deleted ids) after version since, oldest change first. With a sport,
+    matchups that are now in another sport are reported as deleted too. Raises
+    StaleVersion if the log cannot answer for since.
+    """
+    changes = get_changes(manifest)
+    if since < changes['floor'] or since > changes['version']:
+        raise StaleVersion(f'since must be from {changes["floor"]} to {changes["version"]}')
+
+    positions = get_lookup(manifest)['id']
+    changed = []
+    deleted = []
+    for entry_version, matchup_id in changes['log']:
+        if entry_version <= since:
+            continue
+        position = positions.get(matchup_id)
+        if position is not None and sport in (None, manifest['matchups'][position].get('sport') or 'unknown'):
+            changed.append(matchup_id)
+        else:
+            deleted.append(matchup_id)
+    return changed, deleted
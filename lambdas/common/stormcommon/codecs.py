@@ -0,0 +1,107 @@
+##############
+### Storage codecs for the private bucket (manifest, matchup and comment objects)
+###
+### Every object written through a codec starts with a 5 byte header:
+###
+###     b'\x00SC'  magic (no JSON document or gzip stream starts with a NUL byte)
+###     version    schema version of the header, currently 1
+###     codec id   1 json, 2 json+gzip, 3 msgpack
+###
+### so readers pick the decoder from the bytes themselves and objects written with
+### different codecs can sit side by side. Objects without the header are read as
+### plain JSON, or gzip JSON if they start with the gzip magic, which covers
+### everything written before codecs existed.
+###
+### The read model (read/*.json) is not encoded: GetMatchups serves those bytes to
+### clients as standard JSON.
+
+import gzip
+from stormcommon import runtime
+
+try:
+    import msgpack
+except ImportError:
+    # Optional, only needed to write or read the msgpack codec
+    msgpack = None
+
+MAGIC = b'\x00SC'
+SCHEMA_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 2
+GZIP_MAGIC = b'\x1f\x8b'
+
+JSON = 'json'
+JSON_GZIP = 'json+gzip'
+MSGPACK = 'msgpack'
+
+CODEC_IDS = {JSON: 1, JSON_GZIP: 2, MSGPACK: 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+# What MatchupStore writes unless told otherwise. Compact JSON decodes fastest with only
+# the standard library, see dev/benchmark_codecs.py for the trade-offs.
+DEFAULT_CODEC = JSON
+
+CONTENT_TYPE = 'application/octet-stream'
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise ValueError('The msgpack codec needs the msgpack package')
+
+
+def _encode_payload(data, codec):
+    if codec == JSON:
+        return runtime.dumps(data).encode('utf-8')
+    if codec == JSON_GZIP:
+        return gzip.compress(runtime.dumps(data).encode('utf-8'), compresslevel=6)
+    if codec == MSGPACK:
+        _require_msgpack()
+        return msgpack.packb(data, use_bin_type=True)
+    raise ValueError(f'Unknown codec {codec}')
+
+
+def _decode_payload(payload, codec):
+    if codec == JSON:
+        return runtime.loads(payload)
+    if codec == JSON_GZIP:
+        return runtime.loads(gzip.decompress(payload))
+    if codec == MSGPACK:
+        _require_msgpack()
+        return msgpack.unpackb(payload, raw=False)
+    raise ValueError(f'Unknown codec {codec}')
+
+
+def encode(data, codec=DEFAULT_CODEC):
+    """
+    Header plus payload bytes for data in the given codec
+    """
+    if codec not in CODEC_IDS:
+        raise ValueError(f'Unknown codec {codec}')
+    header = MAGIC + bytes([SCHEMA_VERSION, CODEC_IDS[codec]])
+    return header + _encode_payload(data, codec)
+
+
+def detect(body):
+    """
+    (schema version, codec) of stored bytes; version 0 means written before the header
+    """
+    if body[:len(MAGIC)] == MAGIC:
+        if len(body) < HEADER_SIZE:
+            raise ValueError('Truncated codec header')
+        version, codec_id = body[len(MAGIC)], body[len(MAGIC) + 1]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f'Schema version {version} is newer than this reader ({SCHEMA_VERSION})')
+        if codec_id not in CODEC_NAMES:
+            raise ValueError(f'Unknown codec id {codec_id}')
+        return version, CODEC_NAMES[codec_id]
+    if body[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        return 0, JSON_GZIP
+    return 0, JSON
+
+
+def decode(body):
+    """
+    Data from stored bytes in any codec, with or without the header
+    """
+    version, codec = detect(body)
+    payload = body[HEADER_SIZE:] if version else body
+    return _decode_payload(payload, codec)
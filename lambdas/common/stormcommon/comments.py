@@ -0,0 +1,125 @@
+##############
+### Comment streams, one per matchup, stored apart from the matchup record
+###
+### comments/<matchup id>/<newest-first token>-<comment id>.json   one object per comment
+###
+### The token counts down with created_at, so a plain (ascending) listing returns the
+### newest comments first and a page cursor is just the last key of the previous page.
+### Writing a comment adds one object and never rewrites the ones before it; the matchup
+### record only carries comment_count so list payloads stay flat. The count is kept
+### running (the stored count plus the comments a write adds) rather than listed; a
+### comment that was already stored, by a retried or redelivered write, may be counted
+### already, so its stream is counted from the listing instead.
+
+import uuid
+import base64
+import binascii
+from datetime import datetime, timezone
+from stormcommon.storage import ConditionFailed, if_unchanged, utc_now
+
+COMMENT_PREFIX = 'comments/'
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Microseconds since the epoch are subtracted from this, 16 digits lasts until 2286
+TOKEN_BASE = 10 ** 16
+
+
+def stream_prefix(matchup_id):
+    return f'{COMMENT_PREFIX}{matchup_id}/'
+
+
+def newest_first_token(created_at):
+    """
+    Fixed-width string that sorts descending by created_at (naive ISO time is UTC)
+    """
+    when = datetime.fromisoformat(created_at)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    micros = int(when.timestamp() * 1_000_000)
+    return f'{TOKEN_BASE - micros:016d}'
+
+
+def comment_key(matchup_id, comment):
+    return f'{stream_prefix(matchup_id)}{newest_first_token(comment["created_at"])}-{comment["id"]}.json'
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.rsplit('/', 1)[-1].encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(matchup_id, cursor):
+    try:
+        name = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if not name or '/' in name:
+        raise ValueError('Invalid cursor')
+    return stream_prefix(matchup_id) + name
+
+
+def add_comment(store, matchup_id, comment):
+    """
+    Store a comment unless it is stored already. Returns True if it was new.
+    """
+    try:
+        store.put_record(comment_key(matchup_id, comment), comment, if_unchanged(None))
+        return True
+    except ConditionFailed:
+        return False
+
+
+def count_comments(store, matchup_id):
+    """
+    Number of comments in a stream, from the listing (S3 lists are strongly consistent)
+    """
+    count = 0
+    start_after = None
+    while True:
+        keys, truncated = store.list_keys(stream_prefix(matchup_id), start_after)
+        count += len(keys)
+        if not truncated or not keys:
+            return count
+        start_after = keys[-1]
+
+
+def list_comments(store, matchup_id, limit=DEFAULT_LIMIT, cursor=None):
+    """
+    One page of comments, newest first. Returns (comments, next_cursor).
+    """
+    start_after = decode_cursor(matchup_id, cursor) if cursor else None
+    keys, truncated = store.list_keys(stream_prefix(matchup_id), start_after, max_keys=limit)
+    comments = store.get_records(keys)
+    next_cursor = encode_cursor(keys[-1]) if truncated and keys else None
+    return comments, next_cursor
+
+
+def split_comments(store, matchup):
+    """
+    Move comments nested in a matchup record into its stream and set comment_count
+    (in place). Returns True if the record changed and needs to be written back.
+    """
+    nested = matchup.pop('comments', None)
+    if nested is None and 'comment_count' in matchup:
+        return False
+
+    for comment in nested or []:
+        comment.setdefault('id', str(uuid.uuid4()))
+        comment.setdefault('created_at', matchup.get('created_at') or utc_now())
+        comment.setdefault('matchup_id', matchup['id'])
+        add_comment(store, matchup['id'], comment)
+
+    matchup['comment_count'] = count_comments(store, matchup['id'])
+    return True
+
+
+def migrate(store):
+    """
+    One-shot move of nested comments into streams for every matchup, written back with
+    one manifest update. Returns the matchups that changed.
+    """
+    manifest = store.get_manifest()
+    changed = [m for m in store.load_matchups(manifest) if split_comments(store, m)]
+    store.put_matchups(changed, manifest)
+    return changed
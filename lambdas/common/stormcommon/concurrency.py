@@ -0,0 +1,63 @@
+##############
+### Optimistic concurrency for the objects writers read-modify-write
+###
+### A writer reads an object with its ETag, changes it, and puts it back with a
+### precondition (storage.if_unchanged: If-Match the ETag it read, If-None-Match: * if
+### there was no object). When another writer got there first S3 rejects the put, the
+### store raises ConditionFailed, and the writer re-reads the object and re-applies its
+### change after a jittered backoff, a bounded number of times. Correctness no longer
+### depends on writes being rare; contention shows up as the Conflicts and Retries counts
+### and the RetryWait phase (see metrics.py).
+
+import time
+import random
+from stormcommon.storage import ConditionFailed, if_unchanged
+from stormcommon import metrics
+
+MAX_ATTEMPTS = 10
+
+# Full jitter: attempt n waits uniformly up to min(MAX_DELAY, BASE_DELAY * 2^n) seconds
+BASE_DELAY = 0.025
+MAX_DELAY = 1.0
+
+
+def backoff(attempt):
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def with_retries(operation, attempts=MAX_ATTEMPTS):
+    """
+    Call operation() until it returns without a ConditionFailed, backing off between
+    attempts. operation must re-read whatever it changes. Raises the last ConditionFailed
+    after attempts tries.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except ConditionFailed:
+            metrics.count(metrics.CONFLICTS)
+            if attempt == attempts - 1:
+                raise
+            metrics.count(metrics.RETRIES)
+            with metrics.phase(metrics.RETRY_WAIT):
+                time.sleep(backoff(attempt))
+
+
+def update_record(store, key, mutate, loaded=None):
+    """
+    Read-modify-write of the record at key under a precondition, retried on conflict.
+    mutate(record) gets the stored record (None if there is none) and returns the record
+    to write, or None to leave it as it is. loaded is an already fetched (record, ETag)
+    to use for the first attempt. Returns the record as written (or as left).
+    """
+    def attempt():
+        nonlocal loaded
+        record, etag = loaded if loaded is not None else store.get_record_and_etag(key)
+        loaded = None
+        updated = mutate(record)
+        if updated is None:
+            return record
+        store.put_record(key, updated, if_unchanged(etag))
+        return updated
+
+    return with_retries(attempt)
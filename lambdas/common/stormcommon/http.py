@@ -0,0 +1,151 @@
+##############
+### HTTP validators and compression for API Gateway (HTTP API, payload format 2.0)
+###
+### A Representation holds one response body in plain and/or gzip form, plus the
+### strong ETag and Last-Modified that go with it. Either form is derived lazily from
+### the other and kept, so a cached Representation compresses at most once.
+
+import gzip
+import base64
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from stormcommon import metrics
+
+# Bodies smaller than this are not worth compressing
+MIN_GZIP_BYTES = 1024
+
+
+def content_etag(data):
+    return '"' + hashlib.md5(data).hexdigest() + '"'
+
+
+def http_date(value):
+    """
+    HTTP-date for a datetime or an ISO-8601 string (naive values are UTC)
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+class Representation:
+    def __init__(self, etag, last_modified=None, body=None, gzip_body=None):
+        """
+        etag is a strong validator for the content, last_modified an HTTP-date or None.
+        body is the plain str, gzip_body the compressed bytes; at least one is required.
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self._body = body
+        self._gzip_body = gzip_body
+
+    def body(self):
+        if self._body is None:
+            with metrics.phase(metrics.SERIALIZE):
+                self._body = gzip.decompress(self._gzip_body).decode('utf-8')
+        return self._body
+
+    def gzip_body(self):
+        if self._gzip_body is None:
+            with metrics.phase(metrics.SERIALIZE):
+                self._gzip_body = gzip.compress(self._body.encode('utf-8'), compresslevel=6)
+        return self._gzip_body
+
+    def should_compress(self):
+        if self._body is not None:
+            return len(self._body) >= MIN_GZIP_BYTES
+        return True
+
+
+def get_header(event, name):
+    """
+    Case-insensitive request header lookup (HTTP API lowercases them, tests may not)
+    """
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def accepts_gzip(event):
+    accept_encoding = get_header(event, 'accept-encoding') or ''
+    for coding in accept_encoding.split(','):
+        parts = coding.strip().split(';')
+        if parts[0].strip().lower() in ('gzip', '*'):
+            q = [p.strip() for p in parts[1:] if p.strip().startswith('q=')]
+            if not q:
+                return True
+            try:
+                return float(q[0][2:]) > 0
+            except ValueError:
+                # Unparseable (or empty) q-value: treat as q=0
+                return False
+    return False
+
+
+def etag_matches(event, etag):
+    """
+    If-None-Match check; the gzip variant of a representation counts as the same entity
+    """
+    if_none_match = get_header(event, 'if-none-match')
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    base = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == base or candidate == base + '-gzip':
+            return True
+    return False
+
+
+def conditional_response(event, representation, headers):
+    """
+    304 if the client already has this representation, otherwise 200 with the body,
+    gzip-compressed and base64-encoded when the client accepts it
+    """
+    compress = representation.should_compress() and accepts_gzip(event)
+
+    headers = dict(headers)
+    headers['Cache-Control'] = 'no-cache'
+    headers['Vary'] = 'Accept-Encoding'
+    etag = representation.etag
+    if etag and compress:
+        etag = etag[:-1] + '-gzip"'
+    if etag:
+        headers['ETag'] = etag
+    if representation.last_modified:
+        headers['Last-Modified'] = representation.last_modified
+
+    if etag_matches(event, representation.etag):
+        return {
+            'statusCode': 304,
+            'headers': headers
+        }
+
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(representation.gzip_body()).decode('ascii')
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': representation.body()
+    }
@@ -0,0 +1,118 @@
+##############
+### Idempotency-Key support for AddMatchup and AddComment
+###
+### A client that retries after a timeout sends the same Idempotency-Key header (any
+### string up to MAX_KEY_LENGTH, a UUID is typical) and gets the first response back
+### instead of a second matchup or comment. The key, scoped by operation and by the
+### principal UserAuth authenticated (so two users sending the same key never share an
+### outcome), is hashed into the write's request id (see writes.py), so:
+###
+###   - a replay answered by the same warm container is served from a bounded TTL cache
+###     of recent outcomes without touching S3
+###   - a replay reaching another container finds the stored outcome under
+###     writes/<request id>.json (one GET, kept for a day by the bucket lifecycle)
+###   - a replay of a write still queued is dropped by the FIFO queue's deduplication
+###     (same MessageDeduplicationId) and waits for the same outcome
+###
+### Each outcome remembers a hash of the request body. Reusing a key with a different
+### body gets a 422 instead of either response. Replays are counted in the
+### IdempotentReplays metric and answered with an Idempotent-Replayed: true header.
+
+import time
+import uuid
+import hashlib
+from stormcommon.cache import TTLCache
+from stormcommon.http import get_header
+from stormcommon import metrics, writes
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# As long as the stored outcomes live (writes/ expires after a day)
+TTL_SECONDS = 24 * 3600
+
+# Outcomes by request id, per warm container
+outcome_cache = TTLCache(max_entries=256)
+
+_NAMESPACE = uuid.UUID('5d9f4c1e-3b7a-4f0e-9a61-2c8e7d4b1f35')
+
+
+class InvalidKey(ValueError):
+    """
+    An Idempotency-Key header that is empty or too long
+    """
+
+
+def get_key(event):
+    """
+    The request's Idempotency-Key, None without one
+    """
+    key = get_header(event, HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise InvalidKey(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters')
+    return key
+
+
+def get_principal(event):
+    """
+    The principal UserAuth passed in its authorizer context, '' without one
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    return (authorizer.get('lambda') or {}).get('principal') or ''
+
+
+def request_id(op, principal, key):
+    return str(uuid.uuid5(_NAMESPACE, f'{op}\n{principal}\n{key}'))
+
+
+def fingerprint(event):
+    body = event.get('body') or ''
+    return hashlib.sha256(body.encode('utf-8') if isinstance(body, str) else body).hexdigest()
+
+
+def _final(status_code):
+    # Not yet applied (202) or worth retrying (503, 5xx): a replay should try again
+    return status_code < 500 and status_code != 202
+
+
+def replayed(store, request_id, body_hash):
+    """
+    (status code, body) of the earlier write with request_id, None if there is none yet
+    """
+    outcome = outcome_cache.get(request_id)
+    if outcome is None:
+        outcome = store.get_record(writes.outcome_key(request_id))
+        if outcome is None or not _final(outcome['status']):
+            return None
+        outcome_cache.put(request_id, outcome, time.time() + TTL_SECONDS)
+
+    if outcome.get('fingerprint') not in (None, body_hash):
+        return 422, {'error': 'Idempotency key reused',
+                     'message': f'{HEADER} was already used with a different request body'}
+    metrics.count(metrics.IDEMPOTENT_REPLAYS)
+    return outcome['status'], outcome['body']
+
+
+def submit(store, event, op, payload):
+    """
+    writes.submit, deduplicated by the request's Idempotency-Key if it has one. Returns
+    (status code, body, extra headers). Raises InvalidKey for a malformed key.
+    """
+    key = get_key(event)
+    if key is None:
+        return (*writes.submit(store, op, payload), None)
+
+    write_id = request_id(op, get_principal(event), key)
+    body_hash = fingerprint(event)
+    replay = replayed(store, write_id, body_hash)
+    if replay is not None:
+        return (*replay, {'Idempotent-Replayed': 'true'})
+
+    status_code, body = writes.submit(store, op, payload, write_id, body_hash)
+    if _final(status_code):
+        outcome_cache.put(write_id, {'status': status_code, 'body': body, 'fingerprint': body_hash},
+                          time.time() + TTL_SECONDS)
+    return status_code, body, None
@@ -0,0 +1,138 @@
+##############
+### Presorted matchup indexes and cursor pagination
+###
+### GET /matchups serves any sport/sort/page combination by slicing a presorted list
+### instead of sorting. The indexes and the lookup below are derived from the manifest
+### entries and never stored: whoever reads a manifest builds them on first use and keeps
+### them on the parsed manifest, so a reader caching the manifest (GetMatchups) builds
+### them once per manifest version, and a write does not rewrite them. Writers keep the
+### lookup current as they change entries and drop the indexes (see storage.py).
+###
+### manifest['indexes'] = {
+###     'all' | <sport>: {
+###         'date' | 'total_score': [[sort_value, id], ...]   (ascending)
+###     }
+### }
+
+import json
+import base64
+from bisect import bisect_left
+from stormcommon.matchups import SCORE_FIELDS, score_value
+
+ALL_SPORTS = 'all'
+SORT_FIELDS = ['date', 'total_score']
+DEFAULT_SORT = 'date'
+
+# Manifest keys built from its entries, left out when the manifest is stored
+DERIVED_KEYS = ['indexes', 'lookup']
+
+
+def total_score(matchup):
+    # Scores are validated on write (matchups.invalid_score); one stored before that
+    # counts as 0 rather than failing the write that touches it
+    return round(sum(score_value(matchup.get(field) or 0) or 0 for field in SCORE_FIELDS), 4)
+
+
+def build_indexes(entries):
+    """
+    Build the per-sport presorted indexes from manifest entries
+    """
+    groups = {ALL_SPORTS: entries}
+    for entry in entries:
+        groups.setdefault(entry.get('sport') or 'unknown', []).append(entry)
+
+    indexes = {}
+    for sport, group in groups.items():
+        indexes[sport] = {
+            field: sorted([entry.get(field) or _missing(field), entry['id']] for entry in group)
+            for field in SORT_FIELDS
+        }
+    return indexes
+
+
+def _missing(field):
+    return 0 if field == 'total_score' else ''
+
+
+def get_indexes(manifest):
+    """
+    Indexes of the manifest, built from its entries on first use
+    """
+    if 'indexes' not in manifest:
+        manifest['indexes'] = build_indexes(manifest['matchups'])
+    return manifest['indexes']
+
+
+##############
+### Lookup: where a matchup lives, by id and by natural key
+###
+### manifest['lookup'] = {
+###     'id':  {id: position in manifest['matchups']},
+###     'key': {'winner|loser|date': id}
+### }
+
+def natural_key(winner, loser, date):
+    return f'{winner}|{loser}|{date}'
+
+
+def build_lookup(entries):
+    return {
+        'id': {entry['id']: position for position, entry in enumerate(entries)},
+        'key': {natural_key(entry['winner'], entry['loser'], entry['date']): entry['id']
+                for entry in entries}
+    }
+
+
+def get_lookup(manifest):
+    """
+    Lookup of the manifest, built from its entries on first use
+    """
+    if 'lookup' not in manifest:
+        manifest['lookup'] = build_lookup(manifest['matchups'])
+    return manifest['lookup']
+
+
+##############
+### Cursors are opaque to the client: base64 of the [sort_value, id] of the last item served
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Raises ValueError for a malformed cursor
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, list) or len(position) != 2:
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def query_page(manifest, sport=None, sort=DEFAULT_SORT, limit=None, cursor=None):
+    """
+    Returns (ids, next_cursor, total) for one page, highest sort value first.
+    limit None returns everything after the cursor.
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f'sort must be one of {", ".join(SORT_FIELDS)}')
+
+    index = get_indexes(manifest).get(sport or ALL_SPORTS, {}).get(sort, [])
+
+    # Items are read from the end of the ascending list backwards
+    end = len(index)
+    if cursor:
+        try:
+            end = bisect_left(index, decode_cursor(cursor))
+        except TypeError:
+            # Cursor from a different sort order
+            raise ValueError('Invalid cursor')
+
+    start = 0 if limit is None else max(0, end - limit)
+    page = index[start:end][::-1]
+
+    next_cursor = encode_cursor(page[-1]) if page and start > 0 else None
+    return [item[1] for item in page], next_cursor, len(index)
@@ -0,0 +1,139 @@
+##############
+### Matchup validation and the metadata every writer stamps on a matchup
+###
+### AddMatchup, EditMatchup and the bulk import all go through these, so a matchup
+### accepted one way is accepted every way.
+
+import math
+import uuid
+from datetime import datetime
+
+REQUIRED_FIELDS = ['winner', 'loser', 'date', 'upset_score', 'impact_score', 'excitement_score',
+                   'upset_rationale', 'impact_rationale', 'excitement_rationale', 'overall_discussion']
+
+# Required fields holding a number (or a numeric string, as forms send them)
+SCORE_FIELDS = ['upset_score', 'impact_score', 'excitement_score']
+
+# Natural key, used by edits that do not carry an id
+KEY_FIELDS = ['winner', 'loser', 'date']
+
+# Fields a client cannot set; they are kept from the stored matchup
+PROTECTED_FIELDS = ['id', 'created_at']
+
+# Maintained by the comment stream (see comments.py), never taken from a client
+COMMENT_FIELDS = ['comments', 'comment_count']
+
+
+def missing_field(matchup):
+    """
+    First required field that is absent or empty, or None if the matchup is complete
+    """
+    for field in REQUIRED_FIELDS:
+        if field not in matchup or matchup[field] == '':
+            return field
+    return None
+
+
+def score_value(value):
+    """
+    A score as a float, None if it is not a finite number
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def invalid_score(matchup):
+    """
+    First score field that is not a number, or None if every one is
+    """
+    for field in SCORE_FIELDS:
+        if field in matchup and score_value(matchup[field]) is None:
+            return field
+    return None
+
+
+def missing_key_field(matchup):
+    for field in KEY_FIELDS:
+        if field not in matchup:
+            return field
+    return None
+
+
+def new_matchup(matchup_data):
+    """
+    Add id, created_at, comment_count and default ranks to a validated new matchup (in place)
+    """
+    for field in COMMENT_FIELDS:
+        matchup_data.pop(field, None)
+
+    matchup_data['id'] = str(uuid.uuid4())
+    matchup_data['created_at'] = datetime.utcnow().isoformat()
+    matchup_data['comment_count'] = 0
+
+    # Ensure optional fields have default values
+    matchup_data['winner_rank'] = matchup_data.get('winner_rank', '')
+    matchup_data['loser_rank'] = matchup_data.get('loser_rank', '')
+    return matchup_data
+
+
+def merge_patch(target, patch):
+    """
+    JSON Merge Patch (RFC 7386): objects merge recursively, null removes a member,
+    anything else replaces the target
+    """
+    if not isinstance(patch, dict):
+        return patch
+
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def merge_edit(existing_matchup, matchup_data):
+    """
+    Existing matchup with matchup_data applied as a merge patch, keeping its id,
+    created_at and comment fields
+    """
+    edits = {field: value for field, value in matchup_data.items()
+             if field not in PROTECTED_FIELDS and field not in COMMENT_FIELDS}
+    updated_matchup = merge_patch(existing_matchup, edits)
+
+    updated_matchup['updated_at'] = datetime.utcnow().isoformat()
+    return updated_matchup
+
+
+def key_changed(existing_matchup, updated_matchup):
+    """
+    True if an edit moves a matchup to another winner, loser or date
+    """
+    return any(existing_matchup.get(field) != updated_matchup.get(field) for field in KEY_FIELDS)
+
+
+def is_unchanged(existing_matchup, updated_matchup):
+    """
+    True if an edit changed nothing but updated_at, so it does not need to be written
+    """
+    ignore = {'updated_at'}
+    return ({k: v for k, v in existing_matchup.items() if k not in ignore} ==
+            {k: v for k, v in updated_matchup.items() if k not in ignore})
+
+
+def comment_count_only(old_matchup, new_matchup):
+    """
+    True if a change to a stored matchup moved nothing but its comment_count, as adding
+    a comment does
+    """
+    if old_matchup is None:
+        return False
+    ignore = {'comment_count'}
+    return ({k: v for k, v in old_matchup.items() if k not in ignore} ==
+            {k: v for k, v in new_matchup.items() if k not in ignore})
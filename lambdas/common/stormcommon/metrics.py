@@ -0,0 +1,190 @@
+##############
+### Per-phase timing, emitted as CloudWatch Embedded Metric Format (EMF)
+###
+### A handler decorated with @instrument('<Function>') records how long each phase of
+### the invocation takes:
+###
+###     S3Get       get_object and list_objects_v2
+###     S3Put       put_object
+###     Parse       request bodies and stored objects into Python data
+###     Search      sorting, index builds and index lookups
+###     Serialize   responses and stored objects into bytes, gzip included
+###     AuthInvoke  the BLR authorizer invoke
+###     QueueWait   waiting for a queued write to be applied (see writes.py)
+###     RetryWait   backing off before retrying a write that lost a race (concurrency.py)
+###
+### plus counts of events (count()): Conflicts, conditional writes rejected because
+### another writer got there first, Retries, writes re-applied after one,
+### IdempotentReplays, retried requests answered from an earlier outcome, and CacheHits
+### and CacheMisses, UserAuth decisions and GetMatchups responses (by their X-Cache)
+### served from a warm cache or not (a revalidated entry is a hit). It prints
+### one JSON line when the invocation ends. CloudWatch Logs turns it into
+### metrics in the Stormalytics namespace, dimension Function, with no API call or extra
+### latency. Phases run on the store's thread pool add up their time, so S3Get can
+### exceed the wall-clock Duration.
+###
+### STORM_METRICS_SAMPLE_RATE (Lambda environment, 0 to 1, default 1) sets the share of
+### invocations recorded; 0 turns instrumentation off and phase() costs one check.
+
+import os
+import json
+import time
+import random
+import functools
+import threading
+from contextlib import contextmanager
+
+NAMESPACE = 'Stormalytics'
+
+S3_GET = 'S3Get'
+S3_PUT = 'S3Put'
+PARSE = 'Parse'
+SEARCH = 'Search'
+SERIALIZE = 'Serialize'
+AUTH_INVOKE = 'AuthInvoke'
+QUEUE_WAIT = 'QueueWait'
+RETRY_WAIT = 'RetryWait'
+
+CONFLICTS = 'Conflicts'
+RETRIES = 'Retries'
+IDEMPOTENT_REPLAYS = 'IdempotentReplays'
+CACHE_HITS = 'CacheHits'
+CACHE_MISSES = 'CacheMisses'
+
+
+def _sample_rate():
+    try:
+        rate = float(os.environ.get('STORM_METRICS_SAMPLE_RATE', '1'))
+    except ValueError:
+        return 1.0
+    return min(max(rate, 0.0), 1.0)
+
+
+SAMPLE_RATE = _sample_rate()
+
+# Invocation being recorded, None when this one is not sampled (or outside a handler)
+_current = None
+
+_cold_start = True
+
+
+class Invocation:
+    def __init__(self, function):
+        self.function = function
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.calls = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def record(self, status_code, cold_start):
+        """
+        EMF document for the finished invocation
+        """
+        values = {'Duration': (time.perf_counter() - self.started) * 1000}
+        values.update((phase, seconds * 1000) for phase, seconds in self.phases.items())
+        metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in values]
+        metrics.extend({'Name': name, 'Unit': 'Count'} for name in self.counts)
+
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Function']],
+                    'Metrics': metrics
+                }]
+            },
+            'Function': self.function,
+            **{name: round(value, 3) for name, value in values.items()},
+            **self.counts,
+            'PhaseCalls': self.calls,
+            'StatusCode': status_code,
+            'ColdStart': cold_start,
+            'SampleRate': SAMPLE_RATE
+        }
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the enclosed block as part of phase name, if this invocation is recorded
+    """
+    invocation = _current
+    if invocation is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        invocation.add(name, time.perf_counter() - start)
+
+
+def count(name, value=1):
+    """
+    Add value to the count name, if this invocation is recorded
+    """
+    invocation = _current
+    if invocation is not None:
+        invocation.count(name, value)
+
+
+def timed(name):
+    """
+    Decorator form of phase()
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(function):
+    """
+    Decorator for lambda_handler: records a sampled share of invocations and prints
+    their EMF line
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _current, _cold_start
+            cold_start, _cold_start = _cold_start, False
+
+            if SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE:
+                return handler(event, context)
+
+            _current = Invocation(function)
+            result = None
+            try:
+                result = handler(event, context)
+                return result
+            finally:
+                invocation, _current = _current, None
+                status_code = result.get('statusCode') if isinstance(result, dict) else None
+                print(json.dumps(invocation.record(status_code, cold_start), separators=(',', ':')))
+        return wrapper
+    return decorator
+
+
+def truncate(value, limit=200):
+    """
+    str(value) cut to limit characters, for logging payloads without dumping them whole
+    """
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    return f'{text[:limit]}... ({len(text)} chars)'
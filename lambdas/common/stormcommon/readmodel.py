@@ -0,0 +1,467 @@
+##############
+### Pre-rendered read model published by the writers
+###
+### read/all.json(.gz)        every matchup, most recent first
+### read/<sport>.json(.gz)    one sport, most recent first
+###
+### Each view is the exact response body for an unpaginated GET /matchups, serialized
+### as compact JSON and also stored gzip-compressed, so GetMatchups can return the
+### bytes as-is. A write republishes only the views containing the matchup it changed,
+### each spliced under a precondition and re-spliced if another writer published first.
+### A missing view is built from the manifest by the next write that touches it.
+### Views carry the change log version they were rendered at, for ?since= delta syncs.
+###
+### STORM_READ_PARTITION splits the full listing over several views instead of all.json,
+### so a write rewrites one partition rather than every matchup:
+###
+###     none        read/all.json (the default)
+###     sport       the sport views themselves
+###     season      read/season-<year>.json, seasons running July to June
+###     shards:<n>  read/shard-<k>.json, matchups spread over n shards by id
+###
+### GetMatchups then fetches the listing's views in parallel and merges them (each is
+### already sorted) with a k-way merge. Sport views are published under every setting.
+### After changing it, dev/publish_read_model.py publishes the new views.
+###
+### Every sport view published is also copied to the public bucket as a static snapshot
+### CloudFront serves (see snapshots.py).
+###
+### Views hold the open seasons only. Once a season is sealed (see archive.py) they list
+### it under archived_seasons instead, for readers to load with ?sport=&season=.
+###
+### A comment is not republished: a change to nothing but a matchup's comment_count
+### leaves the views (and so the snapshots) as they are, at their version. GetMatchups
+### overlays the counts of the matchups changed since a view's version from their
+### manifest entries (comment_counts), and the frontend delta syncs a snapshot from its
+### version right after loading it. The next splice of a view takes every comment_count
+### it keeps from the manifest entries.
+###
+### Writers never hold a whole view: a splice streams the stored view (see streaming.py),
+### merges the batch into it and streams the result to both copies through multipart
+### uploads, so its memory stays flat as the views grow. The body is written header
+### first: {version, last_updated, [archived_seasons], matchups, total_matchups}.
+
+import os
+import zlib
+import heapq
+import hashlib
+from stormcommon.indexes import ALL_SPORTS, get_lookup
+from stormcommon.storage import ConditionFailed, if_unchanged
+from stormcommon import runtime, metrics, changelog, concurrency, snapshots, streaming
+from stormcommon import matchups as matchup_rules
+
+READ_PREFIX = 'read/'
+
+PARTITION = os.environ.get('STORM_READ_PARTITION') or 'none'
+
+# Matchup objects fetched at a time when a view is rendered from the manifest
+FETCH_BATCH = 64
+
+
+def view_key(view, compressed=False):
+    return f'{READ_PREFIX}{view}.json' + ('.gz' if compressed else '')
+
+
+def season(date):
+    """
+    Season a date falls in, named by the year it starts in: July to June, so a football
+    (August to January) or basketball (November to April) season is never split
+    """
+    try:
+        year, month = int(date[:4]), int(date[5:7])
+    except (TypeError, ValueError):
+        return 'unknown'
+    return str(year if month >= 7 else year - 1)
+
+
+def sport_view(item):
+    return item.get('sport') or 'unknown'
+
+
+def partition_view(item, partition=None):
+    """
+    View holding item (a matchup or its manifest entry) in the full listing
+    """
+    partition = partition or PARTITION
+    if partition == 'none':
+        return ALL_SPORTS
+    if partition == 'sport':
+        return sport_view(item)
+    if partition == 'season':
+        return f'season-{season(item.get("date"))}'
+    if partition.startswith('shards:'):
+        return f'shard-{zlib.crc32(item["id"].encode("utf-8")) % int(partition[7:])}'
+    raise ValueError(f'Unknown read model partition {partition}')
+
+
+def views_of(item, partition=None):
+    """
+    Every view item appears in
+    """
+    return {sport_view(item), partition_view(item, partition)}
+
+
+def listing_views(manifest, partition=None):
+    """
+    Views the full listing is made of, in name order
+    """
+    if (partition or PARTITION) == 'none':
+        return [ALL_SPORTS]
+    return sorted({partition_view(entry, partition) for entry in manifest['matchups']})
+
+
+def listing_key(matchup):
+    """
+    Views are sorted on this, highest first: most recent, ties broken the same way as
+    the date index
+    """
+    return (matchup.get('date') or '', matchup.get('id') or '')
+
+
+def sort_matchups(matchups):
+    with metrics.phase(metrics.SEARCH):
+        matchups.sort(key=listing_key, reverse=True)
+
+
+def merge_views(documents):
+    """
+    Full listing body from the bodies of the views it is partitioned into, by a k-way
+    merge of their sorted matchups. A matchup caught moving between views (its old view
+    spliced, its new one not yet, or the reverse) keeps the copy from the later version.
+    The listing carries the oldest view's version, so a ?since= sync from it repeats
+    changes rather than missing them.
+    """
+    with metrics.phase(metrics.SEARCH):
+        owner = {}
+        for index, document in enumerate(documents):
+            for matchup in document['matchups']:
+                other = owner.get(matchup['id'])
+                if other is None or documents[other].get('version', 0) < document.get('version', 0):
+                    owner[matchup['id']] = index
+
+        def owned(index, document):
+            return (matchup for matchup in document['matchups'] if owner[matchup['id']] == index)
+
+        matchups = list(heapq.merge(*(owned(index, document) for index, document in enumerate(documents)),
+                                    key=listing_key, reverse=True))
+
+    merged = {
+        'matchups': matchups,
+        'last_updated': max((d['last_updated'] for d in documents if d.get('last_updated')), default=None),
+        'total_matchups': len(matchups),
+        'version': min((d.get('version', 0) for d in documents), default=0)
+    }
+    sealed = {(s['sport'], s['season']): s for d in documents for s in d.get('archived_seasons', [])}
+    if sealed:
+        merged['archived_seasons'] = _sorted_seasons(sealed.values())
+    return merged
+
+
+def _sorted_seasons(seasons):
+    return sorted(seasons, key=lambda s: (s['sport'], -int(s['season']) if s['season'].isdigit() else 0))
+
+
+def archived_seasons(manifest, sport=None):
+    """
+    Sealed seasons (of one sport, or all), by sport then most recent first
+    """
+    return _sorted_seasons({'sport': s['sport'], 'season': s['season'], 'total_matchups': s['total_matchups']}
+                           for s in manifest.get('archive', {}).values() if sport in (None, s['sport']))
+
+
+def view_fields(manifest, view=None):
+    """
+    Fields of a view body written ahead of its matchups
+    """
+    fields = {'version': changelog.version(manifest), 'last_updated': manifest['last_updated']}
+    # A sport view lists its sport's sealed seasons, a listing view every sport's
+    listing = view is None or view == ALL_SPORTS or view.startswith(('season-', 'shard-'))
+    sealed = archived_seasons(manifest, None if listing else view)
+    if sealed:
+        fields['archived_seasons'] = sealed
+    return fields
+
+
+def publish_view(store, view, matchups, manifest, condition=None):
+    """
+    Write one view in both encodings, a chunk at a time. matchups is a list (sorted
+    here) or an iterable already in listing order, consumed as it is written. Returns
+    {'key', 'etag', 'sha256', 'version', 'total_matchups'} of the plain JSON.
+    condition applies to the plain JSON, completed last: a writer that loses the race
+    rewrites both copies on its retry, so the last gzip copy always matches.
+    """
+    if isinstance(matchups, list):
+        sort_matchups(matchups)
+
+    total = 0
+
+    def counted():
+        nonlocal total
+        for matchup in matchups:
+            total += 1
+            yield matchup
+
+    plain = store.open_writer(view_key(view))
+    compressed = store.open_writer(view_key(view, compressed=True), content_encoding='gzip')
+    # wbits 31: a gzip container, as gzip.compress writes
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    digest = hashlib.sha256()
+    try:
+        for chunk in streaming.iter_document(view_fields(manifest, view), 'matchups', counted(),
+                                             lambda: {'total_matchups': total}):
+            plain.write(chunk)
+            with metrics.phase(metrics.SERIALIZE):
+                digest.update(chunk)
+                gzip_chunk = compressor.compress(chunk)
+            compressed.write(gzip_chunk)
+        with metrics.phase(metrics.SERIALIZE):
+            gzip_chunk = compressor.flush()
+        compressed.write(gzip_chunk)
+        compressed.close()
+        etag = plain.close(condition)
+    except BaseException:
+        compressed.abort()
+        plain.abort()
+        raise
+
+    return {'key': view_key(view), 'etag': etag, 'sha256': digest.hexdigest(),
+            'version': changelog.version(manifest), 'total_matchups': total}
+
+
+def load_view(store, view):
+    """
+    Matchups in a published view, or None if it has not been published yet
+    """
+    document = load_view_and_etag(store, view)[0]
+    return document['matchups'] if document is not None else None
+
+
+def load_view_and_etag(store, view):
+    """
+    (view body, ETag of the plain JSON) of a published view, (None, None) if unpublished
+    """
+    body, etag = store.get_bytes_and_etag(view_key(view))
+    if body is None:
+        return None, None
+    with metrics.phase(metrics.PARSE):
+        return runtime.loads(body), etag
+
+
+def load_listing(store, manifest):
+    """
+    Every matchup in the read model, merged from the listing views, or None if any of
+    them has not been published
+    """
+    documents = [load_view_and_etag(store, view)[0] for view in listing_views(manifest)]
+    if any(document is None for document in documents):
+        return None
+    return merge_views(documents)['matchups']
+
+
+def rebuild(store, manifest=None):
+    """
+    Publish every view from the per-matchup objects
+    """
+    if manifest is None:
+        manifest = store.get_manifest()
+    matchups = store.load_matchups(manifest)
+
+    views = {}
+    for matchup in matchups:
+        for view in views_of(matchup):
+            views.setdefault(view, []).append(matchup)
+    for view in listing_views(manifest):
+        views.setdefault(view, [])
+    sports = {sport_view(matchup) for matchup in matchups}
+
+    published = {}
+    for view, view_matchups in views.items():
+        summary = publish_view(store, view, list(view_matchups), manifest)
+        if view in sports:
+            published[view] = summary
+    snapshots.publish(store, published)
+
+
+def publish_matchup(store, manifest, matchup, previous=None):
+    """
+    Splice one added or changed matchup into the views that contain it. previous is
+    the matchup before an edit, so the matchup leaves any view it no longer belongs in.
+    """
+    publish_matchups(store, manifest, [matchup], {matchup['id']: previous})
+
+
+def _from_manifest(store, view):
+    """
+    (current manifest, matchups it lists in view), to render a view afresh. The
+    matchups come in listing order, fetched FETCH_BATCH at a time as they are consumed.
+    """
+    manifest = store.get_manifest()
+    entries = [entry for entry in manifest['matchups'] if view in views_of(entry)]
+    entries.sort(key=listing_key, reverse=True)
+
+    def fetch():
+        for start in range(0, len(entries), FETCH_BATCH):
+            batch = store.get_matchups([entry['id'] for entry in entries[start:start + FETCH_BATCH]])
+            # Ordered by their entries already, unless one changed date in a write in flight
+            yield from sorted(batch, key=listing_key, reverse=True)
+
+    return manifest, fetch()
+
+
+def _drop_view(store, view):
+    # Reads fall back to the manifest and the next write to the view builds it again
+    print(f"Dropping read model view {view} after repeated conflicts")
+    store.delete(view_key(view))
+    store.delete(view_key(view, compressed=True))
+
+
+def republish(store, views, sports=()):
+    """
+    Render views afresh from the current manifest, each under a precondition, after a
+    change that cannot be spliced in (sealing a season). sports are the sport views among
+    them, copied to the snapshots.
+    """
+    published = {}
+
+    def render(view):
+        body, etag = store.get_stream(view_key(view))
+        if body is not None:
+            body.close()
+        manifest, view_matchups = _from_manifest(store, view)
+        summary = publish_view(store, view, view_matchups, manifest, if_unchanged(etag))
+        if view in sports:
+            published[view] = summary
+
+    for view in sorted(views):
+        try:
+            concurrency.with_retries(lambda: render(view))
+        except ConditionFailed:
+            _drop_view(store, view)
+
+    snapshots.publish(store, published)
+
+
+def _entry_etag(manifest, matchup_id):
+    position = get_lookup(manifest)['id'].get(matchup_id)
+    return manifest['matchups'][position].get('etag') if position is not None else None
+
+
+def _with_comment_count(manifest, matchup):
+    """
+    matchup (parsed from a view, so changed in place) with the comment_count of its
+    manifest entry, which comments move without republishing the view
+    """
+    position = get_lookup(manifest)['id'].get(matchup.get('id'))
+    count = manifest['matchups'][position].get('comment_count') if position is not None else None
+    if count is not None:
+        matchup['comment_count'] = count
+    return matchup
+
+
+def stamped_version(gzip_body):
+    """
+    Change log version a view was rendered at, read from its gzip copy without parsing
+    its matchups (the body is written header first)
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    chunks = (decompressor.decompress(gzip_body[start:start + streaming.CHUNK_SIZE])
+              for start in range(0, len(gzip_body), streaming.CHUNK_SIZE))
+    return streaming.StreamedDocument(chunks).fields.get('version', 0)
+
+
+def comment_counts(manifest, view, version):
+    """
+    {id: comment_count} from the manifest entries of the matchups in view changed after
+    version, which a view stamped with version may hold stale counts for. Every matchup
+    in the view if the change log no longer reaches back to version.
+    """
+    try:
+        changed, _ = changelog.changed_since(manifest, version)
+    except changelog.StaleVersion:
+        if version > changelog.version(manifest):
+            # Rendered after this copy of the manifest
+            return {}
+        changed = [entry['id'] for entry in manifest['matchups']]
+
+    positions = get_lookup(manifest)['id']
+    counts = {}
+    for matchup_id in changed:
+        entry = manifest['matchups'][positions[matchup_id]]
+        if entry.get('comment_count') is not None and view in views_of(entry):
+            counts[matchup_id] = entry['comment_count']
+    return counts
+
+
+def with_comment_counts(document, counts):
+    """
+    View document (changed in place) with the comment_count of each matchup in counts
+    """
+    for matchup in document['matchups']:
+        if matchup.get('id') in counts:
+            matchup['comment_count'] = counts[matchup['id']]
+    return document
+
+
+def publish_matchups(store, manifest, matchups, previous=None):
+    """
+    Splice a batch of added or changed matchups into the views that contain them, writing
+    each affected view once. previous maps id to the matchup before an edit.
+    """
+    previous = previous or {}
+    matchups = [matchup for matchup in matchups
+                if not matchup_rules.comment_count_only(previous.get(matchup['id']), matchup)]
+    if not matchups:
+        return
+    changed = {matchup['id']: matchup for matchup in matchups}
+
+    views = set()
+    sports = set()
+    for matchup in matchups:
+        views |= views_of(matchup)
+        sports.add(sport_view(matchup))
+        if previous.get(matchup['id']) is not None:
+            views |= views_of(previous[matchup['id']])
+            sports.add(sport_view(previous[matchup['id']]))
+
+    published = {}
+
+    def splice(view):
+        """
+        Splice the batch into one view under a precondition, streaming the stored view
+        into the new one. A view that does not exist (never published, or dropped) is
+        built from the matchups the manifest lists.
+        """
+        body, etag = store.get_stream(view_key(view))
+        rendered = manifest
+        newer = set()
+        if body is None:
+            # From the current manifest: a view dropped by another writer must include the
+            # matchups that writer committed after this batch was read
+            rendered, view_matchups = _from_manifest(store, view)
+        else:
+            document = streaming.StreamedDocument(streaming.iter_chunks(body))
+            view_matchups = document.items()
+            if document.fields.get('version', 0) > changelog.version(manifest):
+                # A later write has spliced this view already: its copies of matchups
+                # committed again since this batch are newer than ours
+                rendered = store.get_manifest()
+                newer = {matchup_id for matchup_id in changed
+                         if _entry_etag(rendered, matchup_id) != _entry_etag(manifest, matchup_id)}
+
+        kept = (_with_comment_count(rendered, m) for m in view_matchups
+                if m.get('id') not in changed or m.get('id') in newer)
+        added = sorted((m for m in matchups if m['id'] not in newer and view in views_of(m)),
+                       key=listing_key, reverse=True)
+        summary = publish_view(store, view, heapq.merge(kept, added, key=listing_key, reverse=True),
+                               rendered, if_unchanged(etag))
+        if view in sports:
+            published[view] = summary
+
+    for view in sorted(views):
+        try:
+            concurrency.with_retries(lambda: splice(view))
+        except ConditionFailed:
+            # Out of retries: drop the view rather than leave it without this batch
+            _drop_view(store, view)
+
+    snapshots.publish(store, published)
@@ -0,0 +1,106 @@
+##############
+### Shared lambda runtime: AWS clients, JSON codec and response builders
+###
+### Clients are created on first use and kept at module scope, so a container builds each
+### one once. Handlers call s3_client()/lambda_client() at import time to do that work in
+### the init phase rather than on the first request.
+
+import json
+import boto3
+from botocore.config import Config
+from stormcommon import metrics
+
+# Tuned for 128 MB functions: keep connections alive between warm invocations, enough
+# pool slots for the parallel S3 fetches, fail fast and let standard retries back off
+CLIENT_CONFIG = Config(
+    max_pool_connections=16,
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+
+_clients = {}
+
+
+def client(service):
+    if service not in _clients:
+        _clients[service] = boto3.client(service, config=CLIENT_CONFIG)
+    return _clients[service]
+
+
+def s3_client():
+    return client('s3')
+
+
+def lambda_client():
+    return client('lambda')
+
+
+##############
+### JSON codec, used for every request/response body and stored object
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def parse_body(event):
+    """
+    Request body as a dict, whether API Gateway passed a JSON string or an object.
+    Raises json.JSONDecodeError for malformed JSON.
+    """
+    body = event.get('body')
+    if isinstance(body, str):
+        with metrics.phase(metrics.PARSE):
+            return loads(body)
+    return body or {}
+
+
+JSONDecodeError = json.JSONDecodeError
+
+
+##############
+### Responses
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+
+JSON_HEADERS = {'Content-Type': 'application/json', **CORS_HEADERS}
+
+
+def headers(methods=None, extra=None):
+    """
+    JSON + CORS headers, with Access-Control-Allow-Methods when methods is given
+    """
+    result = dict(JSON_HEADERS)
+    if methods:
+        result['Access-Control-Allow-Methods'] = methods
+    if extra:
+        result.update(extra)
+    return result
+
+
+def response(status_code, body, methods=None, extra_headers=None):
+    """
+    body is serialized unless it is already a str
+    """
+    if not isinstance(body, str):
+        with metrics.phase(metrics.SERIALIZE):
+            body = dumps(body)
+    return {
+        'statusCode': status_code,
+        'headers': headers(methods, extra_headers),
+        'body': body
+    }
+
+
+def error_response(status_code, error, message, methods=None):
+    return response(status_code, {'error': error, 'message': message}, methods)
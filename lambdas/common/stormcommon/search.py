@@ -0,0 +1,571 @@
+##############
+### Full-text search over matchup rationales, discussion and comments
+###
+### search/meta.json           {'documents': number of indexed matchups, 'sealed': bool,
+###                             'sequence': last batch number, 'pending': [[number, updates]]}
+### search/terms/<term>.json   {'postings': {matchup_id: {field: [position deltas]}},
+###                             'applied': last batch number folded in}
+### search/sealed/<term>.json  the same, for matchups in sealed seasons (see archive.py)
+###
+### One posting object per term, so a query fetches only the postings of its own terms
+### (plus the records of the page it returns, for snippets) and its cost does not grow
+### with the total amount of text. Fields are the TEXT_FIELDS of the matchup record and
+### 'comment/<name>' for each object in its comment stream. Positions count every token,
+### stop words included, so phrases match across the stop words they skip; positions
+### are stored as deltas to keep the objects small.
+###
+### Writers diff only the terms whose postings changed: an add indexes the new text, an
+### edit diffs old and new text field by field, a comment adds its own terms. The diff is
+### appended to the pending batches in meta.json, one conditional read-modify-write (see
+### concurrency.py) however many terms it touches. Queries read meta.json first and apply
+### the pending batches a term object has not folded in yet. Once COMPACT_BATCHES are
+### pending, the writer that appended the last one folds them into the term objects,
+### each touched term rewritten once for all of them, and drops them from meta.json.
+###
+### The first write to a bucket without meta.json builds the index from the stored
+### matchups and comments; dev/build_search_index.py rebuilds it from scratch. Until
+### then GET /search answers 404.
+###
+### Sealing a season moves its postings from the term objects writers update to the
+### sealed ones, which only the next seal rewrites, so what a write reads and rewrites
+### does not grow with past seasons. Once anything is sealed a query reads both.
+
+import re
+import math
+from concurrent.futures import ThreadPoolExecutor
+from stormcommon import comments, metrics, concurrency
+from stormcommon.storage import LOAD_WORKERS, matchup_key
+
+SEARCH_PREFIX = 'search/'
+META_KEY = f'{SEARCH_PREFIX}meta.json'
+TERM_PREFIX = f'{SEARCH_PREFIX}terms/'
+SEALED_PREFIX = f'{SEARCH_PREFIX}sealed/'
+
+TEXT_FIELDS = ['upset_rationale', 'impact_rationale', 'excitement_rationale', 'overall_discussion']
+COMMENT_FIELD = 'comment/'
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+MAX_TERM_LENGTH = 32
+MAX_QUERY_TERMS = 10
+
+STOP_WORDS = frozenset((
+    'a an and are as at be but by for from has have he in is it its of on or that the their '
+    'they this to was were will with'
+).split())
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+
+# Tokens shown before the first match and in total
+SNIPPET_LEAD = 8
+SNIPPET_TOKENS = 30
+
+PHRASE_BOOST = 2.0
+
+# Term objects are read and written independently, so index updates use the whole
+# S3 connection pool (runtime.CLIENT_CONFIG) rather than LOAD_WORKERS
+TERM_WORKERS = 16
+
+# Pending batches in meta.json that make the next writer fold them into the term objects
+COMPACT_BATCHES = 16
+
+# Matchup fields copied into each result
+RESULT_FIELDS = ['id', 'sport', 'winner', 'loser', 'date']
+
+
+def term_key(term, sealed=False):
+    return f'{SEALED_PREFIX if sealed else TERM_PREFIX}{term}.json'
+
+
+def tokenize(text):
+    """
+    (term, start, end) for every token in text; term is lowercased
+    """
+    return [(match.group().lower(), match.start(), match.end())
+            for match in TOKEN_PATTERN.finditer(text or '')]
+
+
+def is_indexed(term):
+    return term not in STOP_WORDS and len(term) <= MAX_TERM_LENGTH
+
+
+def field_postings(field, text, postings):
+    """
+    Add the positions of each indexed term of text under field to postings
+    """
+    for position, (term, _, _) in enumerate(tokenize(text)):
+        if is_indexed(term):
+            postings.setdefault(term, {}).setdefault(field, []).append(position)
+
+
+def matchup_postings(matchup):
+    """
+    {term: {field: [positions]}} for the text fields of a matchup record
+    """
+    postings = {}
+    if matchup is not None:
+        for field in TEXT_FIELDS:
+            field_postings(field, matchup.get(field), postings)
+    return postings
+
+
+def comment_field(key):
+    return COMMENT_FIELD + key.rsplit('/', 1)[-1]
+
+
+def encode_positions(positions):
+    return [positions[0]] + [b - a for a, b in zip(positions, positions[1:])]
+
+
+def decode_positions(deltas):
+    positions = []
+    total = 0
+    for delta in deltas:
+        total += delta
+        positions.append(total)
+    return positions
+
+
+##############
+### Index maintenance
+
+def get_meta(store):
+    return store.get_record(META_KEY)
+
+
+def _get_all(store, keys):
+    """
+    Objects at keys in parallel, in order, None for any that do not exist
+    """
+    if not keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(TERM_WORKERS, len(keys))) as pool:
+        return list(pool.map(store.get_record, keys))
+
+
+def _list_all(store, prefix):
+    keys = []
+    start_after = None
+    while True:
+        page, truncated = store.list_keys(prefix, start_after)
+        keys.extend(page)
+        if not truncated or not page:
+            return keys
+        start_after = page[-1]
+
+
+def _get_terms(store, terms, meta):
+    """
+    {term: postings} with the batches pending in meta applied, merged with the sealed
+    term objects once anything is sealed
+    """
+    terms = list(terms)
+    keys = [term_key(term) for term in terms]
+    if meta.get('sealed', False):
+        keys += [term_key(term, sealed=True) for term in terms]
+    objects = [obj or {} for obj in _get_all(store, keys)]
+
+    postings = {}
+    for term, obj in zip(terms, objects):
+        postings[term] = obj.get('postings', {})
+        _apply_pending(postings[term], term, obj.get('applied', 0), meta.get('pending', []))
+    for term, sealed_obj in zip(terms, objects[len(terms):]):
+        postings[term] = {**sealed_obj.get('postings', {}), **postings[term]}
+    return postings
+
+
+def _apply_changes(postings, changes):
+    """
+    Apply {matchup_id: [fields to remove, {field: position deltas} to set]} to the
+    postings of one term, in place
+    """
+    for matchup_id, (removed, added) in changes.items():
+        entry = postings.get(matchup_id, {})
+        for field in removed:
+            entry.pop(field, None)
+        entry.update(added)
+        if entry:
+            postings[matchup_id] = entry
+        else:
+            postings.pop(matchup_id, None)
+
+
+def _apply_pending(postings, term, applied, pending):
+    """
+    Apply the pending batches numbered after applied that touch term, oldest first
+    """
+    for number, updates in pending:
+        if number > applied and term in updates:
+            _apply_changes(postings, updates[term])
+
+
+def _compact(store, meta):
+    """
+    Fold the batches pending in meta into the term objects in parallel, each touched term
+    a conditional put retried on conflict, then drop them from meta.json. A term object
+    records the last batch folded in, so a concurrent compaction never folds a batch in
+    twice or rolls a term back. A term left without postings is kept, empty: deleting it
+    could drop postings a concurrent writer just folded in.
+    """
+    pending = meta.get('pending', [])
+    if not pending:
+        return
+    last = pending[-1][0]
+    terms = set()
+    for _, updates in pending:
+        terms |= updates.keys()
+
+    def update(term):
+        def mutate(current):
+            applied = (current or {}).get('applied', 0)
+            if applied >= last:
+                return None
+            postings = (current or {}).get('postings', {})
+            _apply_pending(postings, term, applied, pending)
+            if not postings and current is None:
+                return None
+            return {'postings': postings, 'applied': last}
+
+        concurrency.update_record(store, term_key(term), mutate)
+
+    if terms:
+        with ThreadPoolExecutor(max_workers=min(TERM_WORKERS, len(terms))) as pool:
+            list(pool.map(update, terms))
+
+    def drop(meta):
+        if meta is None:
+            return None
+        meta['pending'] = [batch for batch in meta.get('pending', []) if batch[0] > last]
+        return meta
+
+    concurrency.update_record(store, META_KEY, drop)
+
+
+def _diff(updates, matchup_id, old, new):
+    """
+    Record in updates the terms whose postings differ between old and new
+    ({term: {field: [positions]}} for the same fields). Diffs of other fields of the same
+    matchup (its comments) already in updates are kept.
+    """
+    for term in old.keys() | new.keys():
+        before, after = old.get(term, {}), new.get(term, {})
+        if before != after:
+            removed, added = updates.setdefault(term, {}).get(matchup_id, ([], {}))
+            removed = sorted(set(removed) | (set(before) - set(after)))
+            added = {**added, **{field: encode_positions(p) for field, p in after.items()}}
+            updates[term][matchup_id] = [removed, added]
+
+
+def record_changes(store, changes, new_comments=None, batch=None):
+    """
+    Index (old, new) matchup pairs from one write; old is None for an add. new_comments
+    maps matchup id to comments just added to its stream. The first write to a bucket
+    without an index builds it instead, from the stored matchups and comments (this
+    write's included). A batch id already appended is not appended again.
+    """
+    meta, meta_etag = store.get_record_and_etag(META_KEY)
+    if meta is None:
+        rebuild(store)
+        return
+
+    updates = {}
+    added = 0
+    for old, new in changes:
+        _diff(updates, new['id'], matchup_postings(old), matchup_postings(new))
+        added += old is None
+
+    for matchup_id, matchup_comments in (new_comments or {}).items():
+        postings = {}
+        for comment in matchup_comments:
+            field_postings(comment_field(comments.comment_key(matchup_id, comment)),
+                           comment.get('comment_text'), postings)
+        _diff(updates, matchup_id, {}, postings)
+
+    if not updates and not added and batch is None:
+        return
+
+    def mutate(meta):
+        if meta is None or (batch is not None and meta.get('batch') == batch):
+            return None
+        if batch is not None:
+            meta['batch'] = batch
+        meta['documents'] = meta.get('documents', 0) + added
+        if updates:
+            meta['sequence'] = meta.get('sequence', 0) + 1
+            meta['pending'] = meta.get('pending', []) + [[meta['sequence'], updates]]
+        return meta
+
+    meta = concurrency.update_record(store, META_KEY, mutate, loaded=(meta, meta_etag))
+    if meta is not None and len(meta.get('pending', [])) >= COMPACT_BATCHES:
+        _compact(store, meta)
+
+
+def record_comments(store, matchup_id, new_comments):
+    """
+    Index comments just added to a matchup's stream
+    """
+    if new_comments:
+        record_changes(store, [], {matchup_id: new_comments})
+
+
+def document_postings(store, matchup):
+    """
+    {term: {field: [positions]}} for a matchup record and its comment stream
+    """
+    postings = matchup_postings(matchup)
+    keys = _list_all(store, comments.stream_prefix(matchup['id']))
+    for key, comment in zip(keys, _get_all(store, keys)):
+        if comment is not None:
+            field_postings(comment_field(key), comment.get('comment_text'), postings)
+    return postings
+
+
+def rebuild(store, manifest=None):
+    """
+    Index every matchup and comment from scratch and drop term objects no longer used.
+    Returns (documents, terms).
+    """
+    if manifest is None:
+        manifest = store.get_manifest()
+
+    indexes = {False: {}, True: {}}
+    hot = {entry['id'] for entry in manifest['matchups']}
+    matchups = store.load_matchups(manifest, archived=True)
+    for matchup in matchups:
+        index = indexes[matchup['id'] not in hot]
+        for term, fields in document_postings(store, matchup).items():
+            index.setdefault(term, {})[matchup['id']] = {f: encode_positions(p) for f, p in fields.items()}
+
+    def put(item):
+        sealed, term, postings = item
+        store.put_record(term_key(term, sealed), {'postings': postings})
+
+    items = [(sealed, term, postings) for sealed, index in indexes.items() for term, postings in index.items()]
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+        list(pool.map(put, items))
+
+    # Terms that no longer occur anywhere
+    for sealed, prefix in ((False, TERM_PREFIX), (True, SEALED_PREFIX)):
+        for key in _list_all(store, prefix):
+            if key[len(prefix):-len('.json')] not in indexes[sealed]:
+                store.delete(key)
+
+    store.put_record(META_KEY, {'documents': len(matchups), 'sealed': bool(indexes[True]),
+                                'sequence': 0, 'pending': []})
+    return len(matchups), len(indexes[False].keys() | indexes[True].keys())
+
+
+def seal(store, matchups):
+    """
+    Move the postings of matchups (a season just sealed) to the sealed term objects.
+    Each is added there before it is removed from the term object writers update, so a
+    query never misses it. Does nothing until the index has been built.
+    """
+    meta = get_meta(store)
+    if meta is None:
+        return
+    # Postings still pending would land in the term objects after the season moved out
+    _compact(store, meta)
+    concurrency.update_record(store, META_KEY, lambda meta: None if meta is None or meta.get('sealed') else {**meta, 'sealed': True})
+
+    ids = {matchup['id'] for matchup in matchups}
+    terms = set()
+    for matchup in matchups:
+        terms |= document_postings(store, matchup).keys()
+
+    def drop(current):
+        postings = (current or {}).get('postings', {})
+        if not ids & postings.keys():
+            return None
+        return {'postings': {mid: fields for mid, fields in postings.items() if mid not in ids}}
+
+    def move(term):
+        current, etag = store.get_record_and_etag(term_key(term))
+        moving = {mid: fields for mid, fields in (current or {}).get('postings', {}).items() if mid in ids}
+        if not moving:
+            return
+        concurrency.update_record(store, term_key(term, sealed=True),
+                                  lambda sealed: {'postings': {**(sealed or {}).get('postings', {}), **moving}})
+        concurrency.update_record(store, term_key(term), drop, loaded=(current, etag))
+
+    if terms:
+        with ThreadPoolExecutor(max_workers=min(TERM_WORKERS, len(terms))) as pool:
+            list(pool.map(move, terms))
+
+
+##############
+### Queries
+
+def parse_query(query):
+    """
+    Clauses of a query: each bare word is a clause, and so is each "quoted phrase".
+    A clause is a list of (term, offset from its first term); stop words are dropped
+    but still count for the offsets. Clauses left without terms are dropped.
+    """
+    clauses = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query or ''):
+        tokens = [term for term, _, _ in tokenize(phrase or word)]
+        if word:
+            clauses.extend([(term, 0)] for term in tokens if is_indexed(term))
+            continue
+        clause = [(term, offset) for offset, term in enumerate(tokens) if is_indexed(term)]
+        if clause:
+            first = clause[0][1]
+            clauses.append([(term, offset - first) for term, offset in clause])
+    return clauses
+
+
+def _clause_docs(clause, postings, candidates):
+    """
+    Matchups holding every term of clause (and in candidates, if given), smallest
+    posting list first
+    """
+    lists = sorted((postings[term] for term, _ in clause), key=len)
+    docs = set(lists[0]) if candidates is None else {mid for mid in lists[0] if mid in candidates}
+    for other in lists[1:]:
+        docs = {mid for mid in docs if mid in other}
+    return docs
+
+
+def _clause_matches(clause, postings, docs):
+    """
+    {matchup_id: [(field, start position, end position), ...]} for one clause, over docs
+    """
+    first_term = clause[0][0]
+    span = clause[-1][1]
+    matches = {}
+    for matchup_id in docs:
+        for field, deltas in postings[first_term][matchup_id].items():
+            starts = decode_positions(deltas)
+            for term, offset in clause[1:]:
+                other = postings[term][matchup_id].get(field)
+                if other is None:
+                    starts = []
+                    break
+                positions = set(decode_positions(other))
+                starts = [start for start in starts if start + offset in positions]
+            for start in starts:
+                matches.setdefault(matchup_id, []).append((field, start, start + span))
+    return matches
+
+
+def _clause_counts(clause, postings, docs):
+    """
+    {matchup_id: occurrences} for one clause. A single term is counted from its
+    posting lengths without decoding positions.
+    """
+    if len(clause) == 1:
+        fields = postings[clause[0][0]]
+        return {mid: sum(len(deltas) for deltas in fields[mid].values()) for mid in docs}
+    return {mid: len(spans) for mid, spans in _clause_matches(clause, postings, docs).items()}
+
+
+def search(store, query, limit=DEFAULT_LIMIT):
+    """
+    Matchups containing every clause of query, best first. Returns (total, ranked) where
+    ranked is [(matchup_id, score, spans)] for the first limit matches and spans the
+    matched (field, start, end) token ranges. Returns None if the index is not built.
+    """
+    meta = get_meta(store)
+    if meta is None:
+        return None
+
+    clauses = parse_query(query)[:MAX_QUERY_TERMS]
+    if not clauses:
+        return 0, []
+
+    terms = {term for clause in clauses for term, _ in clause}
+    postings = _get_terms(store, terms, meta)
+
+    documents = max(meta.get('documents', 0), 1)
+    with metrics.phase(metrics.SEARCH):
+        # Rarest clause first, so each later clause only looks at the surviving matchups
+        clauses.sort(key=lambda clause: min(len(postings[term]) for term, _ in clause))
+        scores = None
+        for clause in clauses:
+            counts = _clause_counts(clause, postings, _clause_docs(clause, postings, scores))
+            boost = PHRASE_BOOST if len(clause) > 1 else 1.0
+            idf = sum(math.log(1 + documents / max(len(postings[term]), 1)) for term, _ in clause)
+            scores = {matchup_id: (scores or {}).get(matchup_id, 0.0) + boost * idf * (1 + math.log(count))
+                      for matchup_id, count in counts.items() if count}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+        # Positions are only decoded for the page being returned
+        page = {matchup_id for matchup_id, _ in ranked}
+        spans = {}
+        for clause in clauses:
+            for matchup_id, matches in _clause_matches(clause, postings, page).items():
+                spans.setdefault(matchup_id, []).extend(matches)
+    return len(scores), [(matchup_id, score, spans.get(matchup_id, [])) for matchup_id, score in ranked]
+
+
+def snippet(text, spans):
+    """
+    (snippet, highlights) around the first span: a window of text with its match
+    character ranges, relative to the snippet
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return '', []
+
+    first = min(start for start, _ in spans)
+    lo = max(first - SNIPPET_LEAD, 0)
+    hi = min(lo + SNIPPET_TOKENS, len(tokens)) - 1
+
+    begin, end = tokens[lo][1], tokens[hi][2]
+    prefix = '...' if lo > 0 else ''
+    suffix = '...' if hi < len(tokens) - 1 else ''
+    highlights = [[len(prefix) + tokens[start][1] - begin, len(prefix) + tokens[stop][2] - begin]
+                  for start, stop in sorted(spans) if lo <= start and stop <= hi]
+    return prefix + text[begin:end] + suffix, highlights
+
+
+def best_field(spans):
+    """
+    Field with the most matches, and its (start, end) spans
+    """
+    by_field = {}
+    for field, start, end in spans:
+        by_field.setdefault(field, []).append((start, end))
+    field = max(by_field, key=lambda f: (len(by_field[f]), f in TEXT_FIELDS))
+    return field, by_field[field]
+
+
+def describe(store, ranked):
+    """
+    Response entries for search() results: matchup summary plus a snippet of the field
+    with the most matches. Matchups deleted since they were indexed are skipped.
+    """
+    ids = [matchup_id for matchup_id, _, _ in ranked]
+    records = dict(zip(ids, _get_all(store, [matchup_key(matchup_id) for matchup_id in ids])))
+
+    fields = {matchup_id: best_field(spans) for matchup_id, _, spans in ranked}
+    comment_ids = [matchup_id for matchup_id in ids if fields[matchup_id][0].startswith(COMMENT_FIELD)]
+    comment_records = dict(zip(comment_ids, _get_all(store, [
+        comments.stream_prefix(matchup_id) + fields[matchup_id][0][len(COMMENT_FIELD):]
+        for matchup_id in comment_ids])))
+
+    results = []
+    for matchup_id, score, _ in ranked:
+        matchup = records.get(matchup_id)
+        if matchup is None:
+            continue
+        field, spans = fields[matchup_id]
+        if field.startswith(COMMENT_FIELD):
+            comment = comment_records.get(matchup_id) or {}
+            text = comment.get('comment_text')
+            result_field = 'comment'
+        else:
+            text = matchup.get(field)
+            result_field = field
+
+        snippet_text, highlights = snippet(text, spans)
+        results.append({
+            **{key: matchup.get(key) for key in RESULT_FIELDS},
+            'score': round(score, 4),
+            'field': result_field,
+            'snippet': snippet_text,
+            'highlights': highlights
+        })
+    return results
@@ -0,0 +1,105 @@
+##############
+### Static snapshots of the sport views in the public (CloudFront) bucket
+###
+### data/matchups/<sport>-<hash>.json    a sport view's bytes, named by their SHA-256, so
+###                                      never overwritten: Cache-Control immutable, a year
+### data/matchups/current.json           pointer {'views': {sport: {'key', 'version',
+###                                      'total_matchups'}}, 'retired': [[key, time]], ...}
+###                                      cached for POINTER_MAX_AGE seconds
+###
+### After a write republishes a sport view (see readmodel.py) it copies the object here
+### server-side, so the bytes never pass through the lambda, and swaps the pointer under a
+### precondition, so the frontend loads a sport from CloudFront
+### (one small pointer fetch, then a cached snapshot) and GET /matchups only serves
+### pages, ids, delta syncs and the fallback. The pointer never moves a sport to an
+### older version than it names, so writers finishing out of order cannot roll it back.
+### Snapshots it no longer names are deleted once RETAIN_SECONDS have passed, long after
+### any cached pointer naming them has expired.
+###
+### STORM_SNAPSHOT_BUCKET is the public bucket; without it (local runs, tests) nothing is
+### published. Failures are logged rather than raised: the write has committed, GET
+### /matchups is still current, and the next write to the sport publishes again.
+
+import os
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from stormcommon.storage import MatchupStore, ConditionFailed, if_unchanged, utc_now
+from stormcommon import runtime, concurrency
+
+BUCKET = os.environ.get('STORM_SNAPSHOT_BUCKET') or None
+
+SNAPSHOT_PREFIX = 'data/matchups/'
+POINTER_KEY = f'{SNAPSHOT_PREFIX}current.json'
+
+POINTER_MAX_AGE = 10
+RETAIN_SECONDS = 3600
+
+SNAPSHOT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+POINTER_CACHE_CONTROL = f'public, max-age={POINTER_MAX_AGE}'
+
+
+def snapshot_key(sport, sha256):
+    return f'{SNAPSHOT_PREFIX}{sport}-{sha256[:16]}.json'
+
+
+def publish(store, views):
+    """
+    views maps sport to the summary readmodel.publish_view returned for a freshly
+    published sport view. Copies each to the public bucket and points the pointer at it.
+    A view already rewritten by a later write is skipped: that write publishes its own.
+    """
+    if not BUCKET or not views:
+        return
+
+    public = MatchupStore(store.s3_client, BUCKET)
+    try:
+        entries = {}
+        for sport, view in views.items():
+            key = snapshot_key(sport, view['sha256'])
+            try:
+                public.copy_from(store.bucket_name, view['key'], view['etag'], key,
+                                 cache_control=SNAPSHOT_CACHE_CONTROL)
+            except ConditionFailed:
+                continue
+            entries[sport] = {'key': key, 'version': view['version'], 'total_matchups': view['total_matchups']}
+        if not entries:
+            return
+
+        expired = concurrency.with_retries(lambda: _swap_pointer(public, entries))
+        for key in expired:
+            public.delete(key)
+    except (ClientError, ConditionFailed) as e:
+        print(f"Snapshots of {', '.join(sorted(views))} not published: {e}")
+
+
+def _swap_pointer(public, entries):
+    """
+    Point the pointer at entries (each only if newer than what it names) and retire what
+    they replace. Returns the snapshots to delete: retired ones old enough, and any of
+    entries the pointer never named.
+    """
+    body, etag = public.get_bytes_and_etag(POINTER_KEY)
+    pointer = runtime.loads(body) if body is not None else {'views': {}, 'retired': []}
+
+    now = datetime.utcnow()
+    unused = []
+    for sport, entry in entries.items():
+        current = pointer['views'].get(sport)
+        if current is not None and current['version'] > entry['version']:
+            unused.append(entry['key'])
+            continue
+        if current is not None and current['key'] != entry['key']:
+            pointer['retired'].append([current['key'], now.isoformat()])
+        pointer['views'][sport] = entry
+
+    # A key can come back into use when a view returns to earlier bytes
+    named = {entry['key'] for entry in pointer['views'].values()}
+    cutoff = (now - timedelta(seconds=RETAIN_SECONDS)).isoformat()
+    retired = [item for item in pointer['retired'] if item[0] not in named]
+    pointer['retired'] = [item for item in retired if item[1] >= cutoff]
+    pointer['last_updated'] = utc_now()
+
+    public.put_bytes(POINTER_KEY, runtime.dumps(pointer).encode('utf-8'), condition=if_unchanged(etag),
+                     cache_control=POINTER_CACHE_CONTROL)
+    kept = named | {item[0] for item in pointer['retired']}
+    return [key for key in unused if key not in kept] + [item[0] for item in retired if item[1] < cutoff]
@@ -0,0 +1,280 @@
+##############
+### Aggregates over the archive, kept up to date by the writers
+###
+### stats.json = {
+###     'views': {
+###         'all' | <sport>: {
+###             'matchups': count,
+###             'teams':    {team: {'wins': w, 'losses': l}},
+###             'scores':   {field: {'sum': s, 'sum_sq': s2, 'histogram': {'1.5': count}}},
+###             'verdicts': {verdict: count},
+###             'top':      {field: [[score, id, summary], ...]}   (min-heap)
+###         }
+###     },
+###     'last_updated': ...
+### }
+###
+### Every write applies the difference between the old and new matchup (remove the old
+### contribution, add the new one), so a write costs one small read-modify-write (a
+### conditional put, see concurrency.py) and a GET /stats never scans matchups. Each top
+### heap holds the best TOP_KEEP matchups of its view: a newcomer replaces the smallest,
+### an edited or removed member leaves it. Only when edits push a heap below TOP_N while
+### the view has more matchups is the view rebuilt from the matchup objects.
+
+import heapq
+from stormcommon.indexes import ALL_SPORTS, total_score
+from stormcommon.matchups import score_value
+from stormcommon.storage import ConditionFailed, utc_now
+from stormcommon import concurrency
+
+STATS_KEY = 'stats.json'
+
+SCORE_FIELDS = ['upset_score', 'impact_score', 'excitement_score', 'total_score']
+
+# Served per top list, and kept per heap so edits rarely force a rebuild
+TOP_N = 10
+TOP_KEEP = 2 * TOP_N
+
+HISTOGRAM_WIDTH = 0.5
+
+# Same thresholds as determineVerdict in the frontend, highest first
+VERDICTS = [
+    (4.0, 'Witness History'),
+    (3.0, 'Absolutely Yes'),
+    (2.5, 'Get Out There'),
+    (2.0, 'So Close'),
+    (1.5, 'Absolutely Not')
+]
+
+SUMMARY_FIELDS = ['id', 'sport', 'winner', 'loser', 'date', 'winner_rank', 'loser_rank']
+
+
+def verdict(score):
+    for threshold, name in VERDICTS:
+        if score >= threshold:
+            return name
+    return 'Embarassing' if score > 1.0 else 'Disgraceful'
+
+
+def scores(matchup):
+    values = {field: score_value(matchup.get(field) or 0) or 0.0 for field in SCORE_FIELDS[:-1]}
+    values['total_score'] = total_score(matchup)
+    return values
+
+
+def bucket(score):
+    return f'{(score // HISTOGRAM_WIDTH) * HISTOGRAM_WIDTH:.1f}'
+
+
+def empty_view():
+    return {
+        'matchups': 0,
+        'teams': {},
+        'scores': {field: {'sum': 0.0, 'sum_sq': 0.0, 'histogram': {}} for field in SCORE_FIELDS},
+        'verdicts': {},
+        'top': {field: [] for field in SCORE_FIELDS}
+    }
+
+
+def empty_stats():
+    return {'views': {}, 'last_updated': None}
+
+
+def view_names(matchup):
+    return [ALL_SPORTS, matchup.get('sport') or 'unknown']
+
+
+def _count(counts, key, delta):
+    counts[key] = counts.get(key, 0) + delta
+    if counts[key] <= 0:
+        del counts[key]
+
+
+def _apply_counts(view, matchup, sign):
+    """
+    Add (sign 1) or remove (sign -1) a matchup's counts, sums and histograms
+    """
+    view['matchups'] += sign
+
+    for team, column in ((matchup.get('winner'), 'wins'), (matchup.get('loser'), 'losses')):
+        record = view['teams'].setdefault(team, {'wins': 0, 'losses': 0})
+        record[column] += sign
+        if record['wins'] <= 0 and record['losses'] <= 0:
+            del view['teams'][team]
+
+    values = scores(matchup)
+    for field, value in values.items():
+        aggregate = view['scores'][field]
+        aggregate['sum'] += sign * value
+        aggregate['sum_sq'] += sign * value * value
+        _count(aggregate['histogram'], bucket(value), sign)
+    _count(view['verdicts'], verdict(values['total_score']), sign)
+
+
+def _remove_top(view, matchup_id):
+    for field, heap in view['top'].items():
+        kept = [item for item in heap if item[1] != matchup_id]
+        if len(kept) != len(heap):
+            heapq.heapify(kept)
+            view['top'][field] = kept
+
+
+def _add_top(view, matchup, complete):
+    """
+    complete maps field to whether the heap held every matchup in the view before this
+    one was counted; an incomplete heap only takes matchups that beat its smallest member
+    """
+    summary = {field: matchup.get(field) for field in SUMMARY_FIELDS}
+    for field, value in scores(matchup).items():
+        heap = view['top'][field]
+        item = [value, matchup['id'], {**summary, field: value}]
+        if len(heap) < TOP_KEEP and (complete[field] or (heap and item[:2] > heap[0][:2])):
+            heapq.heappush(heap, item)
+        elif heap and item[:2] > heap[0][:2]:
+            heapq.heappushpop(heap, item)
+
+
+def apply_change(stats, old, new):
+    """
+    Update stats for one write: old is the matchup before it (None for an add), new the
+    matchup after it (None for a delete). Returns the names of views whose top heaps ran
+    short and need a rebuild.
+    """
+    views = stats['views']
+
+    if old is not None:
+        for name in view_names(old):
+            view = views.setdefault(name, empty_view())
+            _apply_counts(view, old, -1)
+            _remove_top(view, old['id'])
+
+    if new is not None:
+        for name in view_names(new):
+            view = views.setdefault(name, empty_view())
+            complete = {field: len(heap) >= view['matchups'] for field, heap in view['top'].items()}
+            _apply_counts(view, new, 1)
+            _add_top(view, new, complete)
+
+    short = set()
+    for name, view in list(views.items()):
+        if view['matchups'] <= 0:
+            del views[name]
+        elif any(len(heap) < min(TOP_N, view['matchups']) for heap in view['top'].values()):
+            short.add(name)
+    return short
+
+
+def build(matchups):
+    """
+    Stats computed from scratch
+    """
+    stats = empty_stats()
+    for matchup in matchups:
+        apply_change(stats, None, matchup)
+    return stats
+
+
+def get_stats(store):
+    return store.get_record(STATS_KEY)
+
+
+def put_stats(store, stats):
+    stats['last_updated'] = utc_now()
+    store.put_record(STATS_KEY, stats)
+
+
+def rebuild(store, manifest=None):
+    """
+    Recompute every view from the matchup objects (first run, or after a migration)
+    """
+    if manifest is None:
+        manifest = store.get_manifest()
+    stats = build(store.load_matchups(manifest, archived=True))
+    put_stats(store, stats)
+    return stats
+
+
+def record_changes(store, manifest, changes, batch=None):
+    """
+    Apply (old, new) matchup pairs from one write and store the stats, re-applying them
+    to fresh stats if another writer stored in between. A missing stats object, or a top
+    heap run short, is rebuilt from the matchup objects; stats that still conflict after
+    the retries are dropped, to be rebuilt that way by the next write. With a batch id
+    the stats remember it, and a batch already applied is skipped (a retried queue
+    batch, see writes.py).
+    """
+    def mutate(stats):
+        if stats is None:
+            stats = build(store.load_matchups(manifest, archived=True))
+        elif batch is not None and stats.get('batch') == batch:
+            return None
+        else:
+            short = set()
+            for old, new in changes:
+                short |= apply_change(stats, old, new)
+
+            if short:
+                matchups = store.load_matchups(manifest, archived=True)
+                rebuilt = build(matchups)['views']
+                for name in short:
+                    if name in rebuilt:
+                        stats['views'][name] = rebuilt[name]
+
+        if batch is not None:
+            stats['batch'] = batch
+        stats['last_updated'] = utc_now()
+        return stats
+
+    try:
+        return concurrency.update_record(store, STATS_KEY, mutate)
+    except ConditionFailed:
+        # Out of retries: a missing stats object is rebuilt by the next write
+        print("Dropping stats after repeated conflicts")
+        store.delete(STATS_KEY)
+        return None
+
+
+def record_change(store, manifest, old, new):
+    return record_changes(store, manifest, [(old, new)])
+
+
+##############
+### Serving
+
+def summarize(stats, sport=None, top=TOP_N):
+    """
+    Response body for GET /stats: one view with means, standard deviations, sorted
+    top lists and teams. Returns None if there is no such view.
+    """
+    view = stats['views'].get(sport or ALL_SPORTS)
+    if view is None:
+        return None
+
+    count = view['matchups']
+    score_summary = {}
+    for field, aggregate in view['scores'].items():
+        mean = aggregate['sum'] / count
+        variance = max(aggregate['sum_sq'] / count - mean * mean, 0.0)
+        score_summary[field] = {
+            'mean': round(mean, 3),
+            'stddev': round(variance ** 0.5, 3),
+            'histogram': dict(sorted(aggregate['histogram'].items(), key=lambda item: float(item[0])))
+        }
+
+    teams = sorted(({'team': team, **record} for team, record in view['teams'].items()),
+                   key=lambda t: (-(t['wins'] + t['losses']), -t['wins'], str(t['team'])))
+
+    body = {
+        'sport': sport or ALL_SPORTS,
+        'total_matchups': count,
+        'teams': teams,
+        'scores': score_summary,
+        'verdicts': view['verdicts'],
+        'top': {field: [item[2] for item in heapq.nlargest(top, heap, key=lambda item: item[:2])]
+                for field, heap in view['top'].items()},
+        'last_updated': stats['last_updated']
+    }
+    if not sport:
+        body['sports'] = {name: other['matchups'] for name, other in sorted(stats['views'].items())
+                          if name != ALL_SPORTS}
+    return body
@@ -0,0 +1,529 @@
+##############
+### Matchup storage layout in the private S3 bucket
+###
+### manifest.json          small index: one entry per matchup (the presorted indexes and
+###                        the id/natural key lookup are derived from them, see
+###                        indexes.py) plus last_updated/total_matchups and the change log
+###                        for delta sync (see changelog.py)
+### matchups/<id>.json     full matchup record, with comment_count but not the comments
+###                        (those live under comments/<id>/, see comments.py)
+### archive/               sealed seasons, listed in the manifest's 'archive' instead of
+###                        its entries (see archive.py)
+###
+### Writers only touch the matchup object they change plus the manifest, so the cost
+### of a write no longer grows with the size of the archive. Objects are encoded with the
+### store's codec (see codecs.py); the keys keep their .json names either way.
+###
+### Puts can carry a precondition (if_unchanged(etag)): S3 rejects the write if the
+### object changed since it was read, and the store raises ConditionFailed so the writer
+### can re-read and re-apply its change (see concurrency.py).
+###
+### Objects too large to hold whole (the read model views) are read with get_stream() and
+### written a chunk at a time through open_writer(), see streaming.py.
+
+import gzip
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from stormcommon.indexes import DERIVED_KEYS, get_lookup, natural_key, total_score
+from stormcommon import codecs, metrics, changelog
+
+MANIFEST_KEY = 'manifest.json'
+MATCHUP_PREFIX = 'matchups/'
+LEGACY_KEY = 'matchups.json'
+
+# Fields copied from each matchup into its manifest entry. comment_count is there for
+# the read model, which takes it from the entries rather than republish for a comment
+# (see readmodel.py)
+MANIFEST_FIELDS = ['id', 'sport', 'date', 'winner', 'loser', 'comment_count']
+
+# Parallel GETs when loading every matchup object (boto3 clients are thread-safe)
+LOAD_WORKERS = 8
+
+# Size of the parts an ObjectWriter uploads: the smallest S3 accepts, so the least memory
+PART_SIZE = 5 * 1024 * 1024
+
+
+def matchup_key(matchup_id):
+    return f'{MATCHUP_PREFIX}{matchup_id}.json'
+
+
+def manifest_entry(matchup, etag=None):
+    """
+    etag is the ETag of the stored matchup object, so readers can validate cached copies
+    """
+    entry = {field: matchup.get(field) for field in MANIFEST_FIELDS}
+    entry['total_score'] = total_score(matchup)
+    entry['etag'] = etag
+    return entry
+
+
+def empty_manifest():
+    return {'matchups': [], 'last_updated': None, 'total_matchups': 0}
+
+
+def utc_now():
+    return datetime.utcnow().isoformat()
+
+
+class ConditionFailed(Exception):
+    """
+    A conditional put lost to a concurrent writer
+    """
+
+
+# Error codes S3 answers a failed precondition with: 412, or 409 while a conflicting
+# conditional write is in flight
+CONDITION_ERRORS = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+
+
+def if_unchanged(etag):
+    """
+    Precondition for a put: the object still has the ETag it was read with, or still
+    does not exist if etag is None
+    """
+    return {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+
+
+def _condition_failed(e, condition):
+    # If-Match on an object deleted since it was read answers NoSuchKey
+    code = e.response['Error']['Code']
+    return bool(condition) and (code in CONDITION_ERRORS or code == 'NoSuchKey')
+
+
+class ObjectWriter:
+    """
+    An object written a chunk at a time. Chunks are buffered up to PART_SIZE and uploaded
+    as the parts of a multipart upload, so only one part is held in memory; an object
+    smaller than a part is written with a single put. close() completes the object under
+    its precondition, abort() discards the parts uploaded so far.
+    """
+
+    def __init__(self, store, key, content_type='application/json', content_encoding=None, cache_control=None):
+        self.store = store
+        self.key = key
+        self.size = 0
+        self._options = {'content_type': content_type, 'content_encoding': content_encoding,
+                         'cache_control': cache_control}
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, chunk):
+        self._buffer += chunk
+        self.size += len(chunk)
+        if len(self._buffer) >= PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        s3 = self.store.s3_client
+        with metrics.phase(metrics.S3_PUT):
+            if self._upload_id is None:
+                kwargs = {'Bucket': self.store.bucket_name, 'Key': self.key,
+                          'ContentType': self._options['content_type']}
+                if self._options['content_encoding']:
+                    kwargs['ContentEncoding'] = self._options['content_encoding']
+                if self._options['cache_control']:
+                    kwargs['CacheControl'] = self._options['cache_control']
+                self._upload_id = s3.create_multipart_upload(**kwargs)['UploadId']
+
+            body, self._buffer = bytes(self._buffer), bytearray()
+            number = len(self._parts) + 1
+            response = s3.upload_part(Bucket=self.store.bucket_name, Key=self.key, UploadId=self._upload_id,
+                                      PartNumber=number, Body=body)
+        self._parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def close(self, condition=None):
+        """
+        Returns the ETag of the written object. condition is a precondition from
+        if_unchanged(); raises ConditionFailed if it does not hold.
+        """
+        if self._upload_id is None:
+            body, self._buffer = bytes(self._buffer), bytearray()
+            return self.store.put_bytes(self.key, body, condition=condition, **self._options)
+
+        if self._buffer:
+            self._upload_part()
+        with metrics.phase(metrics.S3_PUT):
+            try:
+                response = self.store.s3_client.complete_multipart_upload(
+                    Bucket=self.store.bucket_name, Key=self.key, UploadId=self._upload_id,
+                    MultipartUpload={'Parts': self._parts}, **(condition or {}))
+            except ClientError as e:
+                self.abort()
+                if _condition_failed(e, condition):
+                    raise ConditionFailed(self.key) from e
+                raise e
+        self._upload_id = None
+        return response['ETag']
+
+    def abort(self):
+        self._buffer = bytearray()
+        if self._upload_id is None:
+            return
+        upload_id, self._upload_id = self._upload_id, None
+        with metrics.phase(metrics.S3_PUT):
+            self.store.s3_client.abort_multipart_upload(Bucket=self.store.bucket_name, Key=self.key,
+                                                        UploadId=upload_id)
+
+
+class MatchupStore:
+    """
+    Read/write access to the per-matchup objects and the manifest
+    """
+
+    def __init__(self, s3_client, bucket_name, codec=None):
+        """
+        codec is what new writes use (see codecs.py), reads detect it from each object
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.codec = codec or codecs.DEFAULT_CODEC
+
+    def get_bytes(self, key):
+        """
+        Returns the raw object at key, or None if it does not exist
+        """
+        return self.get_bytes_and_etag(key)[0]
+
+    def get_bytes_and_etag(self, key):
+        """
+        Returns (raw object, ETag) at key, or (None, None) if it does not exist
+        """
+        with metrics.phase(metrics.S3_GET):
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchKey':
+                    return None, None
+                raise e
+            return response['Body'].read(), response['ETag']
+
+    def get_stream(self, key):
+        """
+        (readable body, ETag) at key, or (None, None) if it does not exist. The body is
+        fetched as it is read.
+        """
+        with metrics.phase(metrics.S3_GET):
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchKey':
+                    return None, None
+                raise e
+        return response['Body'], response['ETag']
+
+    def get_bytes_if_changed(self, key, etag=None):
+        """
+        Conditional GET. Returns (body, etag, last_modified), with body None when the stored
+        object still matches etag, or (None, None, None) when the object does not exist.
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Key': key}
+        if etag:
+            kwargs['IfNoneMatch'] = etag
+
+        with metrics.phase(metrics.S3_GET):
+            try:
+                response = self.s3_client.get_object(**kwargs)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in ('304', 'NotModified'):
+                    return None, etag, None
+                if code == 'NoSuchKey':
+                    return None, None, None
+                raise e
+
+            return response['Body'].read(), response['ETag'], response['LastModified']
+
+    def put_bytes(self, key, body, content_type='application/json', content_encoding=None, condition=None,
+                  cache_control=None):
+        """
+        Returns the ETag of the written object. condition is a precondition from
+        if_unchanged(); raises ConditionFailed if it does not hold.
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Key': key, 'Body': body, 'ContentType': content_type}
+        if content_encoding:
+            kwargs['ContentEncoding'] = content_encoding
+        if cache_control:
+            kwargs['CacheControl'] = cache_control
+        kwargs.update(condition or {})
+        with metrics.phase(metrics.S3_PUT):
+            try:
+                return self.s3_client.put_object(**kwargs)['ETag']
+            except ClientError as e:
+                if _condition_failed(e, condition):
+                    raise ConditionFailed(key) from e
+                raise e
+
+    def open_writer(self, key, content_type='application/json', content_encoding=None, cache_control=None):
+        """
+        ObjectWriter for key, for objects written in chunks
+        """
+        return ObjectWriter(self, key, content_type, content_encoding, cache_control)
+
+    def copy_from(self, bucket, key, etag, target_key, content_type='application/json', cache_control=None):
+        """
+        Server-side copy of bucket/key to target_key in this store's bucket, provided the
+        source still has etag (raises ConditionFailed if not). Returns the copy's ETag.
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Key': target_key, 'CopySource': {'Bucket': bucket, 'Key': key},
+                  'CopySourceIfMatch': etag, 'MetadataDirective': 'REPLACE', 'ContentType': content_type}
+        if cache_control:
+            kwargs['CacheControl'] = cache_control
+        with metrics.phase(metrics.S3_PUT):
+            try:
+                return self.s3_client.copy_object(**kwargs)['CopyObjectResult']['ETag']
+            except ClientError as e:
+                if _condition_failed(e, kwargs):
+                    raise ConditionFailed(key) from e
+                raise e
+
+    def delete(self, key):
+        with metrics.phase(metrics.S3_PUT):
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def list_keys(self, prefix, start_after=None, max_keys=1000):
+        """
+        Keys under prefix in ascending order, after start_after. Returns (keys, truncated).
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Prefix': prefix, 'MaxKeys': max_keys}
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        with metrics.phase(metrics.S3_GET):
+            response = self.s3_client.list_objects_v2(**kwargs)
+        keys = [item['Key'] for item in response.get('Contents', [])]
+        return keys, response.get('IsTruncated', False)
+
+    def get_record(self, key):
+        """
+        Returns the decoded object at key (any codec), or None if it does not exist
+        """
+        return self.get_record_and_etag(key)[0]
+
+    def get_record_and_etag(self, key):
+        """
+        Returns (decoded object, ETag) at key, or (None, None) if it does not exist
+        """
+        body, etag = self.get_bytes_and_etag(key)
+        if body is None:
+            return None, None
+        with metrics.phase(metrics.PARSE):
+            return codecs.decode(body), etag
+
+    def put_record(self, key, data, condition=None):
+        """
+        Encode data with the store's codec and write it. Returns the ETag of the written object.
+        """
+        with metrics.phase(metrics.SERIALIZE):
+            body = codecs.encode(data, self.codec)
+        return self.put_bytes(key, body, content_type=codecs.CONTENT_TYPE, condition=condition)
+
+    ##############
+    ### Manifest
+
+    def get_manifest(self):
+        return self.get_manifest_and_etag()[0]
+
+    def get_manifest_and_etag(self):
+        """
+        (manifest, ETag); an empty manifest with ETag None if none has been written
+        """
+        manifest, etag = self.get_record_and_etag(MANIFEST_KEY)
+        return (manifest, etag) if manifest is not None else (empty_manifest(), None)
+
+    def get_manifest_if_changed(self, etag=None):
+        """
+        Conditional GET of the manifest. Returns (manifest, etag), with manifest None
+        when the stored object still matches etag. A missing manifest has etag None.
+        """
+        body, new_etag, _ = self.get_bytes_if_changed(MANIFEST_KEY, etag)
+        if body is None:
+            if new_etag is None:
+                return empty_manifest(), None
+            return None, etag
+        with metrics.phase(metrics.PARSE):
+            return codecs.decode(body), new_etag
+
+    def put_manifest(self, manifest, changed_ids=(), condition=None):
+        """
+        changed_ids are the matchups this write added, changed or removed, logged as
+        one new version. condition: see put_bytes.
+        """
+        changelog.record(manifest, changed_ids)
+        manifest['last_updated'] = utc_now()
+        manifest['total_matchups'] = len(manifest['matchups'])
+        # Readers derive the indexes and lookup from the entries (see indexes.py)
+        stored = {key: value for key, value in manifest.items() if key not in DERIVED_KEYS}
+        self.put_record(MANIFEST_KEY, stored, condition)
+
+    ##############
+    ### Matchups
+
+    def get_matchup(self, matchup_id):
+        return self.get_record(matchup_key(matchup_id))
+
+    def put_matchup(self, matchup, condition=None):
+        return self.put_record(matchup_key(matchup['id']), matchup, condition)
+
+    def load_matchups(self, manifest, archived=False):
+        """
+        Fetch every matchup listed in the manifest, in manifest order, and with archived
+        those of the sealed seasons after them (one archive read per season)
+        """
+        matchups = self.get_matchups([entry['id'] for entry in manifest['matchups']])
+        if archived:
+            for summary in sorted(manifest.get('archive', {}).values(), key=lambda s: s['key']):
+                body = self.get_bytes(summary['key'])
+                with metrics.phase(metrics.PARSE):
+                    matchups.extend(codecs.decode(gzip.decompress(body))['matchups'])
+        return matchups
+
+    def get_matchups(self, ids):
+        """
+        Fetch the given matchups in parallel, preserving order
+        """
+        # An entry without an object means a write died between the two puts
+        return self.get_records([matchup_key(matchup_id) for matchup_id in ids])
+
+    def get_matchups_and_etags(self, ids):
+        """
+        [(matchup, ETag)] for the given ids in parallel, preserving order and dropping
+        any that do not exist
+        """
+        if not ids:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(ids))) as pool:
+            objects = list(pool.map(lambda matchup_id: self.get_record_and_etag(matchup_key(matchup_id)), ids))
+
+        return [(o, etag) for o, etag in objects if o is not None]
+
+    def get_records(self, keys):
+        """
+        Fetch and parse the given objects in parallel, preserving order and dropping
+        any that do not exist
+        """
+        if not keys:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(keys))) as pool:
+            objects = list(pool.map(self.get_record, keys))
+
+        return [o for o in objects if o is not None]
+
+    def find_matchup_id(self, manifest, winner, loser, date):
+        """
+        Look up a matchup id by its natural key, or None if there is no match
+        """
+        return get_lookup(manifest)['key'].get(natural_key(winner, loser, date))
+
+    ##############
+    ### Write operations
+
+    def add_matchup(self, matchup):
+        """
+        Store a new matchup and register it in the manifest. Returns the manifest.
+        """
+        manifest = self.get_manifest()
+
+        # Object first so the manifest never points at a missing matchup
+        etag = self.put_matchup(matchup)
+        self._set_entry(manifest, matchup, etag)
+        self.put_manifest(manifest, [matchup['id']])
+        return manifest
+
+    def update_matchup(self, matchup, manifest=None):
+        """
+        Overwrite an existing matchup and refresh its manifest entry. Returns the manifest.
+        """
+        if manifest is None:
+            manifest = self.get_manifest()
+
+        etag = self.put_matchup(matchup)
+        self._set_entry(manifest, matchup, etag)
+        self.put_manifest(manifest, [matchup['id']])
+        return manifest
+
+    def set_entries(self, manifest, matchups, etags):
+        """
+        Point the manifest entries of matchups at their written objects
+        """
+        for matchup, etag in zip(matchups, etags):
+            self._set_entry(manifest, matchup, etag)
+
+    def _set_entry(self, manifest, matchup, etag):
+        """
+        Replace the manifest entry for matchup in place, or append it if it is new. The
+        lookup is kept current; the indexes are dropped, to be built again when needed.
+        """
+        lookup = get_lookup(manifest)
+        entry = manifest_entry(matchup, etag)
+        position = lookup['id'].get(matchup['id'])
+        if position is None:
+            lookup['id'][matchup['id']] = len(manifest['matchups'])
+            manifest['matchups'].append(entry)
+        else:
+            old = manifest['matchups'][position]
+            old_key = natural_key(old['winner'], old['loser'], old['date'])
+            if lookup['key'].get(old_key) == matchup['id']:
+                del lookup['key'][old_key]
+            manifest['matchups'][position] = entry
+        lookup['key'][natural_key(entry['winner'], entry['loser'], entry['date'])] = matchup['id']
+        manifest.pop('indexes', None)
+
+    def put_matchups(self, matchups, manifest=None):
+        """
+        Write a batch of new or changed matchups in parallel and refresh their manifest
+        entries with a single manifest write. Returns the manifest.
+        """
+        if manifest is None:
+            manifest = self.get_manifest()
+        if not matchups:
+            return manifest
+
+        etags = self.put_matchup_objects(matchups)
+        self.set_entries(manifest, matchups, etags)
+        self.put_manifest(manifest, [matchup['id'] for matchup in matchups])
+        return manifest
+
+    def put_matchup_objects(self, matchups, conditions=None):
+        """
+        Write matchup objects in parallel, each under its precondition in conditions (by
+        id, if any). Returns their ETags, None for any whose precondition failed.
+        """
+        conditions = conditions or {}
+
+        def put(matchup):
+            try:
+                return self.put_matchup(matchup, conditions.get(matchup['id']))
+            except ConditionFailed:
+                return None
+
+        if not matchups:
+            return []
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(matchups))) as pool:
+            return list(pool.map(put, matchups))
+
+    ##############
+    ### Migration
+
+    def migrate_legacy(self):
+        """
+        One-shot split of the legacy matchups.json into per-matchup objects plus the manifest.
+        The legacy object is left in place as a backup. Returns the number of matchups migrated.
+        """
+        legacy = self.get_record(LEGACY_KEY)
+        if legacy is None:
+            return 0
+
+        manifest = empty_manifest()
+        for matchup in legacy.get('matchups', []):
+            if not matchup.get('id'):
+                matchup['id'] = str(uuid.uuid4())
+            etag = self.put_matchup(matchup)
+            manifest['matchups'].append(manifest_entry(matchup, etag))
+
+        changelog.reset(manifest)
+        self.put_manifest(manifest)
+        return len(manifest['matchups'])
@@ -0,0 +1,192 @@
+##############
+### Streaming JSON for the read model views
+###
+### A view holds every open-season matchup of a sport or of the listing, and each write
+### splices it. Loading it whole keeps the raw bytes, the decoded string, the parsed
+### matchups and the re-serialized output in memory at once, which at 128 MB caps how
+### large a view can grow. Instead:
+###
+###   - StreamedDocument reads a view from the S3 body a chunk at a time and hands out the
+###     matchups one by one, holding only the current chunk and matchup
+###   - iter_document serializes fields and a stream of matchups back into chunks of about
+###     CHUNK_SIZE bytes
+###   - storage.ObjectWriter uploads those chunks as a multipart upload, one part in memory
+###
+### so a splice's memory stays the same however large the view it rewrites. Views are
+### written header first (version, last_updated, archived_seasons, then matchups, then
+### total_matchups), so a reader knows which change log version it has before it reaches
+### the matchups. Views written with the header last can still be read; the matchups are
+### then buffered until the header has been read.
+
+import json
+from itertools import islice
+from codecs import getincrementaldecoder
+from stormcommon import runtime, metrics
+
+CHUNK_SIZE = 64 * 1024
+
+# Elements parsed or serialized at a time, each batch timed as one Parse/Serialize phase.
+# Parse includes reading the body as it goes.
+BATCH = 64
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CONTINUES = '.eE+-'
+
+
+def iter_chunks(stream, size=CHUNK_SIZE):
+    """
+    Bytes of a file-like object (an S3 body, a GzipFile) in chunks of up to size
+    """
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class StreamedDocument:
+    """
+    A JSON object read incrementally from chunks of UTF-8 bytes, its array member key
+    handed out one element at a time by items(). fields holds the other members: those
+    before the array once the document is opened, every one of them once items() is done.
+    """
+
+    def __init__(self, chunks, key='matchups'):
+        self.key = key
+        self.fields = {}
+        self._chunks = iter(chunks)
+        self._utf8 = getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._in_array = False
+        self._buffered = None
+
+        self._next_of('{')
+        if self._members():
+            self._in_array = True
+            if not self.fields:
+                # Header last (views written before streaming): read to the end of the
+                # document for the fields that follow the array
+                self._buffered = list(self._elements())
+                self._in_array = False
+
+    def items(self):
+        if self._buffered is not None:
+            buffered, self._buffered = self._buffered, []
+            yield from buffered
+        elif self._in_array:
+            self._in_array = False
+            yield from self._elements()
+
+    def _elements(self):
+        done = self._peek() == ']'
+        if done:
+            self._pos += 1
+        while not done:
+            batch = []
+            with metrics.phase(metrics.PARSE):
+                while len(batch) < BATCH and not done:
+                    batch.append(self._value())
+                    done = self._next_of(',]') == ']'
+            yield from batch
+        if self._next_of(',}') == ',':
+            self._members()
+
+    def _members(self):
+        """
+        Read members into fields up to the array (True) or the end of the object (False)
+        """
+        if self._peek() == '}':
+            self._pos += 1
+            return False
+        while True:
+            name = self._value()
+            self._next_of(':')
+            if name == self.key and self._peek() == '[':
+                self._pos += 1
+                return True
+            self.fields[name] = self._value()
+            if self._next_of(',}') == '}':
+                return False
+
+    def _fill(self):
+        """
+        Append the next chunk to the buffer, False at the end of the stream
+        """
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            self._buffer = self._buffer[self._pos:] + self._utf8.decode(b'', final=True)
+        else:
+            self._buffer = self._buffer[self._pos:] + self._utf8.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON document')
+
+    def _next_of(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f'Expected one of {chars!r} at {char!r} in JSON document')
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # A number at the end of the buffer ("12", "12.", "1e") may continue in
+                # the next chunk
+                if self._eof or (end < len(self._buffer) and self._buffer[end] not in _NUMBER_CONTINUES):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_document(fields, key, items, trailer=None, size=CHUNK_SIZE):
+    """
+    UTF-8 chunks of about size bytes of the JSON object with fields, then key holding the
+    elements of items, then the fields trailer() returns once items is exhausted
+    """
+    parts = ['{']
+    for name, value in fields.items():
+        parts.append(f'{runtime.dumps(name)}:{runtime.dumps(value)},')
+    parts.append(f'{runtime.dumps(key)}:[')
+    pending = sum(len(part) for part in parts)
+
+    first = True
+    items = iter(items)
+    while True:
+        batch = list(islice(items, BATCH))
+        if not batch:
+            break
+        with metrics.phase(metrics.SERIALIZE):
+            # The elements of the batch without its brackets
+            part = runtime.dumps(batch)[1:-1]
+        parts.append(part if first else ',' + part)
+        first = False
+        pending += len(part) + 1
+        if pending >= size:
+            yield ''.join(parts).encode('utf-8')
+            parts, pending = [], 0
+
+    parts.append(']')
+    for name, value in (trailer() if trailer else {}).items():
+        parts.append(f',{runtime.dumps(name)}:{runtime.dumps(value)}')
+    parts.append('}')
+    yield ''.join(parts).encode('utf-8')
@@ -0,0 +1,147 @@
+##############
+### Local verification of Cognito access tokens (RS256 JWTs)
+###
+### Signatures are checked against the user pool JWKS, fetched once per container and
+### refreshed on an interval or when a token names an unknown key. RSA verification is
+### plain modular exponentiation (RSASSA-PKCS1-v1_5 with SHA-256), so nothing beyond the
+### standard library has to ship in the lambda zip.
+
+import json
+import time
+import base64
+import hashlib
+import urllib.request
+
+# DER prefix of the DigestInfo for SHA-256 (RFC 8017, section 9.2)
+SHA256_DIGEST_INFO = bytes.fromhex('3031300d060960864801650304020105000420')
+
+
+class TokenInvalid(Exception):
+    """
+    The token is definitely not acceptable (bad signature, expired, wrong issuer...)
+    """
+
+
+class TokenUndecidable(Exception):
+    """
+    The token could not be checked locally (unknown key, JWKS unavailable...)
+    """
+
+
+def b64url_decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def b64url_uint(data):
+    return int.from_bytes(b64url_decode(data), 'big')
+
+
+def cognito_issuer(user_pool_id):
+    region = user_pool_id.split('_')[0]
+    return f'https://cognito-idp.{region}.amazonaws.com/{user_pool_id}'
+
+
+class JWKSCache:
+    """
+    RSA public keys by kid, loaded from a JWKS URL (or a local file) and kept for
+    refresh_seconds. An unknown kid triggers a refetch, at most every min_refetch_seconds.
+    """
+
+    def __init__(self, jwks_url=None, jwks_file=None, refresh_seconds=3600, min_refetch_seconds=60,
+                 timeout_seconds=2):
+        self.jwks_url = jwks_url
+        self.jwks_file = jwks_file
+        self.refresh_seconds = refresh_seconds
+        self.min_refetch_seconds = min_refetch_seconds
+        self.timeout_seconds = timeout_seconds
+        self.keys = {}
+        self.fetched_at = None
+        self.fetches = 0
+
+    def _fetch(self):
+        if self.jwks_file:
+            with open(self.jwks_file) as f:
+                jwks = json.load(f)
+        else:
+            with urllib.request.urlopen(self.jwks_url, timeout=self.timeout_seconds) as response:
+                jwks = json.loads(response.read())
+
+        self.keys = {
+            key['kid']: (b64url_uint(key['n']), b64url_uint(key['e']))
+            for key in jwks.get('keys', [])
+            if key.get('kty') == 'RSA' and key.get('kid')
+        }
+        self.fetched_at = time.monotonic()
+        self.fetches += 1
+
+    def get_key(self, kid):
+        """
+        (n, e) for kid. Raises TokenUndecidable if the key cannot be found or fetched.
+        """
+        now = time.monotonic()
+        stale = self.fetched_at is None or now - self.fetched_at >= self.refresh_seconds
+        unknown = kid not in self.keys and (
+            self.fetched_at is None or now - self.fetched_at >= self.min_refetch_seconds)
+
+        if stale or unknown:
+            try:
+                self._fetch()
+            except Exception as e:
+                if kid not in self.keys:
+                    raise TokenUndecidable(f'JWKS unavailable: {e}')
+
+        if kid not in self.keys:
+            raise TokenUndecidable(f'Unknown signing key {kid}')
+        return self.keys[kid]
+
+
+def rs256_verify(signing_input, signature, n, e):
+    """
+    RSASSA-PKCS1-v1_5 verification with SHA-256
+    """
+    k = (n.bit_length() + 7) // 8
+    if len(signature) != k:
+        return False
+
+    s = int.from_bytes(signature, 'big')
+    if s >= n:
+        return False
+    em = pow(s, e, n).to_bytes(k, 'big')
+
+    digest_info = SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    padding = k - len(digest_info) - 3
+    if padding < 8:
+        return False
+    expected = b'\x00\x01' + b'\xff' * padding + b'\x00' + digest_info
+    return em == expected
+
+
+def verify_access_token(token, jwks_cache, issuer, now=None):
+    """
+    Verify signature, exp, iss and token_use of a Cognito access token and return
+    its claims. Raises TokenInvalid or TokenUndecidable.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split('.')
+        header = json.loads(b64url_decode(header_b64))
+        claims = json.loads(b64url_decode(payload_b64))
+        signature = b64url_decode(signature_b64)
+    except Exception:
+        raise TokenInvalid('Malformed token')
+
+    if header.get('alg') != 'RS256':
+        raise TokenUndecidable(f'Unsupported alg {header.get("alg")}')
+
+    n, e = jwks_cache.get_key(header.get('kid'))
+    if not rs256_verify(f'{header_b64}.{payload_b64}'.encode('ascii'), signature, n, e):
+        raise TokenInvalid('Bad signature')
+
+    now = time.time() if now is None else now
+    if not isinstance(claims.get('exp'), (int, float)) or claims['exp'] <= now:
+        raise TokenInvalid('Token expired')
+    if claims.get('iss') != issuer:
+        raise TokenInvalid('Wrong issuer')
+    if claims.get('token_use') != 'access':
+        raise TokenInvalid('Not an access token')
+
+    return claims
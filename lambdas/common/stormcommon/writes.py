@@ -0,0 +1,523 @@
+##############
+### Group-commit write path
+###
+### AddMatchup, EditMatchup and AddComment no longer read-modify-write the manifest
+### themselves. Each validates its request, stamps the ids it will need, and submits a
+### write {'request_id', 'op', 'payload'} to the write queue: SQS FIFO with a single
+### message group, so exactly one batch is in flight at a time. The ApplyWrites lambda
+### drains it: a batch of writes is applied in order against one manifest read, then
+### committed with one write per changed matchup, one manifest write and one pass over
+### the read model, stats and search index. Each write's outcome (the status and body its
+### caller responds with) is stored under writes/<request id>.json, where the submitting
+### lambda polls for it.
+###
+### Without STORM_WRITE_QUEUE_URL (local runs, tests) a write is applied inline as a
+### batch of one. Ids are assigned before a write is queued, so a batch retried after a
+### partial commit rewrites the same objects instead of adding duplicates. The stats and
+### search index are updated from deltas, which a retry would no longer see (the stored
+### matchups already match), so the queue consumer stores a batch's deltas under
+### PENDING_KEY before its commit and replays them with the next batch if they were not
+### applied.
+###
+### Either way the commit is optimistic: matchup objects are put If-Match the ETag they
+### were read with and the manifest If-Match its own, so a writer racing the batch (an
+### inline writer, BulkMatchups) makes it fail with ConditionFailed, and the whole batch
+### is re-applied against fresh data (see concurrency.py).
+###
+### Matchups in a sealed season (see archive.py) are read-only: adds, edits and comments
+### that would touch one are answered 409.
+
+import os
+import time
+import uuid
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from stormcommon.indexes import get_lookup, natural_key
+from stormcommon.storage import ConditionFailed, empty_manifest, if_unchanged, manifest_entry, matchup_key
+from stormcommon import archive, comments, readmodel, runtime, metrics, stats, search, concurrency
+from stormcommon import matchups as matchup_rules
+
+QUEUE_URL = os.environ.get('STORM_WRITE_QUEUE_URL') or None
+
+# One message group keeps the FIFO queue to a single consumer batch at a time
+MESSAGE_GROUP = 'writes'
+
+OUTCOME_PREFIX = 'writes/'
+
+# Outside writes/, which the bucket expires after a day
+PENDING_KEY = 'writes-pending.json'
+
+ADD_MATCHUP = 'add_matchup'
+EDIT_MATCHUP = 'edit_matchup'
+ADD_COMMENT = 'add_comment'
+
+# How long a submitting lambda (10 s timeout) waits for its outcome before answering 202
+WAIT_SECONDS = 8
+POLL_SECONDS = [0.05, 0.1, 0.2, 0.25]
+
+# Parallel S3 requests for comment objects and outcomes (boto3 clients are thread-safe)
+WORKERS = 8
+
+
+def outcome_key(request_id):
+    return f'{OUTCOME_PREFIX}{request_id}.json'
+
+
+##############
+### Submitting
+
+def submit(store, op, payload, request_id=None, fingerprint=None):
+    """
+    Queue a write and wait for its outcome, or apply it inline when there is no queue.
+    Returns (status code, response body); 202 if the outcome did not arrive in time.
+    request_id and fingerprint come from an Idempotency-Key (see idempotency.py); the
+    outcome is then stored with the fingerprint even when applied inline.
+    """
+    write = {'request_id': request_id or str(uuid.uuid4()), 'op': op, 'payload': payload}
+    if fingerprint is not None:
+        write['fingerprint'] = fingerprint
+
+    if QUEUE_URL is None:
+        try:
+            outcome = apply_writes(store, [write])[write['request_id']]
+        except ConditionFailed:
+            return 503, {'error': 'Busy', 'message': 'Too many concurrent writes, try again'}
+        if fingerprint is not None:
+            put_outcomes(store, {write['request_id']: outcome}, [write])
+        return outcome
+
+    runtime.client('sqs').send_message(QueueUrl=QUEUE_URL, MessageBody=runtime.dumps(write),
+                                       MessageGroupId=MESSAGE_GROUP,
+                                       MessageDeduplicationId=write['request_id'])
+
+    outcome = wait(store, write['request_id'])
+    if outcome is None:
+        return 202, {'message': 'Write accepted, not applied yet', 'request_id': write['request_id']}
+    return outcome
+
+
+def wait(store, request_id, timeout=WAIT_SECONDS):
+    """
+    Poll for a write's outcome. Returns (status code, body), or None after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    with metrics.phase(metrics.QUEUE_WAIT):
+        for attempt in itertools.count():
+            outcome = store.get_record(outcome_key(request_id))
+            if outcome is not None:
+                return outcome['status'], outcome['body']
+            delay = POLL_SECONDS[min(attempt, len(POLL_SECONDS) - 1)]
+            if time.monotonic() + delay > deadline:
+                return None
+            time.sleep(delay)
+
+
+def put_outcomes(store, outcomes, writes=()):
+    """
+    Store each write's outcome for its submitter, in parallel, with the fingerprint of
+    any of writes that carries one
+    """
+    if not outcomes:
+        return
+    fingerprints = {write['request_id']: write['fingerprint'] for write in writes if write.get('fingerprint')}
+
+    def put(item):
+        request_id, (status_code, body) = item
+        outcome = {'status': status_code, 'body': body}
+        if request_id in fingerprints:
+            outcome['fingerprint'] = fingerprints[request_id]
+        store.put_record(outcome_key(request_id), outcome)
+
+    items = list(outcomes.items())
+    with ThreadPoolExecutor(max_workers=min(WORKERS, len(items))) as pool:
+        list(pool.map(put, items))
+
+
+##############
+### Applying a batch
+
+class Batch:
+    """
+    State of the archive as the writes of one batch are applied, before the commit
+    """
+
+    def __init__(self, store, uncommitted=None, adopt=False):
+        """
+        uncommitted is shared by the attempts at one batch: {id: (ETag, matchup it
+        replaced)} for objects an attempt wrote before losing the race for the manifest.
+        adopt accepts objects another writer has not committed yet (see _loaded).
+        """
+        self.store = store
+        self.adopt = adopt
+        self.manifest, self.manifest_etag = store.get_manifest_and_etag()
+        self.lookup = get_lookup(self.manifest)
+        self.uncommitted = uncommitted if uncommitted is not None else {}
+        self.current = {}       # id: matchup as of the writes applied so far
+        self.previous = {}      # id: stored matchup before the batch, None for a new one
+        self.etags = {}         # id: ETag the stored matchup was read with
+        self.changed = []       # ids to write, in order
+        self.comments = {}      # id: comments to add (and to index)
+        self.comment_counts = {}
+        self.pending = None     # deltas for the stats and search index, set by commit()
+
+    def prefetch(self, ids):
+        """
+        Load the stored matchups the batch's writes name, in parallel
+        """
+        ids = [matchup_id for matchup_id in dict.fromkeys(ids)
+               if matchup_id in self.lookup['id'] and matchup_id not in self.current]
+        for matchup, etag in self.store.get_matchups_and_etags(ids):
+            self._loaded(matchup, etag)
+
+    def get(self, matchup_id):
+        """
+        Matchup by id including this batch's writes, or None
+        """
+        if matchup_id in self.current:
+            return self.current[matchup_id]
+        if matchup_id not in self.lookup['id']:
+            return None
+        matchup, etag = self.store.get_record_and_etag(matchup_key(matchup_id))
+        if matchup is None:
+            return None
+        return self._loaded(matchup, etag)
+
+    def _loaded(self, matchup, etag):
+        written = self.uncommitted.get(matchup['id'])
+        committed = self.manifest['matchups'][self.lookup['id'][matchup['id']]].get('etag')
+        if not committed or etag == committed:
+            # Committed, whoever wrote it: ETags are content hashes, so another writer's
+            # identical object looks like ours
+            pass
+        elif written is not None and written[0] == etag:
+            # Still our own write from an attempt that lost the manifest race: start
+            # again from the matchup it replaced
+            matchup = written[1]
+        elif not self.adopt:
+            # Another writer's change, not in the manifest yet: building on it would
+            # base the index deltas on a state that may never commit. Wait for it; on
+            # the last attempt its writer is taken to have died between the two puts.
+            raise ConditionFailed(matchup_key(matchup['id']))
+        self.previous[matchup['id']] = matchup
+        self.current[matchup['id']] = matchup
+        self.etags[matchup['id']] = etag
+        return matchup
+
+    def find(self, winner, loser, date):
+        return self.lookup['key'].get(natural_key(winner, loser, date))
+
+    def put(self, matchup):
+        """
+        Record a new or changed matchup (a new dict, the stored one stays untouched).
+        Its manifest entry is built first, so a matchup that cannot be indexed fails its
+        own write here rather than the batch's commit.
+        """
+        manifest_entry(matchup)
+        old = self.current.get(matchup['id'])
+        if old is not None:
+            old_key = natural_key(old['winner'], old['loser'], old['date'])
+            if self.lookup['key'].get(old_key) == matchup['id']:
+                del self.lookup['key'][old_key]
+        self.lookup['key'][natural_key(matchup['winner'], matchup['loser'], matchup['date'])] = matchup['id']
+
+        self.previous.setdefault(matchup['id'], None)
+        self.current[matchup['id']] = matchup
+        if matchup['id'] not in self.changed:
+            self.changed.append(matchup['id'])
+
+    def commit(self, recoverable=False):
+        """
+        Write the matchups, comments and manifest the batch changed, and with recoverable
+        the deltas for the indexes first. Returns the manifest. Raises
+        ConditionFailed if a matchup or the manifest changed since it was read.
+        """
+        if not self.changed:
+            return self.manifest
+
+        # Comment objects first, then the counts the matchup records carry: the stored
+        # count plus the comments added, or the listing for a stream where one of them
+        # was stored already (see comments.py)
+        new_comments = [(matchup_id, comment) for matchup_id, added in self.comments.items()
+                        for comment in added]
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            stored = list(pool.map(lambda item: comments.add_comment(self.store, *item), new_comments))
+            recount = sorted({matchup_id for (matchup_id, _), new in zip(new_comments, stored) if not new})
+            listed = dict(zip(recount, pool.map(lambda matchup_id: comments.count_comments(self.store, matchup_id),
+                                                recount)))
+        for matchup_id, added in self.comments.items():
+            matchup = self.current[matchup_id]
+            count = listed[matchup_id] if matchup_id in listed else matchup.get('comment_count', 0) + len(added)
+            matchup['comment_count'] = count
+            self.comment_counts[matchup_id] = count
+
+        self.pending = {
+            'batch': str(uuid.uuid4()),
+            'changes': [[self.previous[matchup_id], self.current[matchup_id]] for matchup_id in self.changed],
+            'comments': self.comments
+        }
+        if recoverable:
+            self.store.put_record(PENDING_KEY, self.pending)
+
+        matchups = [self.current[matchup_id] for matchup_id in self.changed]
+        conditions = {matchup_id: if_unchanged(etag) for matchup_id, etag in self.etags.items()}
+        etags = self.store.put_matchup_objects(matchups, conditions)
+        for matchup, etag in zip(matchups, etags):
+            if etag is not None:
+                self.uncommitted[matchup['id']] = (etag, self.previous[matchup['id']])
+        if None in etags:
+            raise ConditionFailed('matchups')
+
+        manifest = self.manifest
+        self.store.set_entries(manifest, matchups, etags)
+        self.store.put_manifest(manifest, self.changed, if_unchanged(self.manifest_etag))
+        return manifest
+
+    def publish(self):
+        """
+        Splice the committed matchups into the read model (retried per view, never by
+        re-running the batch, which is already committed)
+        """
+        if not self.changed:
+            return
+        matchups = [self.current[matchup_id] for matchup_id in self.changed]
+        previous = {matchup_id: self.previous.get(matchup_id) for matchup_id in self.changed}
+        readmodel.publish_matchups(self.store, self.manifest, matchups, previous)
+
+
+def update_indexes(store, manifest, pending, recoverable=True):
+    """
+    Fold a committed batch's deltas into the stats and the search index. Recoverable
+    deltas are stored under PENDING_KEY, dropped once applied; applying them again is
+    safe, as both skip a batch id they have already applied.
+    """
+    changes = [(old, new) for old, new in pending['changes']]
+    batch_id = pending['batch'] if recoverable else None
+    # The stats do not count comments
+    scored = [(old, new) for old, new in changes if not matchup_rules.comment_count_only(old, new)]
+    if scored:
+        stats.record_changes(store, manifest, scored, batch=batch_id)
+    search.record_changes(store, changes, pending['comments'], batch=batch_id)
+    if recoverable:
+        store.delete(PENDING_KEY)
+
+
+def _error(status_code, error, message):
+    return lambda: (status_code, {'error': error, 'message': message})
+
+
+def _sealed_error(summary):
+    return _error(409, 'Season sealed', archive.sealed_message(summary))
+
+
+def _sealed(batch, matchup_id):
+    """
+    Summary of the sealed season of a matchup the manifest no longer lists, else None
+    """
+    matchup = archive.get_sealed_matchup(batch.store, batch.manifest, matchup_id)
+    return archive.sealed_season(batch.manifest, matchup) if matchup is not None else None
+
+
+def _add_matchup(batch, matchup):
+    """
+    matchup is complete and stamped by AddMatchup (matchups.new_matchup). A retried add
+    finds its matchup already stored (prefetched by id), so it counts as an unchanged edit.
+    """
+    field = matchup_rules.missing_field(matchup)
+    if field:
+        return _error(400, 'Missing required field', f'Field "{field}" is required')
+    field = matchup_rules.invalid_score(matchup)
+    if field:
+        return _error(400, 'Invalid field', f'Field "{field}" must be a number')
+
+    sealed = archive.sealed_season(batch.manifest, matchup)
+    if sealed is not None:
+        return _sealed_error(sealed)
+
+    # A retried add finds its own id under the key
+    other_id = batch.find(matchup['winner'], matchup['loser'], matchup['date'])
+    if other_id and other_id != matchup['id']:
+        return _error(409, 'Conflict', 'Another matchup has the same winner, loser, and date')
+
+    batch.put(matchup)
+    return lambda: (201, {
+        'message': 'Matchup added successfully',
+        'matchup_id': matchup['id'],
+        'total_matchups': batch.manifest['total_matchups']
+    })
+
+
+def _edit_matchup(batch, patch):
+    """
+    patch is a merge patch naming its matchup by id or by winner/loser/date
+    """
+    matchup_id = patch.get('id')
+    if not matchup_id:
+        matchup_id = batch.find(patch['winner'], patch['loser'], patch['date'])
+
+    existing_matchup = batch.get(matchup_id) if matchup_id else None
+    if existing_matchup is None:
+        sealed = _sealed(batch, matchup_id) if matchup_id else None
+        if sealed is not None:
+            return _sealed_error(sealed)
+        return _error(404, 'Not found', 'Matchup not found')
+
+    updated_matchup = matchup_rules.merge_edit(existing_matchup, patch)
+
+    field = matchup_rules.missing_field(updated_matchup)
+    if field:
+        return _error(400, 'Invalid patch', f'Field "{field}" is required')
+    field = matchup_rules.invalid_score(updated_matchup)
+    if field:
+        return _error(400, 'Invalid patch', f'Field "{field}" must be a number')
+
+    sealed = archive.sealed_season(batch.manifest, updated_matchup)
+    if sealed is not None:
+        return _sealed_error(sealed)
+
+    if matchup_rules.key_changed(existing_matchup, updated_matchup):
+        other_id = batch.find(updated_matchup['winner'], updated_matchup['loser'], updated_matchup['date'])
+        if other_id and other_id != matchup_id:
+            return _error(409, 'Conflict', 'Another matchup has the same winner, loser, and date')
+
+    if matchup_rules.is_unchanged(existing_matchup, updated_matchup):
+        return lambda: (200, {'message': 'Matchup unchanged', 'matchup': existing_matchup})
+
+    batch.put(updated_matchup)
+    return lambda: (200, {'message': 'Matchup updated successfully', 'matchup': updated_matchup})
+
+
+def _add_comment(batch, comment):
+    """
+    comment is complete and stamped by AddComment
+    """
+    matchup_id = comment['matchup_id']
+    matchup = batch.get(matchup_id)
+    if matchup is None:
+        sealed = _sealed(batch, matchup_id)
+        if sealed is not None:
+            return _sealed_error(sealed)
+        return _error(404, 'Matchup not found', f'No matchup found with id {matchup_id}')
+
+    if matchup_id not in batch.comments:
+        matchup = dict(matchup)
+        # A record still carrying nested comments (not yet migrated) moves them out first
+        moved = list(matchup.get('comments') or [])
+        comments.split_comments(batch.store, matchup)
+        batch.put(matchup)
+        batch.comments[matchup_id] = moved
+    batch.comments[matchup_id].append(comment)
+
+    return lambda: (201, {
+        'message': 'Comment added successfully',
+        'comment': comment,
+        'comment_count': batch.comment_counts[matchup_id]
+    })
+
+
+OPERATIONS = {
+    ADD_MATCHUP: _add_matchup,
+    EDIT_MATCHUP: _edit_matchup,
+    ADD_COMMENT: _add_comment
+}
+
+
+def rollback(store, writes, uncommitted):
+    """
+    Undo what a batch that gave up had written: its comments, and its matchups unless
+    another writer has written them since (or committed the same bytes). A matchup the
+    manifest names as written (a commit that failed after its manifest put) keeps its
+    object and comments.
+    """
+    manifest = store.get_manifest() if uncommitted else empty_manifest()
+    positions = get_lookup(manifest)['id']
+    committed = {matchup_id for matchup_id, (etag, _) in uncommitted.items()
+                 if matchup_id in positions and manifest['matchups'][positions[matchup_id]].get('etag') == etag}
+
+    def restore(item):
+        matchup_id, (etag, previous) = item
+        if matchup_id in committed:
+            return
+        try:
+            if previous is None:
+                store.delete(matchup_key(matchup_id))
+            else:
+                store.put_matchup(previous, if_unchanged(etag))
+        except ConditionFailed:
+            pass
+
+    comment_keys = [comments.comment_key(write['payload']['matchup_id'], write['payload'])
+                    for write in writes
+                    if write.get('op') == ADD_COMMENT and write['payload']['matchup_id'] not in committed]
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        list(pool.map(store.delete, comment_keys))
+        list(pool.map(restore, uncommitted.items()))
+
+
+def _apply_batch(store, writes, uncommitted, recoverable, adopt):
+    """
+    One attempt at a batch against freshly read state: (batch, {request_id: result})
+    """
+    batch = Batch(store, uncommitted, adopt)
+
+    if recoverable:
+        # Deltas of an earlier batch that committed but failed before updating the indexes
+        pending = store.get_record(PENDING_KEY)
+        if pending is not None:
+            update_indexes(store, batch.manifest, pending)
+
+    batch.prefetch(write['payload'].get('id') or write['payload'].get('matchup_id')
+                   for write in writes if isinstance(write.get('payload'), dict))
+
+    results = {}
+    for write in writes:
+        operation = OPERATIONS.get(write.get('op'))
+        if operation is None:
+            results[write['request_id']] = _error(400, 'Invalid write', f'Unknown operation {write.get("op")}')
+            continue
+        try:
+            results[write['request_id']] = operation(batch, write['payload'])
+        except ConditionFailed:
+            raise
+        except Exception as e:
+            print(f"Write {write['request_id']} failed: {str(e)}")
+            results[write['request_id']] = _error(500, 'Internal server error', str(e))
+
+    batch.manifest = batch.commit(recoverable)
+    return batch, results
+
+
+def apply_writes(store, writes, on_commit=None, recoverable=False):
+    """
+    Apply writes in order and commit them together, re-applying the whole batch if a
+    concurrent writer changed what it read. Returns {request_id: (status, body)}; a write
+    that fails on its own gets a 500 without holding back the rest. Errors from the
+    commit roll back what it wrote and are raised, so the queue redelivers the batch.
+
+    on_commit(outcomes) is called once the matchups and read model are stored, before
+    the stats and search index are updated, so callers need not wait for those.
+    recoverable keeps the index deltas under PENDING_KEY until they are applied; only
+    the queue consumer, which never runs concurrently with itself, may use it.
+    """
+    uncommitted = {}
+    attempts = iter(range(concurrency.MAX_ATTEMPTS))
+
+    def attempt():
+        last = next(attempts) == concurrency.MAX_ATTEMPTS - 1
+        return _apply_batch(store, writes, uncommitted, recoverable, adopt=last)
+
+    try:
+        batch, results = concurrency.with_retries(attempt)
+    except Exception:
+        rollback(store, writes, uncommitted)
+        raise
+
+    batch.publish()
+
+    # Responses are built after the commit so they report the stored state
+    outcomes = {request_id: result() for request_id, result in results.items()}
+    if on_commit:
+        on_commit(outcomes)
+
+    if batch.changed:
+        update_indexes(store, batch.manifest, batch.pending, recoverable)
+    return outcomes
@@ -48,11 +48,18 @@ for dir in $dirs; do
     # Navigate into the directory
     cd "$lambda_short_name"
 
-    # whether to zip lambda_function.py
-    if [[ "$FORCE_UPDATE" = true || ! -f "$zip_file" || "lambda_function.py" -nt "$zip_file" ]]; then
+    # whether to zip lambda_function.py (or the shared common/ package changed)
+    common_changed=""
+    if [[ -f "$zip_file" ]]; then
+        common_changed=$(find ../common -name "*.py" -newer "$zip_file")
+    fi
+
+    if [[ "$FORCE_UPDATE" = true || ! -f "$zip_file" || "lambda_function.py" -nt "$zip_file" || -n "$common_changed" ]]; then
         echo "Performing substitutions and updating $zip_file..."
 
-        # Create the temp directory
+        # Stage the zip's contents in a clean temp directory, so a file removed from the
+        # function or from common/ leaves the zip too
+        rm -rf "temp"
         mkdir -p "temp"
 
         # Create a temporary copy of lambda_function.py
@@ -72,8 +79,12 @@ for dir in $dirs; do
             fi
         done
 
-        # Create or update the zip file containing lambda_function.py
-        zip -j "$zip_file" "$temp_file"
+        # Bundle the shared stormcommon package at the zip root, next to lambda_function.py
+        cp -r ../common/stormcommon temp/
+
+        # Build the zip afresh from the staged files
+        rm -f "$zip_file"
+        (cd temp && zip -r "../$zip_file" . -x "*__pycache__*")
 
         # Remove the temporary directory
         rm -rf "temp"
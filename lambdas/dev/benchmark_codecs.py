@@ -0,0 +1,120 @@
+##############
+### Compare storage codecs: bytes stored and encode/decode time
+###
+### Usage (from lambdas/): python dev/benchmark_codecs.py [--sizes 1000,10000,100000] [--json]
+###
+### Encodes synthetic data two ways per size: the manifest (one entry per matchup, what
+### every reader and writer transfers) and the full matchup
+### records (what a rebuild or migration moves). "json indent=2" is the format the
+### writers used before codecs, for reference. msgpack rows are skipped if the package
+### is not installed.
+
+import os
+import sys
+import json
+import time
+import random
+import string
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon import codecs
+from stormcommon.storage import manifest_entry, empty_manifest
+
+SPORTS = ['football', 'basketball']
+TEAMS = ['Duke', 'UNC', 'Virginia', 'Clemson', 'Miami', 'Syracuse', 'Louisville', 'Pitt',
+         'Georgia Tech', 'Boston College', 'NC State', 'Wake Forest', 'Florida State', 'Notre Dame']
+
+
+def words(rng, count):
+    return ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+                    for _ in range(count))
+
+
+def synthetic_matchups(n, seed=0):
+    """
+    n matchups shaped like real ones: scores, ranks, a few sentences of rationale each
+    """
+    rng = random.Random(seed)
+    matchups = []
+    for i in range(n):
+        winner, loser = rng.sample(TEAMS, 2)
+        matchups.append({
+            'id': f'{rng.getrandbits(128):032x}',
+            'sport': rng.choice(SPORTS),
+            'winner': winner,
+            'loser': loser,
+            'winner_rank': str(rng.randint(1, 25)) if rng.random() < 0.4 else '',
+            'loser_rank': str(rng.randint(1, 25)) if rng.random() < 0.3 else '',
+            'date': f'{2000 + i % 26}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'upset_score': round(rng.uniform(0, 3), 1),
+            'impact_score': round(rng.uniform(0, 3), 1),
+            'excitement_score': round(rng.uniform(0, 3), 1),
+            'upset_rationale': words(rng, 30),
+            'impact_rationale': words(rng, 30),
+            'excitement_rationale': words(rng, 30),
+            'overall_discussion': words(rng, 80),
+            'created_at': f'2025-01-01T00:00:{i % 60:02d}.000000',
+            'comment_count': rng.randint(0, 5)
+        })
+    return matchups
+
+
+def synthetic_manifest(matchups):
+    manifest = empty_manifest()
+    manifest['matchups'] = [manifest_entry(m, f'"{m["id"]}"') for m in matchups]
+    manifest['total_matchups'] = len(matchups)
+    manifest['last_updated'] = '2025-01-01T00:00:00'
+    return manifest
+
+
+def best_of(func, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def measure(data, repeats):
+    rows = []
+
+    # Reference: what the writers stored before codecs existed
+    ms, body = best_of(lambda: json.dumps(data, indent=2).encode('utf-8'), repeats)
+    decode_ms, _ = best_of(lambda: json.loads(body), repeats)
+    rows.append({'codec': 'json indent=2', 'bytes': len(body),
+                 'encode_ms': round(ms, 2), 'decode_ms': round(decode_ms, 2)})
+
+    for codec in (codecs.JSON, codecs.JSON_GZIP, codecs.MSGPACK):
+        if codec == codecs.MSGPACK and codecs.msgpack is None:
+            continue
+        ms, body = best_of(lambda: codecs.encode(data, codec), repeats)
+        decode_ms, decoded = best_of(lambda: codecs.decode(body), repeats)
+        assert decoded == data
+        rows.append({'codec': codec, 'bytes': len(body),
+                     'encode_ms': round(ms, 2), 'decode_ms': round(decode_ms, 2)})
+    return rows
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    sizes = [int(size) for size in args[args.index('--sizes') + 1].split(',')] if '--sizes' in args \
+        else [1000, 10000, 100000]
+
+    results = []
+    for n in sizes:
+        matchups = synthetic_matchups(n)
+        repeats = 5 if n <= 10000 else 1
+        for dataset, data in (('manifest', synthetic_manifest(matchups)), ('records', matchups)):
+            for row in measure(data, repeats):
+                results.append({'matchups': n, 'dataset': dataset, **row})
+
+    if '--json' in args:
+        print(json.dumps({'msgpack': codecs.msgpack is not None, 'results': results}, indent=2))
+    else:
+        print(f"{'matchups':>8} {'dataset':<9} {'codec':<14} {'bytes':>12} {'encode ms':>10} {'decode ms':>10}")
+        for row in results:
+            print(f"{row['matchups']:>8} {row['dataset']:<9} {row['codec']:<14} {row['bytes']:>12} "
+                  f"{row['encode_ms']:>10} {row['decode_ms']:>10}")
@@ -0,0 +1,365 @@
+##############
+### Benchmark the lambda handlers in-process against a local S3 stand-in
+###
+### Usage (from lambdas/): python dev/benchmark_handlers.py [--sizes 1000,10000] [--iterations 50]
+###            [--comments 2] [--hot-comments 500] [--scenarios GetMatchups,AddComment]
+###            [--json] [--out results.json] [--compare previous.json] [--threshold 1.25]
+###
+### For each archive size, seeds a fresh dev/local_s3.LocalS3 with synthetic matchups
+### (--comments per matchup on average, plus one "hot" matchup with --hot-comments),
+### loads each lambda_function.py with SUB_ placeholders filled in and calls its
+### lambda_handler like a warm container would. No AWS credentials or network needed.
+###
+### Per scenario it reports p50/p95/p99 latency, the peak Python heap allocated during a
+### call (tracemalloc, measured on separate calls so it does not slow the timed ones),
+### S3 requests and bytes read/written per call, and the response size. "cold" scenarios
+### empty the handler's warm caches before every call, the others keep them, as repeat
+### traffic to one container would. --compare checks the run against an earlier --json
+### output and exits 1 if any p95 grew by more than --threshold times (+1 ms) or any scenario
+### moves more S3 bytes per call than before. Absolute numbers are from this machine,
+### with local disk instead of S3 round trips, so compare them relatively.
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import itertools
+import resource
+import statistics
+import tracemalloc
+import contextlib
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDAS_DIR = os.path.join(DEV_DIR, '..')
+sys.path.insert(0, os.path.join(LAMBDAS_DIR, 'common'))
+sys.path.insert(0, DEV_DIR)
+
+from local_s3 import LocalS3, install
+import benchmark_codecs
+from stormcommon.storage import MatchupStore
+from stormcommon.cache import WarmCache
+from stormcommon import readmodel, comments, stats, search
+
+BUCKET = 'benchmark-private'
+
+LAMBDAS = ['GetMatchups', 'AddMatchup', 'EditMatchup', 'AddComment', 'GetComments', 'BulkMatchups', 'GetStats', 'Search']
+
+BULK_ROWS = 100
+
+# Matchups the seed writes one at a time after the initial batch, for the ?since= scenario
+SYNC_LAG = 5
+
+# Prose for the text fields: words drawn with Zipf frequencies from a fixed vocabulary,
+# as in real writing, so the search index has a realistic number of terms
+VOCABULARY = [benchmark_codecs.words(random.Random(i), 1) for i in range(5000)]
+CUMULATIVE_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+TEXT_LENGTHS = {'upset_rationale': 30, 'impact_rationale': 30, 'excitement_rationale': 30,
+                'overall_discussion': 80}
+
+
+def words(rng, count):
+    return ' '.join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=count))
+
+
+def synthetic_matchups(n, seed=0):
+    rng = random.Random(seed)
+    matchups = benchmark_codecs.synthetic_matchups(n, seed)
+    for matchup in matchups:
+        for field, length in TEXT_LENGTHS.items():
+            matchup[field] = words(rng, length)
+    return matchups
+
+
+def load_handler(name):
+    """
+    Module namespace of lambdas/<name>/lambda_function.py with SUB_ placeholders filled in
+    """
+    path = os.path.join(LAMBDAS_DIR, name, 'lambda_function.py')
+    with open(path) as f:
+        source = re.sub(r'SUB_([A-Za-z0-9_]+)',
+                        lambda m: json.dumps(BUCKET if m.group(1) == 'PrivateBucketName' else m.group(1).lower()),
+                        f.read())
+    module = {'__name__': 'lambda_function', '__file__': path}
+    exec(compile(source, path, 'exec'), module)
+    return module
+
+
+def synthetic_comment(rng, matchup_id, n):
+    return {
+        'id': f'{rng.getrandbits(128):032x}',
+        'user_id': f'user{rng.randint(1, 200)}',
+        'comment_text': words(rng, rng.randint(5, 40)),
+        'created_at': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:{n % 60:02d}.{n:06d}',
+        'matchup_id': matchup_id
+    }
+
+
+def seed(s3, n, comments_per_matchup, hot_comments, rng):
+    """
+    Fill the bucket with n matchups, their comment streams, the read model, stats and
+    the search index.
+    Returns the matchups; the first one is the hot matchup.
+    """
+    store = MatchupStore(s3, BUCKET)
+    matchups = synthetic_matchups(n)
+
+    counts = [hot_comments] + [rng.randint(0, 2 * comments_per_matchup) for _ in matchups[1:]]
+    for matchup, count in zip(matchups, counts):
+        for i in range(count):
+            comments.add_comment(store, matchup['id'], synthetic_comment(rng, matchup['id'], i))
+        matchup['comment_count'] = count
+
+    # One batch (change log version 1), then SYNC_LAG single writes for ?since=1 to return
+    manifest = store.put_matchups(matchups)
+    for matchup in matchups[-SYNC_LAG:]:
+        manifest = store.update_matchup(matchup, manifest)
+    readmodel.rebuild(store, manifest)
+    stats.rebuild(store, manifest)
+    search.rebuild(store, manifest)
+    return matchups
+
+
+def clear_caches(module):
+    for value in list(module.values()):
+        if isinstance(value, WarmCache):
+            value.entries.clear()
+
+
+def scenarios(matchups, rng, iterations):
+    """
+    (name, lambda, cold, calls, event factory, response hook) for every scenario
+    """
+    ids = [m['id'] for m in matchups]
+    hot_id = ids[0]
+    new_matchups = iter(synthetic_matchups(iterations * 2, seed=1))
+
+    def new_matchup():
+        matchup = dict(next(new_matchups))
+        for field in ('id', 'created_at', 'comment_count'):
+            matchup.pop(field)
+        return {'body': json.dumps(matchup), 'headers': {}}
+
+    def edit():
+        return {'body': json.dumps({'id': rng.choice(ids), 'overall_discussion': words(rng, 80)}),
+                'headers': {}}
+
+    def comment():
+        return {'body': json.dumps({'matchup_id': rng.choice(ids), 'comment_text': words(rng, 20),
+                                    'user_id': 'benchmark'}), 'headers': {}}
+
+    def bulk_edit():
+        rows = [json.dumps({'id': matchup_id, 'excitement_rationale': words(rng, 30)})
+                for matchup_id in rng.sample(ids, min(BULK_ROWS, len(ids)))]
+        return {'body': '\n'.join(rows), 'headers': {'content-type': 'application/x-ndjson'}}
+
+    # Queries built from words of the synthetic text, so they have matches
+    def search_word():
+        return {'queryStringParameters': {'q': rng.choice(rng.choice(matchups)['overall_discussion'].split())},
+                'headers': {}}
+
+    def search_phrase():
+        text = rng.choice(matchups)['overall_discussion'].split()
+        start = rng.randrange(len(text) - 2)
+        return {'queryStringParameters': {'q': '"' + ' '.join(text[start:start + 3]) + '"'}, 'headers': {}}
+
+    # Walks the hot matchup's stream one page at a time, starting over at the end
+    comment_cursor = [None]
+
+    def comment_page(response):
+        body = json.loads(response['body'])
+        comment_cursor[0] = body.get('next_cursor')
+
+    def deep_comments():
+        params = {'matchup_id': hot_id, 'limit': '20'}
+        if comment_cursor[0]:
+            params['cursor'] = comment_cursor[0]
+        return {'queryStringParameters': params, 'headers': {}}
+
+    def get(params):
+        return lambda: {'queryStringParameters': params, 'headers': {}}
+
+    bulk_calls = max(3, iterations // 10)
+    return [
+        ('GetMatchups all', 'GetMatchups', False, iterations, get(None), None),
+        ('GetMatchups all cold', 'GetMatchups', True, iterations, get(None), None),
+        ('GetMatchups sport cold', 'GetMatchups', True, iterations, get({'sport': 'football'}), None),
+        ('GetMatchups page', 'GetMatchups', False, iterations,
+         get({'sort': 'total_score', 'limit': '24'}), None),
+        ('GetMatchups page cold', 'GetMatchups', True, iterations,
+         get({'sort': 'total_score', 'limit': '24'}), None),
+        ('GetMatchups id cold', 'GetMatchups', True, iterations,
+         lambda: {'queryStringParameters': {'id': rng.choice(ids)}, 'headers': {}}, None),
+        (f'GetMatchups since {SYNC_LAG} changes cold', 'GetMatchups', True, iterations,
+         get({'since': '1'}), None),
+        ('GetStats', 'GetStats', False, iterations, get(None), None),
+        ('GetStats sport cold', 'GetStats', True, iterations, get({'sport': 'football'}), None),
+        ('Search word', 'Search', False, iterations, search_word, None),
+        ('Search phrase', 'Search', False, iterations, search_phrase, None),
+        ('GetComments first page', 'GetComments', False, iterations,
+         get({'matchup_id': hot_id, 'limit': '20'}), None),
+        ('GetComments walk', 'GetComments', False, iterations, deep_comments, comment_page),
+        ('AddMatchup', 'AddMatchup', False, iterations, new_matchup, None),
+        ('EditMatchup', 'EditMatchup', False, iterations, edit, None),
+        ('AddComment', 'AddComment', False, iterations, comment, None),
+        (f'BulkMatchups {BULK_ROWS} edits', 'BulkMatchups', False, bulk_calls, bulk_edit, None),
+    ]
+
+
+def percentile(samples, p):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[p - 1]
+
+
+def call(module, event, cold):
+    if cold:
+        clear_caches(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return module['lambda_handler'](event, None)
+
+
+def run_scenario(s3, module, cold, calls, make_event, after, memory_calls):
+    latencies = []
+    response_bytes = 0
+    errors = 0
+
+    s3.reset_stats()
+    for _ in range(calls):
+        event = make_event()
+        start = time.perf_counter()
+        response = call(module, event, cold)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        response_bytes += len(response.get('body') or '')
+        if response['statusCode'] >= 400:
+            errors += 1
+        if after:
+            after(response)
+    requests = sum(s3.stats['requests'].values())
+    bytes_read, bytes_written = s3.stats['bytes_out'], s3.stats['bytes_in']
+
+    peak = 0
+    tracemalloc.start()
+    for _ in range(memory_calls):
+        event = make_event()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = call(module, event, cold)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        if after:
+            after(response)
+    tracemalloc.stop()
+
+    return {
+        'calls': calls,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'peak_heap_kb': round(peak / 1024, 1),
+        's3_requests_per_call': round(requests / calls, 2),
+        's3_bytes_read_per_call': round(bytes_read / calls),
+        's3_bytes_written_per_call': round(bytes_written / calls),
+        'response_bytes_per_call': round(response_bytes / calls)
+    }
+
+
+def run(n, iterations, comments_per_matchup, hot_comments, only):
+    rng = random.Random(n)
+    s3 = LocalS3()
+    s3.create_bucket(Bucket=BUCKET)
+    install(s3)
+
+    start = time.perf_counter()
+    matchups = seed(s3, n, comments_per_matchup, hot_comments, rng)
+    seed_seconds = time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        modules = {name: load_handler(name) for name in LAMBDAS}
+
+    results = []
+    for name, lambda_name, cold, calls, make_event, after in scenarios(matchups, rng, iterations):
+        if only and lambda_name not in only and name not in only:
+            continue
+        result = run_scenario(s3, modules[lambda_name], cold, calls, make_event, after,
+                              memory_calls=min(5, calls))
+        results.append({'matchups': n, 'scenario': name, 'lambda': lambda_name, **result})
+
+    return results, round(seed_seconds, 1)
+
+
+def compare(results, previous, threshold):
+    """
+    Regressions of results against an earlier run, as printable lines
+    """
+    before = {(row['matchups'], row['scenario']): row for row in previous['results']}
+    regressions = []
+    for row in results:
+        old = before.get((row['matchups'], row['scenario']))
+        if old is None:
+            continue
+        # 1 ms of slack so sub-millisecond cache hits do not flap
+        if row['p95_ms'] > old['p95_ms'] * threshold + 1:
+            regressions.append(f"{row['matchups']} {row['scenario']}: p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+        for field in ('s3_bytes_read_per_call', 's3_bytes_written_per_call'):
+            # Allow for the archive growing by the writers' own calls
+            if row[field] > old[field] * 1.05 + 1024:
+                regressions.append(f"{row['matchups']} {row['scenario']}: {field} {old[field]} -> {row[field]}")
+    return regressions
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return args[args.index(name) + 1] if name in args else default
+
+    sizes = [int(size) for size in option('--sizes', '1000').split(',')]
+    iterations = int(option('--iterations', '50'))
+    comments_per_matchup = int(option('--comments', '2'))
+    hot_comments = int(option('--hot-comments', '500'))
+    only = set(option('--scenarios', '').split(',')) - {''}
+    threshold = float(option('--threshold', '1.25'))
+
+    results = []
+    seed_seconds = {}
+    for n in sizes:
+        size_results, seed_seconds[n] = run(n, iterations, comments_per_matchup, hot_comments, only)
+        results.extend(size_results)
+
+    output = {
+        'config': {'sizes': sizes, 'iterations': iterations, 'comments_per_matchup': comments_per_matchup,
+                   'hot_comments': hot_comments, 'python': sys.version.split()[0]},
+        'seed_seconds': seed_seconds,
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'results': results
+    }
+
+    if '--out' in args:
+        with open(option('--out', None), 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if '--json' in args:
+        print(json.dumps(output, indent=2))
+    else:
+        print(f"{'matchups':>8} {'scenario':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'heap KB':>9} "
+              f"{'S3 req':>7} {'S3 read B':>10} {'S3 write B':>10} {'resp B':>9} {'err':>4}")
+        for row in results:
+            print(f"{row['matchups']:>8} {row['scenario']:<24} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                  f"{row['p99_ms']:>8} {row['peak_heap_kb']:>9} {row['s3_requests_per_call']:>7} "
+                  f"{row['s3_bytes_read_per_call']:>10} {row['s3_bytes_written_per_call']:>10} "
+                  f"{row['response_bytes_per_call']:>9} {row['errors']:>4}")
+        print(f"max RSS {output['max_rss_mb']} MB")
+
+    if '--compare' in args:
+        with open(option('--compare', None)) as f:
+            regressions = compare(results, json.load(f), threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
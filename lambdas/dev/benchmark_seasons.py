@@ -0,0 +1,124 @@
+##############
+### Benchmark write and default read cost against years of history, before and after
+### sealing the closed seasons (see common/stormcommon/archive.py)
+###
+### Usage (from lambdas/): python dev/benchmark_seasons.py [--years 1,5,10,20]
+###            [--per-season 100] [--iterations 20] [--json]
+###
+### For each --years count seeds a dev/local_s3.LocalS3 with --per-season matchups in each
+### of that many closed seasons plus the current one, then measures per call:
+###
+###     AddComment   to a current-season matchup: S3 bytes read and written
+###     listing      unpaginated GET /matchups, caches emptied: S3 bytes read, response size
+###
+### once with every season open and once with all closed seasons sealed. Sealed, both
+### should stay flat however many years there are.
+
+import os
+import sys
+import json
+import random
+import argparse
+import contextlib
+import io
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DEV_DIR, '..', 'common'))
+sys.path.insert(0, DEV_DIR)
+
+from local_s3 import LocalS3, install
+from benchmark_handlers import BUCKET, load_handler, synthetic_matchups, words, run_scenario
+from seal_season import closed_seasons
+from stormcommon.storage import MatchupStore, MANIFEST_KEY
+from stormcommon import archive, readmodel, stats, search, runtime, metrics
+
+metrics.SAMPLE_RATE = 0
+
+LISTING_EVENT = {'queryStringParameters': {}, 'headers': {}}
+
+
+def seed(s3, years, per_season, rng):
+    """
+    per_season matchups in each of the last years closed seasons and the current one.
+    Returns the ids in the current season.
+    """
+    current = int(archive.current_season())
+    matchups = synthetic_matchups(per_season * (years + 1))
+    for i, matchup in enumerate(matchups):
+        # August to December of the year the season starts in
+        matchup['date'] = f'{current - i % (years + 1)}-{rng.randint(8, 12):02d}-{rng.randint(1, 28):02d}'
+
+    store = MatchupStore(s3, BUCKET)
+    manifest = store.put_matchups(matchups)
+    readmodel.rebuild(store, manifest)
+    stats.rebuild(store, manifest)
+    search.rebuild(store, manifest)
+    return [m['id'] for m in matchups if readmodel.season(m['date']) == str(current)]
+
+
+def measure(s3, store, current_ids, rng, iterations):
+    add_comment = load_handler('AddComment')
+    get_matchups = load_handler('GetMatchups')
+
+    def comment():
+        return {'body': json.dumps({'matchup_id': rng.choice(current_ids), 'comment_text': words(rng, 20),
+                                    'user_id': 'benchmark'}), 'headers': {}}
+
+    writes = run_scenario(s3, add_comment, False, iterations, comment, None, 0)
+    listing = run_scenario(s3, get_matchups, True, iterations, lambda: LISTING_EVENT, None, 0)
+    return {
+        'manifest_bytes': len(store.get_bytes(MANIFEST_KEY)),
+        'write_read_bytes': writes['s3_bytes_read_per_call'],
+        'write_written_bytes': writes['s3_bytes_written_per_call'],
+        'write_p50_ms': writes['p50_ms'],
+        'listing_read_bytes': listing['s3_bytes_read_per_call'],
+        'listing_response_bytes': listing['response_bytes_per_call'],
+        'listing_p50_ms': listing['p50_ms'],
+        'errors': writes['errors'] + listing['errors']
+    }
+
+
+def run_years(years, args):
+    rng = random.Random(years)
+    s3 = LocalS3()
+    s3.create_bucket(Bucket=BUCKET)
+    install(s3)
+    store = MatchupStore(s3, BUCKET)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        current_ids = seed(s3, years, args.per_season, rng)
+        result = {'years': years, 'open': measure(s3, store, current_ids, rng, args.iterations)}
+        for sport, season in closed_seasons(store.get_manifest()):
+            archive.seal_season(store, sport, season)
+        result['sealed'] = measure(s3, store, current_ids, rng, args.iterations)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', default='1,5,10,20')
+    parser.add_argument('--per-season', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = [run_years(int(years), args) for years in args.years.split(',')]
+
+    if args.json:
+        print(runtime.dumps(results))
+        return
+
+    print(f"{args.per_season} matchups per season, KB per call (p50 ms)")
+    print(f"{'years':>5}{'state':>8}{'manifest':>10}{'write read':>12}{'written':>9}{'write ms':>10}"
+          f"{'list read':>11}{'response':>10}{'list ms':>9}")
+    for result in results:
+        for state in ('open', 'sealed'):
+            m = result[state]
+            print(f"{result['years']:>5}{state:>8}{m['manifest_bytes'] / 1024:>10.1f}"
+                  f"{m['write_read_bytes'] / 1024:>12.1f}{m['write_written_bytes'] / 1024:>9.1f}"
+                  f"{m['write_p50_ms']:>10.1f}{m['listing_read_bytes'] / 1024:>11.1f}"
+                  f"{m['listing_response_bytes'] / 1024:>10.1f}{m['listing_p50_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
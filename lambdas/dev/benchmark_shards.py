@@ -0,0 +1,154 @@
+##############
+### Benchmark the partitioned full listing in GetMatchups against shard count
+###
+### Usage (from lambdas/): python dev/benchmark_shards.py [--matchups 2000] [--shards 1,2,4,8,16,32]
+###            [--latency 0.02] [--iterations 20] [--json]
+###
+### Seeds a dev/local_s3.LocalS3 once, then for the unpartitioned read model and for
+### STORM_READ_PARTITION=shards:<n> at each --shards count publishes the views and times
+### an unpaginated GET /matchups with --latency seconds added to every S3 request, as a
+### stand-in for round trips:
+###
+###     cold         empty caches: the manifest and every view fetched
+###     revalidate   cached but past the TTL: a conditional GET per view, nothing merged
+###
+### each with the views fetched one after another (workers 1) and on GetMatchups' thread
+### pool. Also reports S3 requests per cold call and the CPU time to combine the views:
+### the k-way merge GetMatchups does against concatenating and re-sorting them.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import contextlib
+import io
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DEV_DIR, '..', 'common'))
+sys.path.insert(0, DEV_DIR)
+
+from local_s3 import LocalS3, install
+from benchmark_handlers import BUCKET, load_handler, seed, clear_caches
+from stormcommon.storage import MatchupStore
+from stormcommon import readmodel, runtime, metrics
+
+metrics.SAMPLE_RATE = 0
+
+LISTING_EVENT = {'queryStringParameters': {}, 'headers': {}}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def time_calls(handler, before_each, iterations):
+    latencies = []
+    for _ in range(iterations):
+        before_each()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = handler(LISTING_EVENT, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+    return latencies
+
+
+def combine_times(store, manifest, iterations):
+    """
+    CPU ms to combine the parsed listing views: k-way merge vs concatenate and re-sort
+    """
+    documents = [readmodel.load_view_and_etag(store, view)[0] for view in readmodel.listing_views(manifest)]
+
+    def resort():
+        matchups = [matchup for document in documents for matchup in document['matchups']]
+        readmodel.sort_matchups(matchups)
+        return matchups
+
+    timings = {}
+    for name, combine in (('merge', lambda: readmodel.merge_views(documents)['matchups']), ('resort', resort)):
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            combine()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[name] = statistics.median(samples)
+    return timings
+
+
+def run_partition(s3, store, manifest, partition, args):
+    readmodel.PARTITION = partition
+    s3.latency = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        readmodel.rebuild(store, manifest)
+        module = load_handler('GetMatchups')
+    views = readmodel.listing_views(manifest)
+
+    result = {'partition': partition, 'views': len(views)}
+    result.update(combine_times(store, manifest, args.iterations))
+
+    s3.latency = args.latency
+    for workers in (1, module['VIEW_WORKERS']):
+        module['VIEW_WORKERS'] = workers
+
+        clear_caches(module)
+        s3.reset_stats()
+        cold = time_calls(module['lambda_handler'], lambda: clear_caches(module), args.iterations)
+        requests = sum(s3.stats['requests'].values()) / args.iterations
+
+        # Warm, but every entry past its TTL
+        def expire():
+            for cache in (module['manifest_cache'], module['view_cache']):
+                for entry in cache.entries.values():
+                    entry.checked_at -= cache.ttl_seconds
+        revalidate = time_calls(module['lambda_handler'], expire, args.iterations)
+
+        result[f'workers_{workers}'] = {
+            'cold_p50_ms': statistics.median(cold), 'cold_p95_ms': percentile(cold, 95),
+            'revalidate_p50_ms': statistics.median(revalidate), 'revalidate_p95_ms': percentile(revalidate, 95),
+            's3_requests': requests
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--matchups', type=int, default=2000)
+    parser.add_argument('--shards', default='1,2,4,8,16,32')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    s3 = LocalS3()
+    s3.create_bucket(Bucket=BUCKET)
+    install(s3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed(s3, args.matchups, 0, 0, random.Random(0))
+    store = MatchupStore(s3, BUCKET)
+    manifest = store.get_manifest()
+
+    partitions = ['none'] + [f'shards:{n}' for n in args.shards.split(',')]
+    results = [run_partition(s3, store, manifest, partition, args) for partition in partitions]
+
+    if args.json:
+        print(runtime.dumps(results))
+        return
+
+    print(f"{args.matchups} matchups, {args.latency * 1000:.0f} ms per S3 request, p50 / p95 ms")
+    print(f"{'partition':<11}{'views':>6}{'workers':>8}{'cold':>16}{'revalidate':>16}{'S3 reqs':>9}"
+          f"{'merge':>8}{'resort':>8}")
+    for result in results:
+        for key in sorted(k for k in result if k.startswith('workers_')):
+            timing = result[key]
+            print(f"{result['partition']:<11}{result['views']:>6}{key[8:]:>8}"
+                  f"{timing['cold_p50_ms']:>9.1f} / {timing['cold_p95_ms']:<5.0f}"
+                  f"{timing['revalidate_p50_ms']:>9.1f} / {timing['revalidate_p95_ms']:<5.0f}"
+                  f"{timing['s3_requests']:>9.1f}{result['merge']:>8.2f}{result['resort']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+##############
+### Benchmark a writer's peak memory against the size of the read model view it splices
+### (see common/stormcommon/streaming.py)
+###
+### Usage (from lambdas/): python dev/benchmark_streaming.py [--sizes 2000,8000,32000]
+###            [--json]
+###
+### For each --sizes count seeds a dev/local_s3.LocalS3 directory with that many matchups
+### and their read model, then edits one matchup and splices it into read/all.json in a
+### fresh interpreter and a fresh copy of the bucket, once per mode:
+###
+###     in-memory   the view loaded whole, spliced as a list and rendered whole, as writers
+###                 did before streaming
+###     streaming   readmodel.publish_matchup: streamed in, merged, streamed out through
+###                 multipart uploads
+###
+### and reports the peak RSS of the splice itself, above what the process held before it
+### (Linux only: the peak is reset through /proc/self/clear_refs once the manifest is
+### loaded). A 128 MB function has roughly 80 MB to spare for this; streaming should stay
+### flat however large the view grows.
+
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DEV_DIR, '..', 'common'))
+sys.path.insert(0, DEV_DIR)
+
+from local_s3 import LocalS3, install
+from benchmark_handlers import BUCKET, synthetic_matchups
+from stormcommon.storage import MatchupStore, if_unchanged
+from stormcommon import readmodel, runtime, metrics
+
+metrics.SAMPLE_RATE = 0
+
+MODES = ('in-memory', 'streaming')
+
+
+def _status(field):
+    with open('/proc/self/status') as f:
+        return int(re.search(rf'{field}:\s+(\d+) kB', f.read()).group(1)) * 1024
+
+
+def reset_peak_rss():
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def seed(root, n):
+    s3 = LocalS3(root=root)
+    s3.create_bucket(Bucket=BUCKET)
+    store = MatchupStore(s3, BUCKET)
+    manifest = store.put_matchups(synthetic_matchups(n))
+    readmodel.PARTITION = 'none'
+    readmodel.rebuild(store, manifest)
+
+
+def splice_in_memory(store, manifest, matchup):
+    """
+    The splice writers made before streaming: every copy of the view in memory at once
+    """
+    body, etag = store.get_bytes_and_etag(readmodel.view_key('all'))
+    document = runtime.loads(body)
+    matchups = [m for m in document['matchups'] if m['id'] != matchup['id']] + [matchup]
+    readmodel.sort_matchups(matchups)
+    body = runtime.dumps({'matchups': matchups, 'last_updated': manifest['last_updated'],
+                          'total_matchups': len(matchups), 'version': document.get('version', 0)}).encode('utf-8')
+    store.put_bytes(readmodel.view_key('all', compressed=True), gzip.compress(body, compresslevel=6),
+                    content_encoding='gzip')
+    store.put_bytes(readmodel.view_key('all'), body, condition=if_unchanged(etag))
+
+
+def measure(root, mode):
+    """
+    Peak RSS added by one splice, run in this (fresh) process
+    """
+    s3 = LocalS3(root=root)
+    install(s3)
+    store = MatchupStore(s3, BUCKET)
+    readmodel.PARTITION = 'none'
+    manifest = store.get_manifest()
+    previous = store.get_matchup(manifest['matchups'][len(manifest['matchups']) // 2]['id'])
+    matchup = dict(previous, winner=previous['loser'], loser=previous['winner'])
+    manifest = store.update_matchup(matchup, manifest)
+
+    reset_peak_rss()
+    before = _status('VmRSS')
+    if mode == 'in-memory':
+        splice_in_memory(store, manifest, matchup)
+    else:
+        readmodel.publish_matchup(store, manifest, matchup, previous)
+    return _status('VmHWM') - before
+
+
+def run_size(n):
+    with tempfile.TemporaryDirectory() as directory:
+        seeded = os.path.join(directory, 'seeded')
+        # Seeding holds every matchup: keep it out of the measured processes
+        subprocess.run([sys.executable, __file__, '--seed', seeded, str(n)], check=True)
+        view_bytes = os.path.getsize(os.path.join(seeded, BUCKET, 'read', 'all.json'))
+        result = {'matchups': n, 'view_bytes': view_bytes}
+        for mode in MODES:
+            root = os.path.join(directory, mode)
+            shutil.copytree(seeded, root)
+            output = subprocess.run([sys.executable, __file__, '--measure', root, mode], check=True,
+                                    capture_output=True, text=True).stdout
+            result[mode] = json.loads(output.strip().splitlines()[-1])
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='2000,8000,32000')
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--seed', nargs=2, metavar=('ROOT', 'N'), help=argparse.SUPPRESS)
+    parser.add_argument('--measure', nargs=2, metavar=('ROOT', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed[0], int(args.seed[1]))
+        return
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    results = [run_size(int(n)) for n in args.sizes.split(',')]
+
+    if args.json:
+        print(runtime.dumps(results))
+        return
+
+    print("Peak RSS of splicing one edit into read/all.json, MB")
+    print(f"{'matchups':>9}{'view MB':>9}" + ''.join(f'{mode:>11}' for mode in MODES))
+    for result in results:
+        print(f"{result['matchups']:>9}{result['view_bytes'] / 2 ** 20:>9.1f}"
+              + ''.join(f'{result[mode] / 2 ** 20:>11.1f}' for mode in MODES))
+
+
+if __name__ == '__main__':
+    main()
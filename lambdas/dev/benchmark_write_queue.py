@@ -0,0 +1,210 @@
+##############
+### Benchmark concurrent writers: direct read-modify-write vs the group-commit queue
+###
+### Usage (from lambdas/): python dev/benchmark_write_queue.py [--matchups 200] [--writers 16]
+###            [--writes 10] [--latency 0.02] [--modes blind,direct,queued] [--json]
+###
+### Seeds a dev/local_s3.LocalS3 (with --latency seconds added to every S3 request, as a
+### stand-in for round trips) and runs --writers threads that each send --writes
+### AddMatchup, EditMatchup and AddComment requests at once, as a burst after a big game
+### would. "direct" applies each write inline, every handler doing its own conditional
+### read-modify-write of the manifest and the objects it changes, retried on conflict
+### (the behaviour without STORM_WRITE_QUEUE_URL); "blind" is the same with the stand-in
+### ignoring preconditions, as writers did before they used them; "queued" submits to a
+### dev/local_queue.LocalQueue drained by one ApplyWrites consumer.
+###
+### Reports accepted writes/sec, request latency, conditional puts rejected (each one a
+### retry, or a 503 once the retries run out) and the consumer's batch sizes, then
+### checks what survived: added matchups missing from the manifest, manifest entries that
+### do not match their object, read model copies that differ from the stored matchup (but
+### for a comment_count a ?since= sync brings up to date, see readmodel.py) and comment
+### counts that differ from the comment stream. Anything but zero is a lost write.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+import contextlib
+import io
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DEV_DIR, '..', 'common'))
+sys.path.insert(0, DEV_DIR)
+
+import local_queue
+from local_s3 import LocalS3, install
+from benchmark_handlers import BUCKET, load_handler, seed, synthetic_matchups, words
+from stormcommon.storage import MatchupStore
+from stormcommon.indexes import natural_key
+from stormcommon import changelog, comments, readmodel, writes, metrics
+from stormcommon import matchups as matchup_rules
+
+# Metrics assume one invocation per process, as in a Lambda container; here the
+# handlers run concurrently in threads
+metrics.SAMPLE_RATE = 0
+
+WRITERS = ['AddMatchup', 'EditMatchup', 'AddComment']
+
+# Share of each kind of write in the burst
+MIX = [('AddComment', 0.6), ('EditMatchup', 0.25), ('AddMatchup', 0.15)]
+
+
+def make_events(writer, count, ids, rng):
+    """
+    (lambda name, event, natural key of an added matchup or None) for one writer thread
+    """
+    new_matchups = iter(synthetic_matchups(count, seed=1000 + writer))
+    events = []
+    for n in range(count):
+        name = rng.choices([name for name, _ in MIX], weights=[weight for _, weight in MIX])[0]
+        key = None
+        if name == 'AddMatchup':
+            matchup = dict(next(new_matchups))
+            for field in ('id', 'created_at', 'comment_count'):
+                matchup.pop(field)
+            matchup['winner'] = f'Writer {writer} team {n}'
+            key = natural_key(matchup['winner'], matchup['loser'], matchup['date'])
+            body = matchup
+        elif name == 'EditMatchup':
+            body = {'id': rng.choice(ids), 'excitement_rationale': words(rng, 30)}
+        else:
+            body = {'matchup_id': rng.choice(ids), 'comment_text': words(rng, 15), 'user_id': f'writer{writer}'}
+        events.append((name, {'body': json.dumps(body), 'headers': {}}, key))
+    return events
+
+
+def check(store):
+    """
+    Counts of writes lost to races, from the final state of the bucket
+    """
+    manifest = store.get_manifest()
+    stored = {m['id']: m for m in store.load_matchups(manifest)}
+
+    stale_entries = 0
+    for entry in manifest['matchups']:
+        etag = store.s3_client.get_object(Bucket=BUCKET, Key=f'matchups/{entry["id"]}.json')['ETag']
+        if entry.get('etag') != etag:
+            stale_entries += 1
+
+    documents = [readmodel.load_view_and_etag(store, view)[0] for view in readmodel.listing_views(manifest)]
+    listing = readmodel.merge_views(documents) if None not in documents else {'matchups': [], 'version': 0}
+    view = {m['id']: m for m in listing['matchups']}
+    # A comment does not republish the views: a count may lag for a matchup changed since
+    # the listing's version, which a ?since= sync returns
+    synced = set(changelog.changed_since(manifest, listing['version'])[0])
+    stale_views = sum(1 for matchup_id, matchup in stored.items()
+                      if view.get(matchup_id) != matchup
+                      and not (matchup_id in synced and matchup_rules.comment_count_only(view.get(matchup_id), matchup)))
+
+    wrong_counts = sum(1 for matchup_id, matchup in stored.items()
+                       if matchup.get('comment_count', 0) != comments.count_comments(store, matchup_id))
+    return manifest, {'stale_manifest_entries': stale_entries, 'stale_read_model': stale_views,
+                      'wrong_comment_counts': wrong_counts}
+
+
+def run(mode, args):
+    s3 = LocalS3()
+    s3.create_bucket(Bucket=BUCKET)
+    install(s3)
+    matchups = seed(s3, args.matchups, 1, 0, random.Random(0))
+    ids = [m['id'] for m in matchups]
+    store = MatchupStore(s3, BUCKET)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        modules = {name: load_handler(name) for name in WRITERS + ['ApplyWrites']}
+
+    queue = None
+    writes.QUEUE_URL = None
+    s3.ignore_conditions = mode == 'blind'
+    if mode == 'queued':
+        queue = local_queue.LocalQueue(modules['ApplyWrites']['lambda_handler'])
+        local_queue.install(queue)
+
+    plans = [make_events(writer, args.writes, ids, random.Random(writer)) for writer in range(args.writers)]
+    latencies = []
+    statuses = {}
+    added = []
+    lock = threading.Lock()
+
+    def writer(plan):
+        for name, event, key in plan:
+            start = time.perf_counter()
+            response = modules[name]['lambda_handler'](event, None)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+                if key and response['statusCode'] in (201, 202):
+                    added.append(key)
+
+    s3.latency = args.latency
+    s3.reset_stats()
+    threads = [threading.Thread(target=writer, args=(plan,)) for plan in plans]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        submitted = time.perf_counter() - start
+        if queue is not None:
+            queue.drain()
+            queue.stop()
+    applied = time.perf_counter() - start
+    s3.latency = 0
+    s3.ignore_conditions = False
+    conflicts = s3.stats['conflicts']
+
+    manifest, lost = check(store)
+    keys = {natural_key(e['winner'], e['loser'], e['date']) for e in manifest['matchups']}
+    lost['missing_adds'] = sum(1 for key in added if key not in keys)
+
+    accepted = sum(count for status, count in statuses.items() if status < 300)
+    latencies.sort()
+    return {
+        'mode': mode,
+        'writes': len(latencies),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'accepted_per_sec': round(accepted / submitted, 1),
+        'applied_seconds': round(applied, 2),
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 1),
+        'conflicts': conflicts,
+        'batches': len(queue.batches) if queue else len(latencies),
+        'mean_batch': round(statistics.mean(queue.batches), 1) if queue and queue.batches else 1,
+        'lost': lost
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--matchups', type=int, default=200)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=10, help='writes per writer')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each S3 request')
+    parser.add_argument('--modes', default='blind,direct,queued')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = [run(mode, args) for mode in args.modes.split(',')]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'{args.writers} writers x {args.writes} writes, {args.matchups} matchups, '
+          f'{args.latency * 1000:.0f} ms per S3 request')
+    print(f'{"mode":>8} {"accepted/s":>10} {"p50 ms":>8} {"p95 ms":>8} {"conflicts":>9} {"batches":>8} '
+          f'{"mean":>6} {"applied s":>9}  lost')
+    for r in results:
+        lost = ', '.join(f'{name} {count}' for name, count in r['lost'].items() if count) or 'none'
+        print(f'{r["mode"]:>8} {r["accepted_per_sec"]:>10} {r["p50_ms"]:>8} {r["p95_ms"]:>8} '
+              f'{r["conflicts"]:>9} {r["batches"]:>8} {r["mean_batch"]:>6} {r["applied_seconds"]:>9}  {lost}  {r["statuses"]}')
+
+
+if __name__ == '__main__':
+    main()
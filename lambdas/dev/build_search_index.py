@@ -0,0 +1,28 @@
+##############
+### Build (or rebuild from scratch) the full-text search index
+###
+### Usage (from lambdas/): python dev/build_search_index.py <private-bucket-name>
+###
+### Indexes every matchup's rationales and discussion and every comment, writes one
+### posting object per term under search/ and deletes term objects no longer used. The
+### first write to a bucket without an index builds it the same way; run this to turn
+### search on before then, or again after changing the tokenizer or stop words.
+
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import search
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python dev/build_search_index.py <private-bucket-name>')
+        sys.exit(1)
+
+    store = MatchupStore(boto3.client('s3'), sys.argv[1])
+    documents, terms = search.rebuild(store)
+    print(f'Indexed {documents} matchups ({terms} terms) for search')
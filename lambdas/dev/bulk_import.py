@@ -0,0 +1,36 @@
+##############
+### Bulk add/edit matchups from a JSONL or CSV file, same code path as POST /matchups/bulk
+###
+### Usage (from lambdas/): python dev/bulk_import.py <private-bucket-name> <file.jsonl|file.csv>
+###                        [--dry-run] [--partial]
+###
+### The format comes from the file extension. Without --partial a batch with any invalid
+### row writes nothing; per-row results are printed as JSON either way.
+
+import os
+import sys
+import json
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import bulk
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 2:
+        print('Usage: python dev/bulk_import.py <private-bucket-name> <file.jsonl|file.csv> [--dry-run] [--partial]')
+        sys.exit(1)
+
+    bucket_name, path = args
+    fmt = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    with open(path, encoding='utf-8') as f:
+        rows = bulk.parse_batch(f.read(), fmt)
+
+    store = MatchupStore(boto3.client('s3'), bucket_name)
+    summary = bulk.apply_batch(store, rows, partial='--partial' in sys.argv, dry_run='--dry-run' in sys.argv)
+    print(json.dumps(summary, indent=2))
+
+    sys.exit(0 if summary['errors'] == 0 else 1)
@@ -0,0 +1,167 @@
+##############
+### Offline check of the local access token verification used by UserAuth
+###
+### Usage (from lambdas/): python dev/check_token_verification.py
+###
+### Generates throwaway RSA keypairs and JWKS files, signs tokens with them, and runs them
+### through stormcommon.tokens: valid, expired, wrong issuer and bad signature tokens,
+### unknown keys, and JWKS refreshes (key rotation, the refresh interval, an unreachable
+### JWKS). Exits non-zero if any check fails. No network access and no AWS credentials
+### needed.
+
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import secrets
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon import tokens
+
+USER_POOL_ID = 'us-east-1_LocalTest'
+ISSUER = tokens.cognito_issuer(USER_POOL_ID)
+
+
+def is_probable_prime(n, rounds=40):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29):
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def random_prime(bits):
+    while True:
+        candidate = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+        if is_probable_prime(candidate):
+            return candidate
+
+
+def generate_keypair(bits=2048, e=65537):
+    while True:
+        p, q = random_prime(bits // 2), random_prime(bits // 2)
+        phi = (p - 1) * (q - 1)
+        if p != q and phi % e != 0:
+            return p * q, e, pow(e, -1, phi)
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64url_uint(value):
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def sign(claims, kid, n, d, alg='RS256'):
+    header = b64url(json.dumps({'alg': alg, 'kid': kid}).encode('utf-8'))
+    payload = b64url(json.dumps(claims).encode('utf-8'))
+    signing_input = f'{header}.{payload}'.encode('ascii')
+
+    k = (n.bit_length() + 7) // 8
+    digest_info = tokens.SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    em = b'\x00\x01' + b'\xff' * (k - len(digest_info) - 3) + b'\x00' + digest_info
+    signature = pow(int.from_bytes(em, 'big'), d, n).to_bytes(k, 'big')
+    return f'{header}.{payload}.{b64url(signature)}'
+
+
+def expect(label, func, outcome):
+    try:
+        func()
+        result = 'valid'
+    except tokens.TokenInvalid:
+        result = 'invalid'
+    except tokens.TokenUndecidable:
+        result = 'undecidable'
+    status = 'ok' if result == outcome else 'FAIL'
+    print(f'{status:4} {label}: {result}')
+    return result == outcome
+
+
+def write_jwks(path, keys):
+    """
+    keys is {kid: n}, all with the same public exponent
+    """
+    with open(path, 'w') as f:
+        json.dump({'keys': [{'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': kid,
+                             'n': b64url_uint(n), 'e': b64url_uint(65537)} for kid, n in keys.items()]}, f)
+
+
+def expect_fetches(label, jwks, fetches):
+    status = 'ok' if jwks.fetches == fetches else 'FAIL'
+    print(f'{status:4} {label}: {jwks.fetches} JWKS fetches')
+    return jwks.fetches == fetches
+
+
+if __name__ == '__main__':
+    n, e, d = generate_keypair()
+    other_n, _, other_d = generate_keypair()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jwks_file = os.path.join(tmp, 'jwks.json')
+        write_jwks(jwks_file, {'local-key': n})
+
+        jwks = tokens.JWKSCache(jwks_file=jwks_file)
+        claims = {'iss': ISSUER, 'token_use': 'access', 'exp': int(time.time()) + 600,
+                  'cognito:groups': ['admin'], 'username': 'local-user'}
+
+        def check(token, cache=jwks):
+            return lambda: tokens.verify_access_token(token, cache, ISSUER)
+
+        results = [
+            expect('valid token', check(sign(claims, 'local-key', n, d)), 'valid'),
+            expect('expired token', check(sign({**claims, 'exp': int(time.time()) - 1}, 'local-key', n, d)), 'invalid'),
+            expect('wrong issuer', check(sign({**claims, 'iss': 'https://example.com'}, 'local-key', n, d)), 'invalid'),
+            expect('id token', check(sign({**claims, 'token_use': 'id'}, 'local-key', n, d)), 'invalid'),
+            expect('signed by another key', check(sign(claims, 'local-key', other_n, other_d)), 'invalid'),
+            expect('tampered payload', check(sign(claims, 'local-key', n, d).replace('.', '.e', 1)), 'invalid'),
+            expect('unknown kid', check(sign(claims, 'rotated-key', n, d)), 'undecidable'),
+            expect('unsupported alg', check(sign(claims, 'local-key', n, d, alg='HS256')), 'undecidable'),
+            # Unknown kids refetch at most every min_refetch_seconds
+            expect_fetches('unknown kid within min_refetch_seconds', jwks, 1),
+        ]
+
+        # Key rotation: the pool starts signing with a key the cache has not seen
+        rotating = tokens.JWKSCache(jwks_file=jwks_file, min_refetch_seconds=0)
+        rotating.get_key('local-key')
+        write_jwks(jwks_file, {'local-key': n, 'rotated-key': other_n})
+        results += [
+            expect('rotated key', check(sign(claims, 'rotated-key', other_n, other_d), rotating), 'valid'),
+            expect_fetches('rotated key refetched once', rotating, 2),
+            expect('known key after rotation', check(sign(claims, 'local-key', n, d), rotating), 'valid'),
+            expect_fetches('known key not refetched', rotating, 2),
+        ]
+
+        # Interval refresh, and an unreachable JWKS keeps the keys already loaded
+        refreshing = tokens.JWKSCache(jwks_file=jwks_file, refresh_seconds=0)
+        results += [
+            expect('valid token', check(sign(claims, 'local-key', n, d), refreshing), 'valid'),
+            expect('valid token after refresh_seconds', check(sign(claims, 'local-key', n, d), refreshing), 'valid'),
+            expect_fetches('refreshed after refresh_seconds', refreshing, 2),
+        ]
+        os.remove(jwks_file)
+        results += [
+            expect('JWKS unavailable, key cached', check(sign(claims, 'local-key', n, d), refreshing), 'valid'),
+            expect('JWKS unavailable, key unknown', check(sign(claims, 'new-key', n, d), refreshing), 'undecidable'),
+        ]
+
+    sys.exit(0 if all(results) else 1)
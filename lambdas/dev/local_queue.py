@@ -0,0 +1,94 @@
+##############
+### In-process stand-in for the SQS FIFO write queue and its ApplyWrites consumer
+###
+### send_message() queues a message like SQS (deduplicated on MessageDeduplicationId),
+### and one consumer thread drains it like the event source mapping on a FIFO queue with
+### a single message group: it takes up to batch_size messages, calls the consumer
+### handler with an SQS-shaped event, and only then takes the next batch. A batch whose
+### handler raises is put back at the front and retried, up to max_receives times.
+### Install it with install(), which points stormcommon.runtime's sqs client and
+### writes.QUEUE_URL at it.
+
+import threading
+import traceback
+from collections import deque
+
+QUEUE_URL = 'local://write-queue'
+
+
+class LocalQueue:
+    def __init__(self, handler, batch_size=10, max_receives=3):
+        """
+        handler is the consumer's lambda_handler(event, context)
+        """
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_receives = max_receives
+        self.messages = deque()
+        self.seen = set()
+        self.batches = []
+        self.failed = 0
+        self._ready = threading.Condition()
+        self._stopped = False
+        self._busy = False
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def send_message(self, QueueUrl, MessageBody, MessageGroupId=None, MessageDeduplicationId=None, **kwargs):
+        with self._ready:
+            if MessageDeduplicationId not in self.seen:
+                self.seen.add(MessageDeduplicationId)
+                self.messages.append({'messageId': MessageDeduplicationId, 'body': MessageBody,
+                                      'receives': 0})
+                self._ready.notify_all()
+        return {'MessageId': MessageDeduplicationId}
+
+    def _consume(self):
+        while True:
+            with self._ready:
+                while not self.messages and not self._stopped:
+                    self._ready.wait()
+                if self._stopped:
+                    return
+                batch = [self.messages.popleft() for _ in range(min(self.batch_size, len(self.messages)))]
+                self._busy = True
+
+            for message in batch:
+                message['receives'] += 1
+            try:
+                self.handler({'Records': [{'messageId': m['messageId'], 'body': m['body']} for m in batch]},
+                             None)
+                self.batches.append(len(batch))
+            except Exception:
+                traceback.print_exc()
+                retry = [m for m in batch if m['receives'] < self.max_receives]
+                self.failed += len(batch) - len(retry)
+                with self._ready:
+                    self.messages.extendleft(reversed(retry))
+
+            with self._ready:
+                self._busy = False
+                self._ready.notify_all()
+
+    def drain(self):
+        """
+        Block until every queued message has been handled
+        """
+        with self._ready:
+            while self.messages or self._busy:
+                self._ready.wait()
+
+    def stop(self):
+        with self._ready:
+            self._stopped = True
+            self._ready.notify_all()
+        self._thread.join()
+
+
+def install(queue):
+    """
+    Make the writers submit to queue instead of applying writes inline
+    """
+    from stormcommon import runtime, writes
+    runtime._clients['sqs'] = queue
+    writes.QUEUE_URL = QUEUE_URL
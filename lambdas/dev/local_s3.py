@@ -0,0 +1,337 @@
+##############
+### Filesystem-backed stand-in for the S3 client calls the lambdas make
+###
+### Implements get_object (with IfNoneMatch), put_object (with IfMatch/IfNoneMatch),
+### multipart uploads (completed with IfMatch/IfNoneMatch), copy_object (with
+### CopySourceIfMatch), list_objects_v2 and delete_object on top of a local directory,
+### raising the same ClientError codes as S3, and counts requests, bytes moved in each
+### direction and rejected conditional puts. Bodies of STREAM_SIZE or more are returned as
+### open files, read as the caller consumes them like an S3 StreamingBody, and replaced
+### rather than overwritten by writes, so a body being read keeps the object as it was
+### when fetched. ignore_conditions=True accepts every put, as writers
+### without preconditions would. Install it into a lambda
+### with install(), which seeds stormcommon.runtime's client cache so the handler's
+### module-level runtime.s3_client() picks it up instead of creating a boto3 client.
+### latency adds a fixed delay to every request, to stand in for S3 round trips when
+### writers run concurrently.
+
+import os
+import io
+import uuid
+import shutil
+import hashlib
+import tempfile
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+
+# S3 rejects a multipart upload with a part other than the last below this size
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Objects at least this large are read lazily (smaller ones are read whole, as before)
+STREAM_SIZE = 1024 * 1024
+
+
+def _error(code, message, operation, status=None):
+    response = {'Error': {'Code': code, 'Message': message}}
+    if status:
+        response['ResponseMetadata'] = {'HTTPStatusCode': status}
+    return ClientError(response, operation)
+
+
+class LocalS3:
+    def __init__(self, root=None, latency=0.0):
+        """
+        Objects live under root/<bucket>/<key>, a temporary directory if root is None.
+        latency is seconds added to each request.
+        """
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.TemporaryDirectory()
+            root = self._tmp.name
+        self.root = root
+        self.latency = latency
+        self.ignore_conditions = False
+        self.meta = {}
+        self.uploads = {}
+        # MatchupStore fetches records from a thread pool. _objects makes each object
+        # read or write whole, as on S3, when writers run concurrently.
+        self._lock = threading.Lock()
+        self._objects = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'requests': {}, 'bytes_in': 0, 'bytes_out': 0, 'conflicts': 0}
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _count(self, operation, bytes_in=0, bytes_out=0, conflict=False):
+        with self._lock:
+            self.stats['requests'][operation] = self.stats['requests'].get(operation, 0) + 1
+            self.stats['conflicts'] += conflict
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def create_bucket(self, Bucket, **kwargs):
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+
+    def _current_etag(self, bucket, key, path):
+        """
+        ETag of the stored object, None if there is none (call holding _objects)
+        """
+        if not os.path.isfile(path):
+            return None
+        meta = self.meta.get((bucket, key))
+        if meta is not None:
+            return meta['ETag']
+        return '"' + _md5(path).hexdigest() + '"'
+
+    def _check_conditions(self, bucket, key, path, operation, IfMatch=None, IfNoneMatch=None):
+        """
+        Raise as S3 does if a put's precondition does not hold (call holding _objects)
+        """
+        if not (IfMatch or IfNoneMatch) or self.ignore_conditions:
+            return
+        current = self._current_etag(bucket, key, path)
+        if IfMatch and current is None:
+            self._count(operation, conflict=True)
+            raise _error('NoSuchKey', 'The specified key does not exist.', operation, 404)
+        if (IfMatch and IfMatch != current) or (IfNoneMatch == '*' and current is not None):
+            self._count(operation, conflict=True)
+            raise _error('PreconditionFailed', 'At least one of the pre-conditions you specified '
+                         'did not hold', operation, 412)
+
+    @contextmanager
+    def _replacing(self, path):
+        """
+        File to write an object's new bytes to. An object a reader may be streaming is
+        written aside and moved over path on success, others are overwritten in place.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.isfile(path) or os.path.getsize(path) < STREAM_SIZE:
+            with open(path, 'wb') as f:
+                yield f
+            return
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                yield f
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _set_meta(self, bucket, key, etag, ContentType=None, ContentEncoding=None, CacheControl=None):
+        self.meta[(bucket, key)] = {
+            'ETag': etag,
+            'LastModified': datetime.now(timezone.utc),
+            'ContentType': ContentType or 'binary/octet-stream',
+            'ContentEncoding': ContentEncoding,
+            'CacheControl': CacheControl
+        }
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, ContentEncoding=None, CacheControl=None,
+                   IfMatch=None, IfNoneMatch=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        self._delay()
+        path = self._path(Bucket, Key)
+        etag = '"' + hashlib.md5(Body).hexdigest() + '"'
+        with self._objects:
+            self._check_conditions(Bucket, Key, path, 'PutObject', IfMatch, IfNoneMatch)
+            with self._replacing(path) as f:
+                f.write(Body)
+            self._set_meta(Bucket, Key, etag, ContentType, ContentEncoding, CacheControl)
+        self._count('PutObject', bytes_in=len(Body))
+        return {'ETag': etag}
+
+    def _upload_dir(self, upload_id):
+        return os.path.join(self.root, '.uploads', upload_id)
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, ContentEncoding=None, CacheControl=None,
+                                **kwargs):
+        self._delay()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        with self._lock:
+            self.uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'ContentType': ContentType,
+                                       'ContentEncoding': ContentEncoding, 'CacheControl': CacheControl}
+        self._count('CreateMultipartUpload')
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, Bucket, Key, UploadId, operation):
+        upload = self.uploads.get(UploadId)
+        if upload is None or (upload['Bucket'], upload['Key']) != (Bucket, Key):
+            self._count(operation)
+            raise _error('NoSuchUpload', 'The specified upload does not exist.', operation, 404)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._delay()
+        self._upload(Bucket, Key, UploadId, 'UploadPart')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with open(os.path.join(self._upload_dir(UploadId), str(PartNumber)), 'wb') as f:
+            f.write(Body)
+        self._count('UploadPart', bytes_in=len(Body))
+        return {'ETag': '"' + hashlib.md5(Body).hexdigest() + '"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, IfMatch=None, IfNoneMatch=None,
+                                  **kwargs):
+        self._delay()
+        upload = self._upload(Bucket, Key, UploadId, 'CompleteMultipartUpload')
+        parts = MultipartUpload['Parts']
+        paths = [os.path.join(self._upload_dir(UploadId), str(part['PartNumber'])) for part in parts]
+        for path in paths[:-1]:
+            if os.path.getsize(path) < MIN_PART_SIZE:
+                self._count('CompleteMultipartUpload')
+                raise _error('EntityTooSmall', 'Your proposed upload is smaller than the minimum allowed '
+                             'object size.', 'CompleteMultipartUpload', 400)
+
+        # As S3 does: the MD5 of the parts' MD5s, and the number of parts
+        digests = b''.join(bytes.fromhex(part['ETag'].strip('"')) for part in parts)
+        etag = f'"{hashlib.md5(digests).hexdigest()}-{len(parts)}"'
+        path = self._path(Bucket, Key)
+        with self._objects:
+            self._check_conditions(Bucket, Key, path, 'CompleteMultipartUpload', IfMatch, IfNoneMatch)
+            with self._replacing(path) as f:
+                for part_path in paths:
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, f)
+            self._set_meta(Bucket, Key, etag, upload['ContentType'], upload['ContentEncoding'],
+                           upload['CacheControl'])
+        self._discard_upload(UploadId)
+        self._count('CompleteMultipartUpload')
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._delay()
+        self._upload(Bucket, Key, UploadId, 'AbortMultipartUpload')
+        self._discard_upload(UploadId)
+        self._count('AbortMultipartUpload')
+        return {}
+
+    def _discard_upload(self, upload_id):
+        with self._lock:
+            self.uploads.pop(upload_id, None)
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+    def copy_object(self, Bucket, Key, CopySource, CopySourceIfMatch=None, MetadataDirective='COPY',
+                    ContentType=None, ContentEncoding=None, CacheControl=None, **kwargs):
+        self._delay()
+        source_bucket, source_key = CopySource['Bucket'], CopySource['Key']
+        source = self._path(source_bucket, source_key)
+        path = self._path(Bucket, Key)
+        with self._objects:
+            etag = self._current_etag(source_bucket, source_key, source)
+            if etag is None:
+                self._count('CopyObject')
+                raise _error('NoSuchKey', 'The specified key does not exist.', 'CopyObject', 404)
+            if CopySourceIfMatch and CopySourceIfMatch != etag and not self.ignore_conditions:
+                self._count('CopyObject', conflict=True)
+                raise _error('PreconditionFailed', 'At least one of the pre-conditions you specified '
+                             'did not hold', 'CopyObject', 412)
+            meta = dict(self.meta.get((source_bucket, source_key)) or {})
+            with self._replacing(path) as f, open(source, 'rb') as original:
+                shutil.copyfileobj(original, f)
+            if MetadataDirective == 'REPLACE':
+                meta.update({'ContentType': ContentType, 'ContentEncoding': ContentEncoding,
+                             'CacheControl': CacheControl})
+            # A copy written in one piece has the MD5 of its bytes as its ETag
+            etag = '"' + _md5(path).hexdigest() + '"'
+            self._set_meta(Bucket, Key, etag, meta.get('ContentType'), meta.get('ContentEncoding'),
+                           meta.get('CacheControl'))
+        self._count('CopyObject')
+        return {'CopyObjectResult': {'ETag': etag, 'LastModified': self.meta[(Bucket, Key)]['LastModified']}}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self._delay()
+        path = self._path(Bucket, Key)
+        with self._objects:
+            if not os.path.isfile(path):
+                body = meta = None
+            else:
+                body = open(path, 'rb')
+                if os.fstat(body.fileno()).st_size < STREAM_SIZE:
+                    with body:
+                        body = io.BytesIO(body.read())
+                meta = self.meta.get((Bucket, Key))
+                if meta is None:
+                    # Written by another process or an earlier run
+                    meta = {'ETag': '"' + _md5(path).hexdigest() + '"',
+                            'LastModified': datetime.fromtimestamp(os.path.getmtime(path), timezone.utc),
+                            'ContentType': 'binary/octet-stream', 'ContentEncoding': None}
+                    self.meta[(Bucket, Key)] = meta
+
+        if body is None:
+            self._count('GetObject')
+            raise _error('NoSuchKey', 'The specified key does not exist.', 'GetObject', 404)
+
+        if IfNoneMatch and IfNoneMatch.strip() in ('*', meta['ETag']):
+            body.close()
+            self._count('GetObject')
+            raise _error('304', 'Not Modified', 'GetObject', 304)
+
+        size = body.getbuffer().nbytes if isinstance(body, io.BytesIO) else os.fstat(body.fileno()).st_size
+        self._count('GetObject', bytes_out=size)
+
+        response = {'Body': body, 'ETag': meta['ETag'], 'LastModified': meta['LastModified'],
+                    'ContentLength': size, 'ContentType': meta['ContentType']}
+        if meta['ContentEncoding']:
+            response['ContentEncoding'] = meta['ContentEncoding']
+        if meta.get('CacheControl'):
+            response['CacheControl'] = meta['CacheControl']
+        return response
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._delay()
+        path = self._path(Bucket, Key)
+        with self._objects:
+            if os.path.isfile(path):
+                os.remove(path)
+            self.meta.pop((Bucket, Key), None)
+        self._count('DeleteObject')
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter=None, MaxKeys=1000, **kwargs):
+        self._delay()
+        bucket_root = os.path.join(self.root, Bucket)
+
+        # Only walk the directory the prefix points into
+        prefix_dir = os.path.join(bucket_root, *Prefix.split('/')[:-1])
+        keys = []
+        for directory, _, files in os.walk(prefix_dir):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix) and (StartAfter is None or key > StartAfter):
+                    keys.append(key)
+        keys.sort()
+
+        page = keys[:MaxKeys]
+        self._count('ListObjectsV2', bytes_out=sum(len(key) for key in page))
+        return {'Contents': [{'Key': key} for key in page], 'KeyCount': len(page),
+                'IsTruncated': len(keys) > MaxKeys}
+
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest
+
+
+def install(s3):
+    """
+    Make stormcommon.runtime hand out s3 as the S3 client
+    """
+    from stormcommon import runtime
+    runtime._clients['s3'] = s3
@@ -0,0 +1,140 @@
+##############
+### Measure import time and cold-start time of every lambda
+###
+### Usage (from lambdas/): python dev/measure_cold_start.py [--rev <git-rev>] [--runs N] [--json]
+###
+### Each run starts a fresh interpreter, imports lambda_function.py (with SUB_ placeholders
+### filled in) and makes the first handler call. AWS calls never leave the process: a
+### botocore before-send hook answers S3 GETs with NoSuchKey, S3 PUTs with an ETag and
+### Lambda invokes with a deny, so the timings cover imports, client creation, request
+### signing and response parsing but no network. --rev measures the lambdas as of a git
+### revision, for before/after comparisons. Absolute numbers are from this machine, not
+### from a 128 MB Lambda (which gets a fraction of a vCPU), so compare them relatively.
+
+import os
+import sys
+import json
+import tarfile
+import tempfile
+import statistics
+import subprocess
+
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MATCHUP = {
+    'sport': 'football', 'winner': 'A', 'loser': 'B', 'date': '2025-01-01',
+    'upset_score': 1.0, 'impact_score': 1.0, 'excitement_score': 1.0,
+    'upset_rationale': 'u', 'impact_rationale': 'i', 'excitement_rationale': 'e',
+    'overall_discussion': 'o'
+}
+
+EVENTS = {
+    'GetMatchups': {'queryStringParameters': None, 'headers': {}},
+    'AddMatchup': {'body': json.dumps(MATCHUP), 'headers': {}},
+    'EditMatchup': {'body': json.dumps({'winner': 'A', 'loser': 'B', 'date': '2025-01-01'}), 'headers': {}},
+    'AddComment': {'body': json.dumps({'matchup_id': 'missing', 'comment_text': 'hi'}), 'headers': {}},
+    'GetComments': {'queryStringParameters': {'matchup_id': 'missing'}, 'headers': {}},
+    'BulkMatchups': {'body': json.dumps(MATCHUP), 'headers': {}},
+    'GetStats': {'queryStringParameters': None, 'headers': {}},
+    'Search': {'queryStringParameters': {'q': 'upset'}, 'headers': {}},
+    'ApplyWrites': {'Records': []},
+    'UserAuth': {'headers': {'authorization': 'header.payload.signature'}, 'rawPath': '/comment',
+                 'queryStringParameters': {}, 'requestContext': {'http': {'method': 'POST'}}},
+}
+
+RUNNER = r'''
+import io, os, re, sys, json, time, resource, contextlib
+root, name, event = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+if os.path.isdir(os.path.join(root, 'common')):
+    sys.path.insert(0, os.path.join(root, 'common'))
+
+start = time.perf_counter()
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+class Raw(io.BytesIO):
+    def stream(self, **kwargs):
+        yield self.getvalue()
+
+def fake_send(request, **kwargs):
+    operation = kwargs.get('event_name', '').split('.')[-1]
+    if operation == 'Invoke':
+        return AWSResponse(request.url, 200, {}, Raw(b'{"isAuthorized": false}'))
+    if request.method in ('PUT', 'POST'):
+        return AWSResponse(request.url, 200, {'ETag': '"0"'}, Raw(b''))
+    error = b'<Error><Code>NoSuchKey</Code><Message>missing</Message></Error>'
+    return AWSResponse(request.url, 404, {'Content-Type': 'application/xml'}, Raw(error))
+
+boto3.setup_default_session(region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='x')
+boto3.DEFAULT_SESSION.events.register('before-send', fake_send)
+
+path = os.path.join(root, name, 'lambda_function.py')
+source = re.sub(r'SUB_([A-Za-z0-9_]+)',
+                lambda m: '"none"' if m.group(1) == 'UserPoolId' else json.dumps(m.group(1).lower()),
+                open(path).read())
+module = {'__name__': 'lambda_function', '__file__': path}
+with contextlib.redirect_stdout(io.StringIO()):
+    exec(compile(source, path, 'exec'), module)
+imported = time.perf_counter()
+
+with contextlib.redirect_stdout(io.StringIO()):
+    module['lambda_handler'](event, None)
+called = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_call_ms': (called - imported) * 1000,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+'''
+
+
+def extract_revision(rev, dest):
+    """
+    Copy lambdas/ as of a git revision into dest, returns the extracted lambdas dir
+    """
+    archive = subprocess.run(['git', 'archive', rev, 'lambdas'], cwd=os.path.join(LAMBDAS_DIR, '..'),
+                             check=True, capture_output=True).stdout
+    archive_path = os.path.join(dest, 'lambdas.tar')
+    with open(archive_path, 'wb') as f:
+        f.write(archive)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(dest)
+    return os.path.join(dest, 'lambdas')
+
+
+def measure(root, name, runs):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', RUNNER, root, name, json.dumps(EVENTS[name])],
+                                check=True, capture_output=True, text=True,
+                                env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    return {
+        field: round(statistics.median(sample[field] for sample in samples), 1)
+        for field in ('import_ms', 'first_call_ms', 'max_rss_mb')
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    rev = args[args.index('--rev') + 1] if '--rev' in args else None
+    runs = int(args[args.index('--runs') + 1]) if '--runs' in args else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = extract_revision(rev, tmp) if rev else os.path.abspath(LAMBDAS_DIR)
+        results = {name: measure(root, name, runs) for name in EVENTS}
+
+    for result in results.values():
+        result['cold_start_ms'] = round(result['import_ms'] + result['first_call_ms'], 1)
+
+    if '--json' in args:
+        print(json.dumps({'rev': rev or 'working tree', 'runs': runs, 'results': results}, indent=2))
+    else:
+        print(f"{rev or 'working tree'} (median of {runs} runs)")
+        print(f"{'lambda':<12} {'import ms':>10} {'first call ms':>14} {'cold start ms':>14} {'max rss MB':>11}")
+        for name, result in results.items():
+            print(f"{name:<12} {result['import_ms']:>10} {result['first_call_ms']:>14} "
+                  f"{result['cold_start_ms']:>14} {result['max_rss_mb']:>11}")
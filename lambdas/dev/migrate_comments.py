@@ -0,0 +1,30 @@
+##############
+### One-shot move of comments nested in matchup objects into per-matchup comment streams
+###
+### Usage (from lambdas/): python dev/migrate_comments.py <private-bucket-name>
+###
+### For buckets already on the per-matchup layout (migrate_matchups.py does this step
+### itself). Safe to re-run: comment keys are derived from created_at and id, and matchups
+### that already carry comment_count without nested comments are left alone.
+
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import readmodel, comments
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python dev/migrate_comments.py <private-bucket-name>')
+        sys.exit(1)
+
+    store = MatchupStore(boto3.client('s3'), sys.argv[1])
+    changed = comments.migrate(store)
+    print(f'Moved comments of {len(changed)} matchups into comment streams')
+
+    readmodel.rebuild(store)
+    print('Published read model views')
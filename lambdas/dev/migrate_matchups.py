@@ -0,0 +1,37 @@
+##############
+### One-shot migration from the legacy matchups.json to per-matchup objects plus manifest
+###
+### Usage (from lambdas/): python dev/migrate_matchups.py <private-bucket-name>
+###
+### Safe to re-run: objects are rewritten from matchups.json, which is left in place.
+
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import readmodel, comments, stats, search
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python dev/migrate_matchups.py <private-bucket-name>')
+        sys.exit(1)
+
+    store = MatchupStore(boto3.client('s3'), sys.argv[1])
+    count = store.migrate_legacy()
+    print(f'Migrated {count} matchups into per-matchup objects')
+
+    changed = comments.migrate(store)
+    print(f'Moved comments of {len(changed)} matchups into comment streams')
+
+    readmodel.rebuild(store)
+    print('Published read model views')
+
+    stats.rebuild(store)
+    print('Built matchup stats')
+
+    documents, terms = search.rebuild(store)
+    print(f'Indexed {documents} matchups ({terms} terms) for search')
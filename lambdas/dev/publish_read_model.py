@@ -0,0 +1,32 @@
+##############
+### Publish (or republish from scratch) the read model views
+###
+### Usage (from lambdas/): STORM_READ_PARTITION=<partition> python dev/publish_read_model.py <private-bucket-name>
+###
+### Renders every view from the matchup objects under the partitioning given (see
+### readmodel.py, default none). Run after changing the ReadPartition stack parameter,
+### before or right after deploying it: until then GetMatchups falls back to the manifest
+### for a listing whose views are missing. Views of the old partitioning are left in place.
+### With STORM_SNAPSHOT_BUCKET=<public-bucket-name> it also publishes the static snapshots
+### of the sport views the frontend loads through CloudFront (see snapshots.py).
+
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import readmodel
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: STORM_READ_PARTITION=<partition> python dev/publish_read_model.py <private-bucket-name>')
+        sys.exit(1)
+
+    store = MatchupStore(boto3.client('s3'), sys.argv[1])
+    manifest = store.get_manifest()
+    readmodel.rebuild(store, manifest)
+    print(f'Published read model for {len(manifest["matchups"])} matchups, full listing in '
+          f'{", ".join(readmodel.listing_views(manifest))} ({readmodel.PARTITION})')
@@ -0,0 +1,48 @@
+##############
+### Seal closed seasons into immutable archives, same code path as POST /matchups/seal
+###
+### Usage (from lambdas/): python dev/seal_season.py <private-bucket-name> <sport> <season>
+###                        python dev/seal_season.py <private-bucket-name> --all
+###
+### --all seals every closed season of every sport still in the manifest. Set
+### STORM_SNAPSHOT_BUCKET (the public bucket) to republish the sport snapshots too, and
+### STORM_READ_PARTITION to the deployed value.
+
+import os
+import sys
+import json
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from stormcommon.storage import MatchupStore
+from stormcommon import archive, readmodel
+
+
+def closed_seasons(manifest):
+    """
+    (sport, season) of every closed season the manifest still lists, oldest first
+    """
+    current = archive.current_season()
+    seasons = {(readmodel.sport_view(entry), readmodel.season(entry.get('date'))) for entry in manifest['matchups']}
+    return sorted((s for s in seasons if s[1].isdigit() and s[1] < current), key=lambda s: (s[1], s[0]))
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not (len(args) == 3 or (len(args) == 1 and '--all' in sys.argv)):
+        print('Usage: python dev/seal_season.py <private-bucket-name> <sport> <season> | --all')
+        sys.exit(1)
+
+    store = MatchupStore(boto3.client('s3'), args[0])
+    seasons = closed_seasons(store.get_manifest()) if len(args) == 1 else [(args[1], args[2])]
+
+    failed = 0
+    for sport, season in seasons:
+        try:
+            print(json.dumps(archive.seal_season(store, sport, season)))
+        except archive.SealError as e:
+            print(f'{sport} {season}: {e}')
+            failed += 1
+
+    sys.exit(1 if failed else 0)